@@ -13,6 +13,8 @@ import constants as const
 import driving.actions as act
 import mapping.checkMap as checks
 import mapping.planning as pln 
+import mapping.kernel as krn
+import mapping.speculation as spc
 from math import dist
 from mapping.MapGraph import unb_head
 from interface.ui_util import post, init_state, set_state, get_resp
@@ -30,9 +32,10 @@ def explore_turn(driveSys, IRSensor, ultraSense, direction, graph, location,
 
     #Update the heading from the angle turned, and ensure consistent with  map.
     orig_head = heading
-    heading = (heading + const.dirMap[direction[0]][1] * ang / 45) % 8
+    heading = pln.turned(heading, direction, ang)
     heading, ang = checks.check_head(direction, graph, location, heading, 
-                                     orig_head, ang, out, responses, resp_flag)
+                                     orig_head, ang, out, responses, resp_flag,
+                                     turns=driveSys.turns)
     post("angle: " + str(ang), out)
 
     #Update the graph based on where a street was found
@@ -46,42 +49,66 @@ def explore_turn(driveSys, IRSensor, ultraSense, direction, graph, location,
     return heading
 
 
+def turn_to(driveSys, IRSensor, ultraSense, graph, location, heading, target,
+            out, responses, resp_flag):
+    """Turns the robot from heading to face target. When the map knows every 
+    heading between, the robot turns through the streets between in one spin 
+    (see pln.turn_plan), otherwise it turns street by street with explore_turn.
+    """
+    plan = pln.turn_plan(graph.get_intersection(location), heading, target)
+    if plan != None:
+        direction, passed = plan
+        start = passed[-1] if passed != [] else heading
+        ang = abs(act.exec_turn(driveSys, IRSensor, direction, len(passed)))
+
+        #Take the heading most likely given the streets passed and the angle
+        # turned from the last of them
+        orig_head = heading
+        heading = pln.turned(start, direction, ang)
+        heading, ang = checks.check_head(direction, graph, location, heading, 
+                                         orig_head, ang, out, responses, 
+                                         resp_flag, len(passed), 
+                                         driveSys.turns)
+    while heading != target:
+        heading = explore_turn(driveSys, IRSensor, ultraSense, 
+                               krn.to_head(heading, target, graph, location),
+                               graph, location, heading, out, responses, 
+                               resp_flag)
+    return heading
+
+
 def auto_inters(driveSys, sensor, graph, heading, location, ultraSense, out, 
-                responses, resp_flag):
+                responses, resp_flag, predictor=None):
     """ A general algorithm for exploring an intersection. This can be used to
     explore an unexplored intersection, and then the calling function must 
-    determine how to reach the next unexplored intesection.
+    determine how to reach the next unexplored intesection. Unknown headings
+    are found by the turns pln.scan_plan expects to take least time, counting
+    the turn onto the street driven next, with the streets expected on them
+    predicted by the StreetPrior predictor if given.
     """
-    #Get the possible headings for turning each direction
-    l_heads = [(heading + i) % 8 for i in range(4)]
-    r_heads = [(heading - i) % 8 for i in range(4)]
-
     #If there are unkown headings, investigate them
-    directi = None
-    if const.UNK in [graph.get_intersection(location).check_connection(head) 
-                     for head in l_heads]:
-        directi = "LEFT"
-    elif const.UNK in [graph.get_intersection(location).check_connection(head) 
-                       for head in r_heads]:
-        directi = "RIGHT"
-    if directi != None:
-        orig_heading = heading
-        while heading != (orig_heading + 4) % 8:
-            heading = explore_turn(driveSys, sensor, ultraSense, directi, graph,
-                                    location, heading, out, responses, 
-                                    resp_flag)
+    inters = graph.get_intersection(location)
+    prior = None
+    if predictor != None:
+        prior = predictor.probs(graph, location)
+    plan = pln.scan_plan(inters, heading, turns=driveSys.turns, prior=prior)
+    if plan != []:
+        for directi, target in plan:
+            #Every heading is known after turning all the way around
+            for turn in range(8):
+                if inters.check_connection(target) != const.UNK:
+                    break
+                heading = explore_turn(driveSys, sensor, ultraSense, directi, 
+                                       graph, location, heading, out, 
+                                       responses, resp_flag)
         return (graph, location, heading, True)
 
     #If there are undriven streets, turn to them and drive them
-    p_head = pln.unx_dir(graph.get_intersection(location))
+    p_head = krn.unx_dir(graph.get_intersection(location))
     if p_head != None:
         if graph.get_intersection(location).check_blockage(p_head) == const.UNB:
-            while heading != p_head:
-                heading = explore_turn(driveSys, sensor, ultraSense, 
-                                       pln.to_head(heading, p_head, graph, 
-                                                   location), 
-                                                   graph, location, heading, 
-                                                   out, responses, resp_flag)
+            heading = turn_to(driveSys, sensor, ultraSense, graph, location,
+                              heading, p_head, out, responses, resp_flag)
             return (graph, location, heading, True)
     
     #Otherwise, return that no exploration was done yet
@@ -89,14 +116,25 @@ def auto_inters(driveSys, sensor, graph, heading, location, ultraSense, out,
 
         
 def auto_djik(driveSys, IRSensor, ultraSense, path, graph, location, heading, 
-              djik, prev_loc, out, responses, resp_flag, state):
+              djik, prev_loc, out, responses, resp_flag, state, allocator=None,
+              robot=None, scorer=None, spec=None, predictor=None):
     """Uses Djikstra's algorithm to intelligently explore the map by taking
-    efficient paths to unexplored locations
+    efficient paths to unexplored locations. The unexplored location is chosen 
+    by the frontier scorer (by default, the first found by find_unexplored), 
+    or when exploring with other robots, is the one the allocator assigns to 
+    this robot. A valid plan made by the SpeculativePlanner spec while driving 
+    here is used in place of planning again. Intersections are scanned 
+    expecting the streets the StreetPrior predictor (if any) predicts.
     """
     #If there is already a path stored, follow it
     if path != []:
         path_elem = path.pop(0)
-        direction = pln.to_head(heading, path_elem, graph, location)
+        plan = pln.turn_plan(graph.get_intersection(location), heading, 
+                             path_elem)
+        if plan != None:
+            heading = turn_to(driveSys, IRSensor, ultraSense, graph, location,
+                              heading, path_elem, out, responses, resp_flag)
+        direction = krn.to_head(heading, path_elem, graph, location)
         num_turns = 0
         while heading != path_elem:
             if num_turns > 2:
@@ -109,7 +147,12 @@ def auto_djik(driveSys, IRSensor, ultraSense, path, graph, location, heading,
                 set_state(state, location, heading)
                 break
             angle = abs(act.exec_turn(driveSys, IRSensor, direction))
-            heading = (heading + const.dirMap[direction[0]][1] * angle / 45) % 8
+            orig_head = heading
+            heading = pln.turned(heading, direction, angle)
+            heading, angle = checks.check_head(direction, graph, location, 
+                                               heading, orig_head, angle, out, 
+                                               responses, resp_flag, 
+                                               turns=driveSys.turns)
             num_turns += 1
         time.sleep(.02)
         return (path, graph, location, heading)
@@ -120,52 +163,100 @@ def auto_djik(driveSys, IRSensor, ultraSense, path, graph, location, heading,
                                                          graph, heading, 
                                                          location, ultraSense, 
                                                          out, responses, 
-                                                         resp_flag)
+                                                         resp_flag, predictor)
     if explored:
         return (path, graph, location, heading)
          
     #Otherwise, use Djikstra to find an efficient path to an unexplored location
-    post("Recalculating djik algorithm...", out)
-    dest = pln.find_unexplored(graph, location, [])
+    # unless one was planned while driving here
+    planned = None
+    if spec != None and allocator == None:
+        planned = spec.take(("explore", location, heading))
+    dest = None
+    if planned != None:
+        dest = planned[0]
+        path = list(planned[1])
+    else:
+        post("Recalculating djik algorithm...", out)
+        if allocator != None:
+            dest = allocator.target(robot)
+        if dest == None and scorer != None:
+            dest = scorer.choose(graph, location, heading)
+        elif dest == None:
+            dest = pln.find_unexplored(graph, location, [])
     if dest == None:
-        direc = pln.unx_dir(graph.get_intersection(location))
+        direc = krn.unx_dir(graph.get_intersection(location))
 
         if direc == None:
             direc = unb_head(graph, location)
 
-        while heading != direc:
-            heading = explore_turn(driveSys, IRSensor, ultraSense, 
-                                   pln.to_head(heading, direc, graph, location),
-                                     graph, location, heading, out, responses, 
-                                     resp_flag)
+        heading = turn_to(driveSys, IRSensor, ultraSense, graph, location, 
+                          heading, direc, out, responses, resp_flag)
         return (path, graph, location, heading)
-    djik.reset(dest)
-    path = djik.gen_path(location)
+    if planned == None:
+        djik.reset(dest)
+        path = djik.gen_path(location, heading)
     
     #If no unexplored location found to explore, drive on some unblocked heading
     if path == []:
         direc = unb_head(graph, location)
-        while heading != direc:
-            heading = explore_turn(driveSys, IRSensor, ultraSense, 
-                                   pln.to_head(heading, direc, graph, location),
-                                     graph, location, heading, out, responses, 
-                                     resp_flag)
+        heading = turn_to(driveSys, IRSensor, ultraSense, graph, location, 
+                          heading, direc, out, responses, resp_flag)
         return (path, graph, location, heading)
 
     #Drive along the path generate by the above cases
     path_elem = path.pop(0)
-    direction = pln.to_head(heading, path_elem, graph, location)
-    while heading != path_elem:
-        angle = abs(act.exec_turn(driveSys, IRSensor, direction))
-        heading = (heading + const.dirMap[direction[0]][1] * angle / 45) % 8
+    heading = turn_to(driveSys, IRSensor, ultraSense, graph, location, heading,
+                      path_elem, out, responses, resp_flag)
     time.sleep(.02)
     return (path, graph, location, heading)
 
 
+def goal_path(djik, target, location, heading, spec=None):
+    """Plans the fastest path from location to target, taking the plan made 
+    by the SpeculativePlanner spec while driving to location if it is valid
+    """
+    if spec != None:
+        path = spec.take(("goal", target, location, heading))
+        if path != None:
+            return list(path)
+    djik.reset(target)
+    return djik.gen_path(location, heading)
+
+
+def speculate(spec, flags, graph, location, heading, path, subtarget, 
+              scorer=None, allocator=None, times=None, turns=None):
+    """Starts the SpeculativePlanner spec making the plan needed on arriving 
+    at the end of the street about to be driven from location on heading, 
+    following path. That is the path to the goal (or the subtarget on the way 
+    to it) when driving to a goal, or when exploring, the path to the next 
+    unexplored intersection if the path ends at an explored intersection.
+    """
+    if spec == None or graph == None:
+        return
+    stop, rest = spc.arrival(graph, location, heading, path)
+    if flags[const.GL_FLAG] and flags[const.DATA] != None:
+        cmd = flags[const.DATA]
+        dest = (int(cmd.split(",")[0]), int(cmd.split(",")[1]))
+        target = dest if graph.contains(dest) else subtarget
+        if target != None and target != stop:
+            spec.speculate(("goal", target, stop, heading), spc.plan_goal, 
+                           graph, stop, heading, target, times, turns)
+    elif flags[const.EXP_FLAG] and rest == [] and allocator == None:
+        inters = graph.get_intersection(stop)
+        if inters != None and inters.is_explored():
+            spec.speculate(("explore", stop, heading), spc.plan_explore, graph, 
+                           stop, heading, scorer, times, turns)
+
+
 def manual_djik(driveSys, IRSensor, ultraSense, path, heading, graph, location, djik, 
-                flags, out, responses, resp_flag, subtarget):
+                flags, out, responses, resp_flag, subtarget, spec=None,
+                predictor=None):
     """Use Djikstra's algorithm to find the shortest path to a specified
-    location in a predetermined map and then follows the path
+    location in a predetermined map and then follows the path. Valid plans 
+    made by the SpeculativePlanner spec while driving here are used in place 
+    of planning again. Off the map, the StreetPrior predictor (if any) weighs
+    the way toward the destination by the streets expected there.
     """
     done = False   
     # Get new destination
@@ -187,15 +278,14 @@ def manual_djik(driveSys, IRSensor, ultraSense, path, heading, graph, location,
 
     # If a path is found to destination, follow it
     if graph.contains(dest):
-        djik.reset(dest)
-        path = djik.gen_path(location)
+        path = goal_path(djik, dest, location, heading, spec)
         subtarget = dest
         if path == []:
             unexplored_inters = graph.unexp_inters()
             stuck = True
             for inter in unexplored_inters:
                 djik.reset(inter)
-                path = djik.gen_path(location)
+                path = djik.gen_path(location, heading)
                 if path != []:
                     stuck = False
                     break
@@ -209,12 +299,13 @@ def manual_djik(driveSys, IRSensor, ultraSense, path, heading, graph, location,
 
     # Otherwise find nearest known intersection to target and drive there
     elif subtarget == None:
-        subtarget = pln.closest_subtarget(graph, location, heading, dest, djik)
+        subtarget = pln.closest_subtarget(graph, location, heading, dest, djik,
+                                          predictor)
         print("RECALCULATING SUBTARGET to " + str(subtarget))
         # If still no subtarget is found the explore current intersection
         if subtarget == None:
             direction = pln.l_r_s_to_target(graph.get_intersection(location),
-                                            heading, dest)
+                                            heading, dest, graph, predictor)
             print("LRS: " + direction)
             if direction != "STRAIGHT":
                 heading = explore_turn(driveSys, IRSensor, ultraSense, direction,
@@ -224,21 +315,20 @@ def manual_djik(driveSys, IRSensor, ultraSense, path, heading, graph, location,
             return (path, heading, graph, location, done, subtarget)
         # Otherwise calcuate path to subtarget with djikstra
         djik.reset(subtarget)
-        path = djik.gen_path(location)  
+        path = djik.gen_path(location, heading)  
     post("Going to subtarget " + str(subtarget), out) 
     print("SUBTARGET: " + str(subtarget) + "; Currently at " + str(location))
 
     # If robot does know have path to destination then try to find one
     if not graph.contains(dest):
         # Recalculate every iteration to account for blockages
-        djik.reset(subtarget)
-        path = djik.gen_path(location)
+        path = goal_path(djik, subtarget, location, heading, spec)
 
     # If robot reaches subtarget, turn to optimal heading for destination
     if location == subtarget:
         post("Subtarget reached at " + str(subtarget), out)
         direction = pln.l_r_s_to_target(graph.get_intersection(location),
-                                        heading, dest)
+                                        heading, dest, graph, predictor)
         print("LRS to Target: " + direction)
         if direction != "STRAIGHT":
             heading = explore_turn(driveSys, IRSensor, ultraSense, direction,
@@ -249,15 +339,16 @@ def manual_djik(driveSys, IRSensor, ultraSense, path, heading, graph, location,
 
     # If path cannot be found to subtarget, reroute
     if path == []:
-        subtarget = pln.closest_subtarget(graph, location, heading, dest, djik)
+        subtarget = pln.closest_subtarget(graph, location, heading, dest, djik,
+                                          predictor)
         djik.reset(subtarget)
-        path = djik.gen_path(location)
+        path = djik.gen_path(location, heading)
         # If path still cannot be found then we need to clear blockages
         if path == []:
             post("Stuck! Clearing Blockages", out)
             graph.clear_blockages()
             djik.reset(subtarget)
-            path = djik.gen_path(location)
+            path = djik.gen_path(location, heading)
             # If path still cannot be found then we are stuck
             if path == []:
                 post("Norman is stuck! No route to " + str(dest) + " can be found", out)
@@ -268,10 +359,7 @@ def manual_djik(driveSys, IRSensor, ultraSense, path, heading, graph, location,
     # Follow djikstra generated path
     post("Driving to (" + str(dest[0]) + ", " + str(dest[1]) + ")...", out)
     path_elem = path.pop(0)
-    direction = pln.to_head(heading, path_elem, graph, location)
-    while heading != path_elem:
-        heading = explore_turn(driveSys, IRSensor, ultraSense, direction,
-                                graph, location, heading, out, responses,
-                                resp_flag)
+    heading = turn_to(driveSys, IRSensor, ultraSense, graph, location, heading,
+                      path_elem, out, responses, resp_flag)
     time.sleep(.02)
     return (path, heading, graph, location, done, subtarget)
\ No newline at end of file
@@ -12,39 +12,65 @@ Date: 4/24/23
 """
 
 # Imports
+import os
 import time
 import pigpio
-from mapping.MapGraph import complete
+from mapping.journal import MapJournal, recover
+from mapping.mapserver import MapClient
+from mapping.allocation import FrontierAllocator
+from mapping.frontier import InfoGain
+from mapping.streetprior import StreetPrior, load_corpus
+from mapping.timings import StreetTimes, times_path
+from mapping.speculation import SpeculativePlanner
 from mapping.graphics import Visualizer
 import sys
 import constants as const
 import driving.actions as act
 from driving.driveSystem import DriveSystem
+from driving.turnrate import TurnRates
 from sensing.linesensor import LineSensor
-from mapping.planning import Djikstra
+from mapping.planning import TimedDjikstra
 import mapping.planning as pln
+import mapping.kernel as krn
 from sensing.proximitysensor import ProximitySensor
 import mapping.checkMap as checks
 from behavior.decision import *
 from interface.ui_util import *
 
 
-def end(ultraSense, driveSys, io):
+def end(ultraSense, driveSys, io, journal, client, times):
     """ Stop all activities of the robot and ends communication with the robot 
     hardware in preparation to shutdown the robot control thread. Also ends 
     all activity from the UltraSense thread and shuts the thread down
 
     Arguments: ultraSense: The active ultraSense object being read by the robot
-               driveSys: The motor control object being used to control the bot 
+               driveSys: The motor control object being used to control the bot, 
+                         whose calibrated turn rates are saved
                io: The IO object being used to communicate with bot hardware 
+               journal: The MapJournal recording the map, to be flushed
+               client: The MapClient sharing the map, if any
+               times: The StreetTimes measured on the map, to be saved
     """
     print("Shutting down")
+    commands, writes = driveSys.rates()
+    print(f"Motor commands: {commands:.0f}/s, pigpio writes: {writes:.0f}/s")
+    journal.close()
+    times.save()
+    driveSys.turns.save()
+    if client != None:
+        client.close()
     ultraSense.shutdown()
     driveSys.stop()
     io.stop()
   
 
-def master(flags, out, responses, resp_flag, state, map_num=None):
+def attach(graph, watchers):
+    """ Starts each of the map watchers (journal, feed) following a new map"""
+    for watcher in watchers:
+        watcher.attach(graph)
+
+
+def master(flags, out, responses, resp_flag, state, map_num=None, feed=None):
     """ This function interacts with the UI module to allow Norman to execute 
     different behaviors, allowing Norman to switch behaviors in between turns. 
     First executes a line follow, then decides how to turn based on which
@@ -52,6 +78,7 @@ def master(flags, out, responses, resp_flag, state, map_num=None):
 
     Arguments: flags: the flags array shared with the UI thread for commands 
                map_num: Optionally load a map from the pickle file with this #
+               feed: Optionally a MapFeed sharing map changes with ROS
     """
     # Initialize hardware
     io = pigpio.pi()
@@ -61,7 +88,7 @@ def master(flags, out, responses, resp_flag, state, map_num=None):
     # Instantiate hardware objects
     driveSys = DriveSystem(io, const.L_MOTOR_PINS, \
                                 const.R_MOTOR_PINS, \
-                                const.PWM_FREQ)
+                                const.PWM_FREQ, turns=TurnRates())
     IRSensor = LineSensor(io, const.IR_PINS)
     ultraSense = ProximitySensor(io)
     init_state(out, responses, resp_flag, state)
@@ -71,10 +98,47 @@ def master(flags, out, responses, resp_flag, state, map_num=None):
         time.sleep(2)
         continue
     
-    #Initialize mapping variables
+    #Initialize mapping variables, recovering the map of a crashed run if asked
     graph = None
+    journal = MapJournal(out=out)
+    spec = SpeculativePlanner()
+    predictor = StreetPrior(load_corpus())
+    watchers = [journal, spec, predictor]
+    if feed != None:
+        watchers.append(feed)
+    client = None
+    allocator = None
+    robot = None
+    scorer = InfoGain(predictor=predictor)
+    if os.path.exists(const.MAP_SOCKET):
+        try:
+            client = MapClient()
+            allocator = FrontierAllocator()
+            robot = client.robot
+            watchers += [client, allocator]
+            post("Sharing the map through the map server", out)
+        except OSError:
+            post("Map server not running, mapping alone", out)
     if map_num != None:
         graph = pln.from_pickle(map_num)
+    else:
+        recovered = recover()
+        if recovered != None:
+            post("Recover the map from the last run (y/n)?", out)
+            if get_resp(responses, out, resp_flag).lower() == 'y':
+                graph = recovered
+
+    #Street times are kept only with the map they were measured on, so a new
+    # map (including a declined recovery) starts with none, to be saved with 
+    # the journaled map
+    if graph != None:
+        times = StreetTimes(times_path(map_num))
+        attach(graph, watchers)
+    else:
+        times = StreetTimes(load=False)
+    #Speculative plans are timed with the street times and turn rates too
+    times.observe(spec.changed)
+    driveSys.turns.observe(spec.changed)
     location = state[0]
     heading = state[1]
     prev_loc = (location[0] - const.heading_map[heading][0], 
@@ -85,7 +149,7 @@ def master(flags, out, responses, resp_flag, state, map_num=None):
         tool = Visualizer(graph)
     djik = None 
     if graph != None:
-        djik = Djikstra(graph, location)
+        djik = TimedDjikstra(graph, location, times, driveSys.turns)
     path = []
     active = True
     just_pulled_up = True
@@ -102,7 +166,14 @@ def master(flags, out, responses, resp_flag, state, map_num=None):
                     graph.clear_blockages()
                     post("Clearing blockages", out)
             if flags[const.SV_MAP]:
-                complete(graph, flags[const.DATA])
+                #Neither the map nor its times are saved without a name, as
+                # the times would be saved hidden, as ".times"
+                name = flags[const.DATA]
+                if name == None or name.strip() == "":
+                    post("Save needs a file name: save <name>", out)
+                else:
+                    journal.save(name)
+                    times.save(os.path.splitext(name)[0] + const.TIMES_EXT)
                 flags[const.SV_MAP] = False
             if flags[const.DISP_MAP]:
                 if tool == None:
@@ -117,13 +188,18 @@ def master(flags, out, responses, resp_flag, state, map_num=None):
                 if (temp_inters != None and 
                     graph.get_intersection(location).get_blockages()[heading] != const.BLK 
                     and active):
+                    speculate(spec, flags, graph, location, heading, path, 
+                              subtarget, scorer, allocator, times, 
+                              driveSys.turns)
                     location, prev_loc, heading = act.adv_line_follow(driveSys, 
                                                                       IRSensor, 
                                                                       ultraSense, 
                                                                       tool, 
                                                                       location, 
                                                                       heading, 
-                                                                      graph, out)
+                                                                      graph, out,
+                                                                      times, path,
+                                                                      state)
                     set_state(state, location, heading)
                     act.pullup(driveSys)
                 elif active:
@@ -133,7 +209,7 @@ def master(flags, out, responses, resp_flag, state, map_num=None):
                         subtarget = None
                         post("Norman cannot drive down blocked road", out)
                         print("Norman cannot drive down blocked road")
-                        direction = pln.l_r_nearest_rd(graph.get_intersection(location), heading)
+                        direction = krn.l_r_nearest_rd(graph.get_intersection(location), heading)
                         if direction == None:
                             post("Stuck! Waiting for blockage to be removed", out)
                             while graph.get_intersection(location).get_blockages()[heading] == const.BLK:
@@ -149,13 +225,18 @@ def master(flags, out, responses, resp_flag, state, map_num=None):
                             while graph.get_intersection(location).get_blockages()[heading] == const.BLK:
                                 act.center_block(ultraSense, location, heading, graph, out)
 
+                    speculate(spec, flags, graph, location, heading, path, 
+                              subtarget, scorer, allocator, times, 
+                              driveSys.turns)
                     location, prev_loc, heading = act.adv_line_follow(driveSys, 
                                                                       IRSensor, 
                                                                       ultraSense, 
                                                                       tool, 
                                                                       location, 
                                                                       heading, 
-                                                                      graph, out)
+                                                                      graph, out,
+                                                                      times, path,
+                                                                      state)
                     set_state(state, location, heading)
                     act.pullup(driveSys)
             else:
@@ -165,21 +246,34 @@ def master(flags, out, responses, resp_flag, state, map_num=None):
                                                                   tool, 
                                                                   location, 
                                                                   heading, 
-                                                                  graph, out)
+                                                                  graph, out,
+                                                                  times)
                 set_state(state, location, heading)
-                graph, tool, djik = pln.init_plan(location, heading, prev_loc)
+                graph, tool, djik = pln.init_plan(location, heading, prev_loc,
+                                                  times, driveSys.turns)
+                attach(graph, watchers)
                 post("Normstorm Navigation Enabled", out)
                 act.find_blocked_streets(ultraSense, location, heading, graph, out)
                 act.pullup(driveSys)
                 just_pulled_up = True
 
-            if prev_loc != location:
-                graph.driven_connection(prev_loc, location, heading)
+            #Check the arrival against the map before recording the street 
+            # driven, so a misread heading is not recorded
+            location, heading = checks.check_end(IRSensor, graph, prev_loc,
+                                                 location, heading, out, 
+                                                 responses, resp_flag, state)
 
-            # we can assume no 45 degree roads exist approaching intersection
-            graph.no_connection(location, (heading + 3) % 8)
-            graph.no_connection(location, (heading + 5) % 8)
-            checks.check_end(IRSensor, graph, location, heading, out, responses, resp_flag, state)
+            #Merge in the other robots' maps, replanning if they changed ours
+            if client != None:
+                client.move(location)
+                if client.sync() != 0:
+                    path = []
+                for other, position in client.positions.items():
+                    allocator.move(other, position)
+                for other in list(allocator.robots):
+                    if other != robot and other not in client.positions:
+                        allocator.remove(other)
+                allocator.move(robot, location)
 
             #Execute a robot behavior based on the set flags
             if flags[const.STP_FLAG]:
@@ -195,8 +289,12 @@ def master(flags, out, responses, resp_flag, state, map_num=None):
                 set_state(state, location, heading)
                 post("Reset map (y/n)?", out)
                 if get_resp(responses, out, resp_flag).lower() == 'y':
+                    times = StreetTimes(load=False)
+                    times.observe(spec.changed)
                     graph, tool, djik = pln.init_plan(location, heading, 
-                                                      prev_loc)
+                                                      prev_loc, times, 
+                                                      driveSys.turns)
+                    attach(graph, watchers)
                     tool.exit()
                     tool = Visualizer(graph)
                     graph.driven_connection(prev_loc, location, heading)
@@ -222,7 +320,9 @@ def master(flags, out, responses, resp_flag, state, map_num=None):
                                                                    flags, out, 
                                                                    responses, 
                                                                    resp_flag,
-                                                                   subtarget)
+                                                                   subtarget,
+                                                                   spec,
+                                                                   predictor)
                 set_state(state, location, heading)
                 active = not done
                 continue
@@ -242,9 +342,12 @@ def master(flags, out, responses, resp_flag, state, map_num=None):
                                                                heading, 
                                                                djik, 
                                                                prev_loc, out,
-                                                               responses, resp_flag, state)
+                                                               responses, resp_flag, state,
+                                                               allocator, robot,
+                                                               scorer, spec,
+                                                               predictor)
                     set_state(state, location, heading)
                 continue
-        end(ultraSense, driveSys, io)
+        end(ultraSense, driveSys, io, journal, client, times)
     except KeyboardInterrupt:
-        end(ultraSense, driveSys, io)
+        end(ultraSense, driveSys, io, journal, client, times)
@@ -4,8 +4,13 @@
 # Authors: Edward Speer, Garrett Knuf
 # Date: 4/16/23
 
-#Adjust for the battery charge
-BATT_LIFE = .91
+#Prior fit of the time (s) to turn each way as a kick offset plus a time per 
+#45 degree step, calibrated online as the battery drains (see 
+#driving/turnrate.py), the variance of the prior fit, and the factor the weight 
+#of each turn fit is forgotten by with each new one
+TURN_FIT = {"LEFT": (-.02, .45), "RIGHT": (.08, .42)}
+TURN_FIT_VAR = .01
+TURN_FORGET = .97
 
 # GPIO HARDWARE CONNECTIONS
 L_MOTOR_PINS = (7, 8) # left motor pins (A, B)
@@ -49,6 +54,30 @@ FEEDBACK_TABLE = {(0, 1, 0): ("STRAIGHT", None),
 		             (1, 1, 0): ("TURN", "LEFT"), \
                      (1, 0, 0): ("TURN", "LEFT")}
 
+#The most the motor PWM values may change per second, ramping them to smooth 
+# wheel slip at speed (e.g. 2000), or None to set them at once
+SLEW_RATE = None
+
+#Follow lines with the PID controller rather than the feedback table. Its gains
+#are tuned in simulation only (see sim/linefollow.py), so it is off until they
+#are validated on the robot
+PID_FOLLOW = False
+
+#PID line following: (P, I, D) gains on the lateral error of the line, the 
+# time constant filtering the error, and the (slowest, fastest) forward speeds 
+# as fractions of the STRAIGHT PWM values
+PID_GAINS = (1.5, 0, .01)
+PID_T = .01
+PID_SPEEDS = (.8, 1.27)
+
+#Heading estimation: the spread (in 45 degree steps) of the angle a turn is 
+#timed at, the chance of the IR sensors misreading whether a street continues 
+#ahead, and the probability a corrected heading must have to be taken without 
+#asking for the true heading
+TURN_SIGMA = .5
+IR_ERR = .05
+HEAD_CONFIDENCE = .8
+
 #Map directions from user input to string and integer directions
 dirMap = {"L":("LEFT", 1), "R": ("RIGHT", -1), "S": "STRAIGHT"}
 
@@ -57,12 +86,57 @@ SUCCESS = 1
 FAILURE = 2
 OBJECT_COLLISION_DIST = 0.1
 
-#How long to pull up for when arriving to an intersection
+#Collision prediction: the number of center ultrasound readings the closing 
+#speed is fit to, the range (m) beyond which nothing is ahead, the time to 
+#contact (s) at which line following starts slowing and at which it stops, and 
+#the fraction of the PWM values it slows to
+COLLISION_SAMPLES = 4
+COLLISION_RANGE = 1.0
+TTC_SLOW = 1.5
+TTC_STOP = .25
+MIN_SCALE = .6
+
+#Blockage detection: the length of a straight street (diagonals are sqrt(2) 
+#longer), the distance within which an object blocks a straight and a diagonal 
+#street, and the number of readings (at least SAMPLE_T apart) of a sensor which
+#must all be within it. Readings taken within APPROACH_REACH before arriving at 
+#an intersection are projected onto the streets leaving it
+STREET_LEN = .55
+BLOCK_DIST = .35
+BLOCK_DIST_DIAG = .6
+BLOCK_SAMPLES = 4
+SAMPLE_T = .06
+APPROACH_REACH = .25
+
+#How long to pull up for when arriving to an intersection, and to wait for 
+#the bot to settle after stopping on it
 PULLUP_T = .475
+ARRIVE_T = 1.2
 
 #The amount of time over which a full power kick is executed initiating a turn
 KICK_TIME = .07
 
+#Time model used in planning, in seconds: driving one unit of street, turning 
+#45 degrees (when the turn rates are not calibrated), the kick and settle of 
+#each turn, and exploring an intersection with a full sweep
+DRIVE_T = 2.0
+TURN_T = .4
+TURN_STOP_T = .6
+SCAN_T = 8 * TURN_T + 4 * TURN_STOP_T
+
+#Time spent stopping, pulling up and settling at each intersection reached
+STOP_T = ARRIVE_T + PULLUP_T + .5
+
+#Prior probability that an unknown heading of an intersection has a street
+STREET_PRIOR = .5
+
+#Street prediction: the number of known headings the prior of each 
+#surrounding weighs as, the saved maps of similar floors to learn from, and 
+#the distance a street found missing is taken to add on the way to a target
+PRIOR_WEIGHT = 2
+PRIOR_MAPS = []
+DEAD_END_DIST = 1
+
 #Mapping Constants
 
 #Relate heading to the change in position they cause
@@ -132,3 +206,33 @@ CMD_DICT = {
 #of the map used by the UI and robot threads
 GRAPHX_PATH = 'interface/images/'
 MAP_PATH = GRAPHX_PATH + 'map.png'
+
+#Map journal files. Every change to the map is appended to the journal, and 
+#the journal is compacted into the snapshot every JOURNAL_COMPACT records
+PICKLE_PATH = 'pickles/'
+JOURNAL_PATH = PICKLE_PATH + 'journal.log'
+SNAPSHOT_PATH = PICKLE_PATH + 'snapshot.nmap'
+JOURNAL_COMPACT = 5000
+
+#Measured street drive times, kept next to each map file, and for the journaled
+#map in TIMES_PATH
+TIMES_EXT = '.times'
+TIMES_PATH = PICKLE_PATH + 'journal' + TIMES_EXT
+
+#The turn rate fits are kept between runs in TURN_RATES_PATH
+TURN_RATES_PATH = PICKLE_PATH + 'turn.rates'
+
+#Tiled map storage. Maps too large for memory are stored in tiles of 
+#TILE_SIZE x TILE_SIZE locations, of which TILE_CACHE are kept in memory
+TILE_SIZE = 64
+TILE_CACHE = 64
+
+#Side length of the grid cells of the spatial index of intersection locations
+SPATIAL_CELL = 4
+
+#Unix socket of the map server shared by robots exploring the same floor
+MAP_SOCKET = '/tmp/normstorm_map.sock'
+
+#Seconds after which a robot which has not sent its location is taken to have
+#gone, and its frontier allocation freed
+POSITION_TIMEOUT = 60
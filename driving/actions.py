@@ -6,18 +6,30 @@ Authors: Edward Speer, Garrett Knuf
 Date: 5/8/23
 """
 
-from sensing.filters import InterDetector, LRDetector, NextRoadDetector
+from sensing.filters import Filters, InterDetector, LRDetector, NextRoadDetector
+from sensing.blockage import BlockageDetector
+from sensing.collision import CollisionPredictor
+from driving.controller import LineController
 from mapping.checkMap import check_end
+from mapping.planning import pass_through
 import constants as const
 import time
-from interface.ui_util import post
+from interface.ui_util import post, set_state
 
-def line_follow(driveSys, IRSense, ultraSense, tool):
+def line_follow(driveSys, IRSense, ultraSense, tool, stop=True, detector=None,
+                heading=None):
     """ This behavior of the robot causes the bot to begin following a 
         tape line on the ground, filtering the signal to avoid noise 
         as necessary. It returns SUCCESS if a line if successfully followed,
         but it will stop the robot return FAILURE if an object is detected
-        in the robots path
+        in the robots path. If stop is False, the bot keeps driving straight
+        over the intersection reached instead of stopping on it. Given a 
+        BlockageDetector, the ultrasound readings are fed to it throughout.
+        The bot slows as the CollisionPredictor finds it closing on an object, 
+        and stops before contact, stopping early only when contact would come
+        before the intersection ahead on the street of the given heading.
+        The line is followed by the PID LineController if PID_FOLLOW is set, 
+        and otherwise by the feedback table.
 
         Inputs: driveSys: a DriveSystem object for motor control
                 IRSense: a LineSensor object to be filtered for line
@@ -25,6 +37,9 @@ def line_follow(driveSys, IRSense, ultraSense, tool):
                 ultraSense: a ProximitySensor to detect object in the
                             robot's path
                 tool: visualizer to be updated upon successful follow
+                stop: whether to stop on the intersection reached
+                detector: BlockageDetector for the intersection reached
+                heading: the heading of the street being driven, if known
     """
     LR_DET_RESPONSE = {-1: (driveSys.drive, ["TURN", "LEFT"]),
                         0: (past_end, []),
@@ -32,55 +47,108 @@ def line_follow(driveSys, IRSense, ultraSense, tool):
     Ntime = time.time()
     ids = InterDetector(IRSense, const.INTER_T, Ntime)
     lr = LRDetector(IRSense, const.LR_T, Ntime)
+    pid = None
+    if const.PID_FOLLOW:
+        pid = LineController(Ntime)
+        off_line = Filters(IRSense, const.INTER_T, Ntime)
+    collide = CollisionPredictor(ultraSense, Ntime, heading)
     start_time = time.time()
 
     while True:
-        # check if obstacle in robot path
+        # check if obstacle in robot path, slowing as it closes
         dist = ultraSense.read()[1]
-        if dist <= const.OBJECT_COLLISION_DIST:
+        collide.update(time.time())
+        if dist <= const.OBJECT_COLLISION_DIST or collide.stop(time.time()):
             driveSys.stop()
             return const.FAILURE
+        scale = collide.scale(time.time())
         # perform line following based on IR readings
         reading = IRSense.read()
         Ntime = time.time()
         ids.update(time.time())
+        if detector != None:
+            detector.update(Ntime)
         if reading == (1, 1, 1) and ids.check(Ntime) and (Ntime - start_time) >= .5:
+            if not stop:
+                return const.SUCCESS
             driveSys.stop()
-            time.sleep(1.2)
+            # keep reading the ultrasounds while the bot settles
+            if detector != None:
+                detector.arrive(Ntime)
+            while time.time() - Ntime < const.ARRIVE_T:
+                if detector != None:
+                    detector.update(time.time())
+                time.sleep(.01)
             if tool != None:
                 tool.show()
             return const.SUCCESS
         lr.update(time.time())
 	    # robot is entirely off the line
-        if reading == (0, 0, 0):
+        if reading == (0, 0, 0) and pid == None:
             lr_rd = lr.get(time.time())
             resp = LR_DET_RESPONSE[lr_rd]
             resp[0](*resp[1])
+        elif pid != None:
+            # the PID steers back to the line itself, but past the end of the
+            # road (the line lost, filtering out misreads, while centered)
+            if off_line.get(Ntime) == [0, 0, 0] and lr.get(Ntime) == 0:
+                past_end()
+            PWM_L, PWM_R = pid.update(reading, Ntime)
+            driveSys.pwm(scale * PWM_L, scale * PWM_R)
         elif reading in const.FEEDBACK_TABLE: 
             driveSys.drive(const.FEEDBACK_TABLE.get(reading)[0], \
-	        const.FEEDBACK_TABLE.get(reading)[1])
+	        const.FEEDBACK_TABLE.get(reading)[1], scale)
 
 
 def adv_line_follow(driveSys, IRSensor, ultraSense, tool, location, heading, 
-                    graph, out):
+                    graph, out, times=None, path=None, state=None):
     """ This behavior of the robot performs an advanced line follow, however,
         if detects an object immediately in its path with the ultrasound
         sensors, it performs a 180 degree U-turn. If it gets stuck on a road
         for more than 3 U-turns, it will wait until an block blocking the
-        road is removed
+        road is removed. If given StreetTimes, the time taken to drive each 
+        street is recorded in them, unless the bot had to U-turn. The streets 
+        leaving the intersection reached are checked for blockages from the 
+        ultrasound readings taken on the way.
+
+        If given the path being followed, the bot drives express through the 
+        explored intersections where the path goes straight on, counting each 
+        one as it passes (popping its heading off the path and updating the 
+        pose in state) rather than stopping there.
     """
     num_Uturns = 0
     prev_loc = location
+    uturned = False
+    start = time.time()
 
     #Execute a line follow, if sudden blockage encountered, perform U-Turn
-    while line_follow(driveSys, IRSensor, ultraSense, tool) != const.SUCCESS:
+    while True:
+        through = not uturned and pass_through(graph, location, heading, path)
+        detector = BlockageDetector(ultraSense, heading, time.time())
+        if line_follow(driveSys, IRSensor, ultraSense, tool, not through, 
+                       detector, heading) == const.SUCCESS:
+            if not through:
+                break
+            if times != None:
+                times.record(location, heading, time.time() - start)
+            start = time.time()
+            prev_loc = location
+            location = (location[0] + const.heading_map[heading][0], 
+                        location[1] + const.heading_map[heading][1])
+            path.pop(0)
+            if state != None:
+                set_state(state, location, heading)
+            continue
         heading, prev_loc = exec_Uturn(driveSys, IRSensor, location, heading, 
                                        out)
         num_Uturns += 1
+        uturned = True
         if num_Uturns >= 2:
             while ultraSense.read()[1] < 0.35:
                 pass # wait until obstacle is removed
             num_Uturns = 0
+    if times != None and not uturned:
+        times.record(location, heading, time.time() - start - const.ARRIVE_T)
     
     #Update location based on what happened during line following
     location = prev_loc
@@ -89,7 +157,8 @@ def adv_line_follow(driveSys, IRSensor, ultraSense, tool, location, heading,
 
     #Check for blockages at the new intersection
     if graph != None:
-        find_blocked_streets(ultraSense, location, heading, graph, out)
+        find_blocked_streets(ultraSense, location, heading, graph, out, 
+                             detector.verdicts())
 
     if tool != None:
         tool.show()
@@ -104,33 +173,21 @@ def pullup(driveSys):
     time.sleep(.5)
 
 
-def calculate_angle(direction, tm):
+def calculate_angle(direction, tm, turns=None):
     """Calculates the approximate angle turned by the robot for turning 
-    in the given direction for the given amount of time"""
-    battery_life = const.BATT_LIFE
-    val = tm * battery_life
-    if direction == "LEFT":
-        if val > 1.42:
-            return 180
-        elif val > 1:
-            return 135
-        elif val > 0.6:
-            return 90
-        else:
-            return 45
-    elif direction == "RIGHT":
-        if val > 1.42:
-            return -180
-        elif val > 1.07:
-            return -135
-        elif val > .65:
-            return -90
-        else:
-            return - 45
-    raise Exception("Invalid direction!")
-
-
-def exec_turn(driveSys, sensor, direction):
+    in the given direction for the given amount of time, from the calibrated 
+    TurnRates turns if given and otherwise the prior turn time fit"""
+    if direction not in ["LEFT", "RIGHT"]:
+        raise Exception("Invalid direction!")
+    if turns != None:
+        steps = turns.steps(direction, tm)
+    else:
+        offset, per_step = const.TURN_FIT[direction]
+        steps = max(1, min(4, round((tm - offset) / per_step)))
+    return const.dirMap[direction[0]][1] * 45 * steps
+
+
+def exec_turn(driveSys, sensor, direction, passes=0):
     """Executes a turn of the robot until the next line is found
        using a nextroad detector, and reports the approximate angle
        the bot has turned
@@ -138,28 +195,40 @@ def exec_turn(driveSys, sensor, direction):
        Inputs: driveSys: drive system object for motor control
                sensor: linesensor object for IR input
                direction: Direction of turn (l/r)
+               passes: number of streets to turn through without stopping
+                       before stopping on the next. The angle reported is 
+                       then the angle turned from the last street passed.
     """
     start_time = time.time()
 
     #Perform a short kick to overcome resistance
     driveSys.kick(direction)
 
-    edgeDetector = NextRoadDetector(sensor, const.NR_T, direction, start_time)
-    while not edgeDetector.found_road():
-        driveSys.drive("SPIN", direction)
-    # first sensor has crossed the line
-
-    # wait for center sensor to cross line for timing
-    centerDetector = NextRoadDetector(sensor, const.NR_T, "CENTER", time.time())
-    while not centerDetector.found_road():
-        continue
+    for i in range(passes + 1):
+        edgeDetector = NextRoadDetector(sensor, const.NR_T, direction, 
+                                        start_time)
+        while not edgeDetector.found_road():
+            driveSys.drive("SPIN", direction)
+        # first sensor has crossed the line
+
+        # wait for center sensor to cross line for timing
+        centerDetector = NextRoadDetector(sensor, const.NR_T, "CENTER", 
+                                          time.time())
+        while not centerDetector.found_road():
+            continue
+
+        #Time the next segment from the street passed
+        if i < passes:
+            start_time = time.time()
     driveSys.stop()
 
     #Calculate the angle turned from the total time
     end_time = time.time()
     tm = end_time - start_time
     time.sleep(.5)
-    return calculate_angle(direction, tm)
+    if driveSys.turns != None:
+        driveSys.turns.timed(direction, tm)
+    return calculate_angle(direction, tm, driveSys.turns)
 
 
 def exec_Uturn(driveSys, IRSensor, location, heading, out):
@@ -172,6 +241,8 @@ def exec_Uturn(driveSys, IRSensor, location, heading, out):
     ang = abs(exec_turn(driveSys, IRSensor, "RIGHT"))
     time.sleep(.2)
     heading = (heading + 4) % 8  # assume 180 degree angle
+    if driveSys.turns != None:
+        driveSys.turns.confirm(4)
     prev_loc = location
     if ang != 180:
         print(ang)
@@ -190,25 +261,33 @@ def past_end():
     raise Exception("Attempted to drive straight where there is no road")
 
 
-def find_blocked_streets(ultraSense, location, heading, graph, out):
+def find_blocked_streets(ultraSense, location, heading, graph, out, 
+                         verdicts=None):
     """
     Search for blocked street ahead only if street ahead exists. Updates the 
-    graph and returns a boolean whether it found any blocked streets.
+    graph and returns a boolean whether it found any blocked streets. If 
+    verdicts (whether the left, center and right streets are blocked, as from 
+    a BlockageDetector) are given, they are used rather than sampling the 
+    ultrasounds.
     """
 
     # allowable distance until object blocks a street
-    threshold = 0.35
+    threshold = const.BLOCK_DIST
     if heading % 2 != 0:
-        threshold = 0.6
+        threshold = const.BLOCK_DIST_DIAG
 
     if graph != None:
         inters = graph.get_intersection(location)
-        if inters != None:
+        if inters != None and verdicts != None:
+            left_sensor_bad = not verdicts[0]
+            center_sensor_bad = not verdicts[1]
+            right_sensor_bad = not verdicts[2]
+        elif inters != None:
             # filter ultrasound readings because the sensors suck
             readings = []
-            filter_steps = 4
+            filter_steps = const.BLOCK_SAMPLES
             for i in range(filter_steps):
-                time.sleep(0.06)
+                time.sleep(const.SAMPLE_T)
                 readings.append(ultraSense.read())
             
             left_sensor_bad = False
@@ -222,7 +301,7 @@ def find_blocked_streets(ultraSense, location, heading, graph, out):
                     center_sensor_bad = True
                 if readings[i][2] > threshold:
                     right_sensor_bad = True
-
+        if inters != None:
             # center sensor
             next_location = (location[0] + const.heading_map[heading][0],
                              location[1] + const.heading_map[heading][1])
@@ -0,0 +1,90 @@
+"""
+This module implements the continuous line following controller. Rather than
+banging between the STRAIGHT and TURN modes of the feedback table, it steers
+by a PID law on the filtered lateral position of the line under the IR
+sensors, and schedules the forward speed down as the robot leaves the center
+of the line, so that it can cruise faster on straight tape without
+oscillating about it.
+
+Authors: Edward Speer, Garrett Knuf
+Date: 6/19/23
+"""
+
+import constants as const
+from sensing.filters import LRDetector
+
+
+class LineController:
+    """ A PID controller for following a tape line. The lateral error is the
+    weighted position of the line under the sensors (positive when the line
+    is to the right, as LRDetector weights it), low pass filtered. The
+    steering output adds to the left wheel and takes from the right, and the
+    forward speed is scheduled from the fastest speed on the line to the
+    slowest at the edge of the sensors.
+
+    Inputs: Ntime: the time the controller starts
+            gains: the (P, I, D) gains on the lateral error
+            speeds: the (slowest, fastest) forward speeds, as fractions of the
+                    STRAIGHT PWM values
+            T: time constant filtering the lateral error
+    """
+
+    # The error held while off the line, beyond the outer sensors
+    OFF_LINE = 1.5
+
+    # Bound on the integrated error, to keep it from winding up off the line
+    I_MAX = .2
+
+    def __init__(self, Ntime, gains=const.PID_GAINS, speeds=const.PID_SPEEDS,
+                 T=const.PID_T):
+        self.kp, self.ki, self.kd = gains
+        self.slow, self.fast = speeds
+        self.T = T
+        self.last_time = Ntime
+        self.error = 0
+        self.integral = 0
+        self.rate = 0
+        self.output = self.wheels(0, self.slow)
+
+    def position(self, reading):
+        """ Returns the lateral position of the line under the sensors, taking
+        it to be off the side the line was last seen on if no sensor sees it
+        """
+        if reading == (0, 0, 0):
+            if self.error > 0:
+                return self.OFF_LINE
+            if self.error < 0:
+                return -self.OFF_LINE
+            return 0
+        return LRDetector.position_weights.get(reading, 0)
+
+    def wheels(self, steer, speed):
+        """ Returns the (left, right) PWM values driving forward at speed
+        while steering by steer (-1 to 1, positive to the right)
+        """
+        base_l, base_r = const.MODES["STRAIGHT"][None]
+        pwm_l = base_l * speed * (1 + steer)
+        pwm_r = base_r * speed * (1 - steer)
+        return (int(max(-255, min(255, pwm_l))),
+                int(max(-255, min(255, pwm_r))))
+
+    def update(self, reading, Ntime):
+        """ Updates the controller with an IR reading, returning the (left,
+        right) PWM values to drive
+        """
+        dt = Ntime - self.last_time
+        if dt <= 0:
+            return self.output
+        self.last_time = Ntime
+        prev = self.error
+        self.error += min(dt / self.T, 1) * (self.position(reading) -
+                                             self.error)
+        self.rate = (self.error - prev) / dt
+        self.integral = max(-self.I_MAX, min(self.I_MAX,
+                                             self.integral + self.error * dt))
+        steer = (self.kp * self.error + self.ki * self.integral +
+                 self.kd * self.rate)
+        steer = max(-1, min(1, steer))
+        speed = self.fast - (self.fast - self.slow) * min(1, abs(self.error))
+        self.output = self.wheels(steer, speed)
+        return self.output
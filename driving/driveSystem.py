@@ -27,27 +27,60 @@ class DriveSystem():
         leftMPins: left motor pins tuple
         rightMPins: right motor pins tuple
         PWMFreq: Pulse Width modulation frequency for motor speed control
+        slew: the most the PWM values may change per second, or None to 
+              change them at once
+        turns: the TurnRates calibrating the angles turns are read at, if any
     """
 
-    def __init__(self, io, leftMPins, rightMPins, PWMFreq):
+    def __init__(self, io, leftMPins, rightMPins, PWMFreq, 
+                 slew=const.SLEW_RATE, turns=None):
         # instantiate the left and right Motor instances
         self.left_motor = Motor(io, leftMPins, PWMFreq)
         self.right_motor = Motor(io, rightMPins, PWMFreq)
+
+        # The PWM values last commanded, for ramping, and the commands made
+        self.slew = slew
+        self.last = (0, 0)
+        self.last_time = time.time()
+        self.commands = 0
+        self.start_time = time.time()
+        self.turns = turns
        
     def stop(self):
         """ Immediately stops all motion of the robot controlled by the DriveSystem 
-        object. """
+        object. Ramping starts again from rest at the time of stopping. """
+        self.commands += 1
+        self.last = (0, 0)
+        self.last_time = time.time()
         self.left_motor.disable()
         self.right_motor.disable()
 
-    def pwm(self, PWM_L, PWM_R):
+    def pwm(self, PWM_L, PWM_R, ramp=True):
         """A simple utility which sets the driveSystem motors to the passed in l and r 
-        PWM values.
+        PWM values. With a slew rate set, the values are ramped toward those 
+        passed in (unless ramp is False), so they must be passed repeatedly to 
+        be reached.
+        """
+        self.commands += 1
+        Ntime = time.time()
+        if ramp and self.slew != None:
+            step = self.slew * (Ntime - self.last_time)
+            PWM_L = max(self.last[0] - step, min(self.last[0] + step, PWM_L))
+            PWM_R = max(self.last[1] - step, min(self.last[1] + step, PWM_R))
+        self.last_time = Ntime
+        self.last = (PWM_L, PWM_R)
+        self.left_motor.setSpeed(int(round(PWM_L)))
+        self.right_motor.setSpeed(int(round(PWM_R)))
+
+    def rates(self):
+        """Returns the motor commands and the pigpio writes they made per 
+        second since the DriveSystem was made
         """
-        self.left_motor.setSpeed(PWM_L)
-        self.right_motor.setSpeed(PWM_R)
+        elapsed = max(time.time() - self.start_time, 1e-6)
+        writes = self.left_motor.writes + self.right_motor.writes
+        return (self.commands / elapsed, writes / elapsed)
 
-    def drive(self, mode, direction=None):
+    def drive(self, mode, direction=None, scale=1):
         """ Engages the robot motors to drive the robot along a certain trajectory
 
         Arguments:
@@ -55,6 +88,7 @@ class DriveSystem():
                   indicating the extent of curvature in the path of the bot
             direction (optional): Either "LEFT" or "RIGHT" indicating the direction of 
                        curvature. Not required when mode is "STRAIGHT"
+            scale (optional): fraction of the mode's PWM values to drive at
 
         Raises:
             Exception if direction not specified for a turning trajectory, or if 
@@ -71,7 +105,8 @@ class DriveSystem():
             raise Exception("DriveSystem.drive: Must specify LEFT or RIGHT")
         
         #Set the left and right motor speeds based on mode and direction
-        self.pwm(const.MODES[mode][direction][0], const.MODES[mode][direction][1])
+        self.pwm(scale * const.MODES[mode][direction][0], 
+                 scale * const.MODES[mode][direction][1])
     
     def kick(self, direction):
         """Executes a very short timed full power spin in the specified direction in order 
@@ -82,7 +117,7 @@ class DriveSystem():
         direc = 1
         if direction == "LEFT":
             direc = -1
-        self.pwm(direc * 255, direc * 255)
+        self.pwm(direc * 255, direc * 255, False)
         time.sleep(const.KICK_TIME)
         self.stop()
 
@@ -37,6 +37,11 @@ class Motor():
 		# Clear all pins, just in case.
 		self.io.set_PWM_dutycycle(self.legAPin, 0)
 		self.io.set_PWM_dutycycle(self.legBPin, 0)
+
+		# The duty cycles last written to each pin, so that unchanged ones
+		# are not written again, and the number of writes made
+		self.duty = [0, 0]
+		self.writes = 0
 		
 	def setPWMFreq (self, freq):
 		"""Sets the PWM frequency of the motor
@@ -56,11 +61,25 @@ class Motor():
 			speed: speed of motor -255 <= speed <= 255
 		"""
 		if (speed >= 0):
-			self.io.set_PWM_dutycycle(self.legAPin, speed)
-			self.io.set_PWM_dutycycle(self.legBPin, 0)
+			self.setDuty(speed, 0)
 		else:
-			self.io.set_PWM_dutycycle(self.legAPin, 0)
-			self.io.set_PWM_dutycycle(self.legBPin, -speed)
+			self.setDuty(0, -speed)
+
+	def setDuty(self, dutyA, dutyB):
+		"""Writes the duty cycles of the two motor pins, skipping any pin
+		already at its duty cycle
+		
+		Args:
+			dutyA, dutyB: duty cycles of the pins, 0 to 255
+		"""
+		if dutyA != self.duty[0]:
+			self.io.set_PWM_dutycycle(self.legAPin, dutyA)
+			self.duty[0] = dutyA
+			self.writes += 1
+		if dutyB != self.duty[1]:
+			self.io.set_PWM_dutycycle(self.legBPin, dutyB)
+			self.duty[1] = dutyB
+			self.writes += 1
 			
 	def disable(self):
 		"""Disables motor in case of shutdown"""
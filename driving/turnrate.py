@@ -0,0 +1,185 @@
+"""
+This module keeps the robot's turn rate calibrated as the battery drains. The
+time a turn takes is fit as a kick offset plus a time per 45 degrees for each
+direction, by recursive least squares over the turns whose true angle the map
+confirms, forgetting old turns so the fit follows the battery. calculate_angle
+reads turn angles from the fit, and the planners time turns with it.
+
+The fits are saved between runs as a text file, one line per direction:
+    direction offset per_step p00 p01 p11 count
+where p is the covariance of the fit and count the turns fit.
+
+Authors: Edward Speer, Garrett Knuf
+Date: 6/19/23
+"""
+
+import os
+import tempfile
+import constants as const
+
+
+class TurnRates:
+    """ Recursive least squares fits of the time to turn a number of 45 degree
+    steps in each direction, time = offset + per_step * steps, starting from
+    TURN_FIT. The last turn timed is held until the map confirms how many
+    steps it turned, when it is fit.
+
+    Inputs: path - the file the fits are loaded from and saved to
+    """
+
+    def __init__(self, path=const.TURN_RATES_PATH):
+        self.path = path
+        self.fits = {}
+        self.observers = []
+        for direction in ["LEFT", "RIGHT"]:
+            self.fits[direction] = (list(const.TURN_FIT[direction]),
+                                    [[const.TURN_FIT_VAR, 0],
+                                     [0, const.TURN_FIT_VAR]], 0)
+        self.last = None
+        if os.path.exists(path):
+            self.load(path)
+
+    def fit(self, direction):
+        """Returns the (offset, per_step) turn time fit of a direction"""
+        return tuple(self.fits[direction][0])
+
+    def step_time(self, direction):
+        """Returns the time to turn 45 degrees in a direction"""
+        return self.fits[direction][0][1]
+
+    def steps(self, direction, tm):
+        """Returns the number of 45 degree steps (1 to 4) a turn in direction
+        taking tm seconds most likely turned
+        """
+        offset, per_step = self.fit(direction)
+        return max(1, min(4, round((tm - offset) / per_step)))
+
+    def timed(self, direction, tm):
+        """Holds a turn in direction taking tm seconds until it is confirmed"""
+        self.last = (direction, tm)
+
+    def confirm(self, steps):
+        """Fits the last turn timed as having turned steps 45 degree steps,
+        unless it is more than a step off the fit, when the confirmation is
+        more likely wrong than the fit. Passing None drops the last turn
+        unfit, as its angle could not be confirmed.
+        """
+        if self.last == None or steps == None:
+            self.last = None
+            return
+        direction, tm = self.last
+        self.last = None
+        theta, P, count = self.fits[direction]
+        x = (1, steps)
+        err = tm - (theta[0] * x[0] + theta[1] * x[1])
+        if abs(err) > theta[1]:
+            return
+        Px = [P[0][0] * x[0] + P[0][1] * x[1], P[1][0] * x[0] + P[1][1] * x[1]]
+        gain = [p / (const.TURN_FORGET + x[0] * Px[0] + x[1] * Px[1])
+                for p in Px]
+        theta = [theta[i] + gain[i] * err for i in range(2)]
+        P = [[(P[i][j] - gain[i] * Px[j]) / const.TURN_FORGET
+              for j in range(2)] for i in range(2)]
+        self.fits[direction] = (theta, P, count + 1)
+        for callback in self.observers:
+            callback(("fit", direction))
+
+    def observe(self, callback):
+        """Registers callback to be called with ("fit", direction) each time
+        the fit of a direction changes
+        """
+        self.observers.append(callback)
+
+    def load(self, path):
+        """Loads the fits saved in a file, keeping the prior fit of any
+        direction missing from it
+        """
+        with open(path, 'r') as rates:
+            for line in rates:
+                fields = line.split()
+                if len(fields) != 7 or fields[0] not in self.fits:
+                    continue
+                vals = [float(field) for field in fields[1:6]]
+                self.fits[fields[0]] = ([vals[0], vals[1]],
+                                        [[vals[2], vals[3]],
+                                         [vals[3], vals[4]]], int(fields[6]))
+
+    def save(self, path=None):
+        """Saves the fits to a file (by default the one they were loaded
+        from), replacing it only once completely written
+        """
+        if path == None:
+            path = self.path
+        directory = os.path.dirname(path)
+        if directory != '':
+            os.makedirs(directory, exist_ok=True)
+        fd, temp = tempfile.mkstemp(dir=directory if directory != '' else '.')
+        with os.fdopen(fd, 'w') as rates:
+            for direction, (theta, P, count) in self.fits.items():
+                rates.write(f"{direction} {theta[0]!r} {theta[1]!r} " +
+                            f"{P[0][0]!r} {P[0][1]!r} {P[1][1]!r} {count}\n")
+        os.replace(temp, path)
+
+
+def bench(turns=300, seeds=5, drift=.4, mapped=.5, noise=.05):
+    """Compares the turns misread as the battery drains, so that turns slow 
+    by drift over the run, with the prior TURN_FIT, with TurnRates fit on the 
+    turns whose heading it believes from their own timing, and with TurnRates 
+    fit only on the turns the map or the operator confirms (as check_head 
+    does). Each turn is from a street into a simulated intersection to the 
+    next street, with each other heading mapped with chance mapped, read as 
+    check_head reads it; the operator is asked (and answers rightly) when the 
+    heading read is not likely enough.
+    """
+    from random import Random
+    from sim.world import World
+    from sim.scanning import arrival
+    from mapping.heading import turn_posterior, most_likely, map_heading
+    from driving.actions import calculate_angle
+    from constants import UND
+    names = ["prior fit", "fit on beliefs", "fit on confirmed"]
+    misreads = [0, 0, 0]
+    asked = [0, 0, 0]
+    count = 0
+    print(f"{turns} turns per run slowing by {100 * drift:.0f}%, " +
+          f"{seeds} runs, {100 * mapped:.0f}% of headings mapped")
+    for seed in range(seeds):
+        rand = Random(seed)
+        world = World(12, 12, seed=seed, diagonal=.2)
+        arrivals = sorted(world.streets)
+        fits = [None, TurnRates(os.devnull), TurnRates(os.devnull)]
+        for turn in range(turns):
+            location, back = arrivals[rand.randrange(len(arrivals))]
+            heading = (back + 4) % 8
+            inters = arrival(world, location, heading, mapped, rand)
+            direction = rand.choice(["LEFT", "RIGHT"])
+            sign = const.dirMap[direction[0]][1]
+            steps = 1
+            while world.street(location, (heading + sign * steps) % 8) != UND:
+                steps += 1
+            true = (heading + sign * steps) % 8
+            offset, per_step = const.TURN_FIT[direction]
+            per_step *= 1 + drift * turn / turns
+            tm = offset + per_step * min(steps, 4) + rand.gauss(0, noise)
+            count += 1
+            for i, rates in enumerate(fits):
+                if rates != None:
+                    rates.timed(direction, tm)
+                ang = calculate_angle(direction, tm, rates)
+                read = (heading + sign * abs(ang) // 45) % 8
+                belief = turn_posterior(inters, heading, direction, ang)
+                best, prob = most_likely(belief)
+                believed = prob >= const.HEAD_CONFIDENCE
+                confirmed = map_heading(inters, heading, direction) == best
+                if best != read and prob < const.HEAD_CONFIDENCE:
+                    asked[i] += 1
+                    best = true
+                    believed = confirmed = True
+                misreads[i] += best != true
+                if rates != None:
+                    fit = believed if i == 1 else confirmed
+                    rates.confirm((sign * (best - heading)) % 8 if fit 
+                                  else None)
+    print("turn rates            misread    asked")
+    for i in range(3):
+        print(f"{names[i]:18s} {misreads[i]:6d}/{count} {asked[i]:8d}")
@@ -0,0 +1,287 @@
+"""
+This module is an in-process stand-in for the parts of ROS 2 (rclpy,
+geometry_msgs and std_msgs) used by ros.py, so that the robot stack can be
+started and benchmarked on a machine without a ROS install. ros.py falls back
+to it when rclpy cannot be imported.
+
+Nodes, publishers, subscriptions, timers and guard conditions behave like
+their rclpy counterparts as seen from a single process: a message published
+on a topic is delivered to every subscription to that topic, each
+subscription keeps only the last depth messages (older ones are dropped, as
+with the default keep last QoS), and spin runs the callbacks of a node on the
+calling thread until shutdown.
+
+Authors: Edward Speer, Garrett Knuf
+Date: 6/16/23
+"""
+
+import time
+import logging
+import threading
+from collections import deque
+
+#The topics published to in this process, each with its list of subscriptions,
+#and the condition spinning threads wait on for work
+topics = {}
+work = threading.Condition()
+running = [False]
+
+
+def init(args=None):
+    """Starts the stand-in ROS context"""
+    running[0] = True
+
+
+def ok():
+    """Returns whether the context is running"""
+    return running[0]
+
+
+def shutdown():
+    """Stops the context, ending every spin"""
+    with work:
+        running[0] = False
+        work.notify_all()
+
+
+def spin(node):
+    """Runs the callbacks of node as their work arrives until shutdown"""
+    while ok():
+        node.spin_once()
+
+
+def resolve(name, node_name):
+    """Returns the full topic name of a (possibly private) topic name"""
+    if name.startswith('~/'):
+        return '/' + node_name + name[1:]
+    if not name.startswith('/'):
+        return '/' + name
+    return name
+
+
+class Time:
+    """ A point in time, in integer nanoseconds"""
+
+    def __init__(self, seconds=0, nanoseconds=0):
+        self.nanoseconds = int(seconds * 1e9) + nanoseconds
+
+    def __sub__(self, other):
+        if isinstance(other, Duration):
+            return Time(nanoseconds=self.nanoseconds - other.nanoseconds)
+        return Duration(nanoseconds=self.nanoseconds - other.nanoseconds)
+
+    def __add__(self, other):
+        return Time(nanoseconds=self.nanoseconds + other.nanoseconds)
+
+
+class Duration:
+    """ A span of time, in integer nanoseconds"""
+
+    def __init__(self, seconds=0, nanoseconds=0):
+        self.nanoseconds = int(seconds * 1e9) + nanoseconds
+
+    def __lt__(self, other):
+        return self.nanoseconds < other.nanoseconds
+
+    def __le__(self, other):
+        return self.nanoseconds <= other.nanoseconds
+
+    def __gt__(self, other):
+        return self.nanoseconds > other.nanoseconds
+
+    def __ge__(self, other):
+        return self.nanoseconds >= other.nanoseconds
+
+    def __eq__(self, other):
+        return self.nanoseconds == other.nanoseconds
+
+
+class Clock:
+    """ The system clock"""
+
+    def now(self):
+        return Time(nanoseconds=time.time_ns())
+
+
+#Message types
+class Point:
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        self.x = x
+        self.y = y
+        self.z = z
+
+
+class Quaternion:
+    def __init__(self, x=0.0, y=0.0, z=0.0, w=1.0):
+        self.x = x
+        self.y = y
+        self.z = z
+        self.w = w
+
+
+class Pose:
+    def __init__(self):
+        self.position = Point()
+        self.orientation = Quaternion()
+
+
+class Empty:
+    pass
+
+
+class String:
+    def __init__(self, data=''):
+        self.data = data
+
+
+class Publisher:
+    """ Publishes messages to every subscription to a topic"""
+
+    def __init__(self, msg_type, topic):
+        self.msg_type = msg_type
+        self.topic = topic
+
+    def publish(self, msg):
+        with work:
+            for sub in topics.get(self.topic, []):
+                sub.deliver(msg)
+            work.notify_all()
+
+
+class Subscription:
+    """ Queues the last depth messages published to a topic for its node to
+    run the callback on. Counts the messages dropped from the queue.
+    """
+
+    def __init__(self, msg_type, topic, callback, depth):
+        self.msg_type = msg_type
+        self.topic = topic
+        self.callback = callback
+        self.queue = deque(maxlen=depth)
+        self.dropped = 0
+
+    def deliver(self, msg):
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+        self.queue.append(msg)
+
+
+class Timer:
+    """ Runs a callback every period seconds"""
+
+    def __init__(self, period, callback):
+        self.period = period
+        self.callback = callback
+        self.due = time.monotonic() + period
+
+    def cancel(self):
+        self.due = None
+
+
+class GuardCondition:
+    """ Runs a callback once on the node's thread after being triggered from
+    any thread
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.triggered = False
+
+    def trigger(self):
+        with work:
+            self.triggered = True
+            work.notify_all()
+
+
+class Node:
+    """ A ROS node, owning the publishers, subscriptions, timers and guard
+    conditions it creates
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.subs = []
+        self.timers = []
+        self.guards = []
+        self.logger = logging.getLogger(name)
+        self.clock = Clock()
+
+    def get_name(self):
+        return self.name
+
+    def get_logger(self):
+        return self.logger
+
+    def get_clock(self):
+        return self.clock
+
+    def create_publisher(self, msg_type, topic, depth):
+        return Publisher(msg_type, resolve(topic, self.name))
+
+    def create_subscription(self, msg_type, topic, callback, depth):
+        sub = Subscription(msg_type, resolve(topic, self.name), callback, depth)
+        with work:
+            topics.setdefault(sub.topic, []).append(sub)
+        self.subs.append(sub)
+        return sub
+
+    def create_timer(self, period, callback):
+        timer = Timer(period, callback)
+        self.timers.append(timer)
+        return timer
+
+    def create_guard_condition(self, callback):
+        guard = GuardCondition(callback)
+        self.guards.append(guard)
+        return guard
+
+    def destroy_timer(self, timer):
+        timer.cancel()
+        self.timers.remove(timer)
+
+    def destroy_guard_condition(self, guard):
+        self.guards.remove(guard)
+
+    def destroy_node(self):
+        with work:
+            for sub in self.subs:
+                topics[sub.topic].remove(sub)
+        self.subs = []
+        self.timers = []
+        self.guards = []
+
+    def ready(self, now):
+        """Returns the callbacks with work to do, taking the messages and
+        triggers they run on, and the time until the next timer is due
+        """
+        ready = []
+        wait = None
+        for guard in self.guards:
+            if guard.triggered:
+                guard.triggered = False
+                ready.append((guard.callback, ()))
+        for sub in self.subs:
+            if len(sub.queue) != 0:
+                ready.append((sub.callback, (sub.queue.popleft(),)))
+        for timer in self.timers:
+            if timer.due != None:
+                if timer.due <= now:
+                    timer.due = max(timer.due + timer.period, now)
+                    ready.append((timer.callback, ()))
+                if wait == None or timer.due - now < wait:
+                    wait = max(timer.due - now, 0)
+        return ready, wait
+
+    def spin_once(self, timeout=None):
+        """Waits for work (at most timeout seconds), then runs one round of
+        the callbacks with work to do
+        """
+        with work:
+            ready, wait = self.ready(time.monotonic())
+            if ready == [] and ok():
+                if wait == None or (timeout != None and timeout < wait):
+                    wait = timeout
+                work.wait(wait)
+                ready, wait = self.ready(time.monotonic())
+        for callback, args in ready:
+            callback(*args)
@@ -13,6 +13,7 @@ from PIL import ImageTk, Image
 import threading
 import ctypes
 from behavior.master import *
+from mapping.feed import MapFeed
 from interface.ui_util import *
 import constants as const
 import ros
@@ -29,11 +30,12 @@ def run_gui():
     print("Interface Running...")
     
     #Initialize shared variables for thread communication
-    messages = []
+    messages = MessageBuffer()
     flags = [False for _ in range(11)]
     responses = []
     resp_flag = [False]
     state = [(None, None), None]
+    feed = MapFeed()
     
     #Initialize Root Window
     root = tk.Tk()
@@ -70,14 +72,15 @@ def run_gui():
 
     #Start the ROS worker thread.
     ros_thread = threading.Thread(name="ROSThread", 
-                                  target=lambda: ros.runros(state, flags, outs))
+                                  target=lambda: ros.runros(state, flags, outs,
+                                                            feed))
     ros_thread.start()
 
     #Start the robot thread, and bind the command input box to control it
     robot_thread = threading.Thread(name="RobotThread", \
                                  target=master,
                                  args=[flags, outs, responses, resp_flag, 
-                                       state])
+                                       state, None, feed])
     robot_thread.start()
     cmd_entry(root, outs, flags, robot_thread, ros_thread)
     resp_entry(root, responses, resp_flag)
@@ -85,6 +88,9 @@ def run_gui():
     #Update the map in the interface at 1 hz
     root.after(1000, lambda: update_gmap(root, map_label))
 
+    #Draw posted status messages at the UI message rate
+    root.after(MESSAGE_RATE, lambda: update_ospace(root, outs))
+
     #Define what happens upon closing the GUI
     root.protocol("WM_DELETE_WINDOW", 
                   lambda: on_close(root, robot_thread, ros_thread))
@@ -131,6 +137,16 @@ def update_gmap(root, label):
         root.after(1000, lambda: update_gmap(root, label))
 
 
+def update_ospace(root, out):
+    """Redraws the status messages in the output space if any were posted 
+    since the last redraw. Runs on the UI thread only, so that the robot and 
+    ROS threads never touch Tk, and coalesces bursts of posts into one redraw.
+    """
+    if out[2].changed():
+        out[0].itemconfig(out[1], text=get_messages(out[2].recent()))
+    root.after(MESSAGE_RATE, lambda: update_ospace(root, out))
+
+
 def cmd_entry(root, out, flags, robot_thread, ros_thread):
     """ Creates the entry field in the GUI into which a user may input GUI 
     commands, and binds it to the functton which sets the flags shared by the 
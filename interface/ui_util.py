@@ -6,23 +6,74 @@ Date: 6/6/23
 """
 
 import textwrap
+from collections import deque
+from itertools import count
 
 MESSAGE_MEM = 8
 
+#Number of posted messages held while waiting for the UI thread to draw them
+MESSAGE_BUF = 64
+
+#Period (ms) at which the UI thread redraws newly posted messages
+MESSAGE_RATE = 100
+
+
+class MessageBuffer:
+    """ A bounded ring buffer of status messages shared between the threads 
+    which post messages (robot, ROS) and the UI thread which displays them. 
+    Posting only appends to the ring and stamps it with a new sequence number, 
+    so a poster never touches Tk, never blocks, and never holds a lock. The UI 
+    thread drains the buffer on a fixed timer, redrawing once per burst of 
+    messages no matter how many were posted.
+
+    Inputs: size - the number of messages retained before the oldest are 
+                   dropped
+    """
+
+    def __init__(self, size=MESSAGE_BUF):
+        self.messages = deque(maxlen=size)
+        self.counter = count(1)
+        self.posted = 0
+        self.drawn = 0
+
+    def append(self, message):
+        """Adds a message to the ring, dropping the oldest if it is full"""
+        self.messages.append(message)
+        self.posted = next(self.counter)
+
+    def changed(self):
+        """Returns True if messages were posted since the last call, and marks 
+        them as drawn
+        """
+        posted = self.posted
+        if posted == self.drawn:
+            return False
+        self.drawn = posted
+        return True
+
+    def recent(self, num=MESSAGE_MEM):
+        """Returns a list of the num most recently posted messages"""
+        return list(self.messages)[-num:]
+
+    def __iter__(self):
+        return iter(list(self.messages))
+
+    def __len__(self):
+        return len(self.messages)
+
+
 def post(message, out):
     """Posts the given message to the GUI at the location indicated by the out 
-    array
+    array. The message is only queued here; the UI thread draws it.
     """
     out[2].append(message)
-    tex = get_messages(out[2])
-    print(tex)
-    out[0].itemconfig(out[1], text=tex)
 
 
 def get_messages(messages):
     """ Formats the messages array into a string which may then be displayed in
     the ouput space of the GUI.
     """
+    messages = list(messages)
     if len(messages) > MESSAGE_MEM:
         messages = messages[-MESSAGE_MEM:]
     str = ""
@@ -53,18 +104,26 @@ def init_state(out, responses, resp_flag, state):
     post("Input starting heading: ", out)
     head = get_resp(responses, out, resp_flag)
     loc_arr = loc.split(',')
-    state[0] = (int(loc_arr[0]), int(loc_arr[1]))
-    state[1] = int(head)
+    set_state(state, (int(loc_arr[0]), int(loc_arr[1])), int(head))
     post("Ready to begin", out)
 
 
 def set_state(state, location, heading):
     """ Sets the state variable which is shared between the UI, Robot, and 
     ros threads so that the location determined by the UI and robot threads may 
-    be published via ros.
+    be published via ros. Any callbacks watching the state are then called.
     """
     state[0] = location
     state[1] = heading
+    for callback in state[2:]:
+        callback()
+
+
+def watch_state(state, callback):
+    """ Registers a callback to be called (on the thread setting the state) 
+    each time the shared state variable is set.
+    """
+    state.append(callback)
 
 
 def set_flags_to(flags, target):
@@ -7,9 +7,10 @@ Date: 4/30/23
 """
 
 from constants import CONDITIONS, UNK, UND, NNE, DRV, \
-                      STREET_CONDITIONS, BLK, UNB, invert_h_map
+                      STREET_CONDITIONS, BLK, UNB, invert_h_map, heading_map
 import pickle
 from interface.ui_util import post, get_resp
+from mapping.spatial import SpatialIndex
 from math import dist
 
 
@@ -26,16 +27,39 @@ class Intersection:
         self.location = location
         self.cost = float('inf')
         self.direction = None
+        self.observer = None
         self.streets = dict.fromkeys(range(8), UNK)
         self.blockages = dict.fromkeys(range(8), UNB)
         if heading != None:
             self.streets[(heading + 4) % 8] = DRV
+        self.packed = None
 
     def __lt__(self, other):
         """Comparison method less than used for comparing two Intersection so 
         that they may be ordered in a PriorityQueue used to implement Djikstra's
         """
         return self.cost < other.cost
+
+    def __getstate__(self):
+        """Pickles an Intersection without the observer of its MapGraph"""
+        state = self.__dict__.copy()
+        state['observer'] = None
+        return state
+
+    def __setstate__(self, state):
+        """Restores a pickled Intersection, including those pickled before 
+        Intersections had observers
+        """
+        self.__dict__.update(state)
+        self.observer = None
+        self.packed = None
+
+    def notify(self, record):
+        """Reports a change to this Intersection to the observer of its 
+        MapGraph, if it belongs to one
+        """
+        if self.observer != None:
+            self.observer(record)
             
     def set_connection(self, heading, status):
         """ Set the label of a certain direction in the intersection 
@@ -46,8 +70,10 @@ class Intersection:
         """
         if status not in CONDITIONS:
             raise Exception("Intersection.set_connection: Invalid status")
-        else:
+        elif self.streets[heading] != status:
             self.streets[heading] = status
+            self.packed = None
+            self.notify(("st", self.location, heading, status))
 
     def get_streets(self):
         """Return the streets list form an Intersection"""
@@ -64,11 +90,15 @@ class Intersection:
             raise Exception("Intersection.set_blockage: Invalid status")
         else:
             if self.blockages[heading] != status:
-                if status == BLK:
+                if out == None:
+                    pass
+                elif status == BLK:
                     post("Blocking " + str(self.location) + " w heading " + str(heading), out)
                 else:
                     post("Unblocking " + str(self.location) + " w heading " + str(heading), out)
                 self.blockages[heading] = status
+                self.packed = None
+                self.notify(("bk", self.location, heading, status))
 
     def get_blockages(self):
         """Return the blockages list from an Intersection"""
@@ -119,7 +149,37 @@ class Intersection:
     
     def clear_blockages(self):
         """ marks all streets as unblocked """
+        cleared = [heading for heading in range(8) 
+                   if self.blockages[heading] != UNB]
         self.blockages = dict.fromkeys(range(8), UNB)
+        self.packed = None
+        for heading in cleared:
+            self.notify(("bk", self.location, heading, UNB))
+
+    def pack(self):
+        """Returns the street labels packed into 16 bits and the blockages 
+        into an 8 bit mask, as map files store them (see mapfile.pack_streets)
+        """
+        if self.packed == None:
+            code = 0
+            mask = 0
+            for heading in range(8):
+                code |= CONDITIONS.index(self.streets[heading]) << (2 * heading)
+                if self.blockages[heading] == BLK:
+                    mask |= 1 << heading
+            self.packed = (code, mask)
+        return self.packed
+
+    def records(self):
+        """Generates the change records which would build this Intersection in 
+        an empty MapGraph (see MapGraph.observe)
+        """
+        yield ("add", self.location)
+        for heading in range(8):
+            if self.streets[heading] != UNK:
+                yield ("st", self.location, heading, self.streets[heading])
+            if self.blockages[heading] != UNB:
+                yield ("bk", self.location, heading, self.blockages[heading])
 
     def is_explored(self):
         """
@@ -144,11 +204,109 @@ class MapGraph:
         """
         return (heading + 4) % 8
 
-    def __init__(self, location, heading, prev_loc):
+    def __init__(self, location=None, heading=None, prev_loc=None):
+        self.graph = {}
+        self.locations = {}
+        self.observers = []
+        self.index = None
+        if location != None:
+            origin = Intersection(prev_loc)
+            point = Intersection(location, heading)
+            self.add_intersection(point)
+            self.add_intersection(origin)
+            self.link(point, origin)
+            self.propagate([location, prev_loc])
+
+    def __getstate__(self):
+        """Pickles a MapGraph without its observers, which are tied to the 
+        running program (threads, files, sockets)
+        """
+        return {'graph': self.graph}
+
+    def __setstate__(self, state):
+        """Restores a pickled MapGraph, rebuilding the location index"""
+        self.graph = {}
+        self.locations = {}
+        self.observers = []
+        self.index = None
+        for inters in state['graph']:
+            self.graph[inters] = state['graph'][inters]
+            self.locations[inters.get_location()] = inters
+            inters.observer = self.notify
+
+    def observe(self, callback):
+        """Registers callback to be called with a record tuple each time the map 
+        changes. Records are one of:
+            ("add", location) - an Intersection was added
+            ("lnk", location1, location2) - a street was added between two 
+                                            Intersections
+            ("st", location, heading, status) - a street label changed
+            ("bk", location, heading, status) - a blockage label changed
+        """
+        self.observers.append(callback)
+
+    def ignore(self, callback):
+        """Stops calling a callback registered with observe"""
+        if callback in self.observers:
+            self.observers.remove(callback)
+
+    def notify(self, record):
+        """Passes a change record to all observers of the map"""
+        for callback in self.observers:
+            callback(record)
+
+    def records(self):
+        """Generates the list of change records which would rebuild the 
+        current map from an empty MapGraph
+        """
+        for inters in list(self):
+            yield from inters.records()
+        for inters in list(self):
+            for chile in list(self.adjacent(inters)):
+                if inters.get_location() < chile.get_location():
+                    yield ("lnk", inters.get_location(), chile.get_location())
+
+    def add_intersection(self, inters):
+        """Adds a new Intersection with no streets driven to the graph"""
+        self.graph[inters] = []
+        self.locations[inters.get_location()] = inters
+        inters.observer = self.notify
+        for record in inters.records():
+            self.notify(record)
+
+    def link(self, inters1, inters2):
+        """Records that a street connects two Intersections in the graph"""
+        if inters2 in self.graph[inters1]:
+            return
+        self.graph[inters1].append(inters2)
+        self.graph[inters2].append(inters1)
+        self.notify(("lnk", inters1.get_location(), inters2.get_location()))
 
-        origin = Intersection(prev_loc)
-        point = Intersection(location, heading)
-        self.graph = {point:[origin], origin:[point]}
+    def spatial(self):
+        """Returns the SpatialIndex of the locations of the Intersections in 
+        the graph, building it the first time it is needed
+        """
+        if self.index == None:
+            self.index = SpatialIndex(self)
+        return self.index
+
+    def closest_unexplored(self, dest):
+        """Returns the location of the unexplored intersection closest to dest,
+        or None if every intersection is explored
+        """
+        closest = self.spatial().nearest(dest, 1, unexplored=True)
+        if closest == []:
+            return None
+        return closest[0]
+
+    def adjacent(self, inters):
+        """Returns the list of Intersections connected to inters by driven 
+        streets, blocked or not
+        """
+        return self.graph[inters]
+
+    def __len__(self):
+        return len(self.graph)
 
     def get_graph(self):
         """
@@ -160,7 +318,7 @@ class MapGraph:
         """Prints a list of all the intersections in the graph to the terminal 
         in order to make the available locations apparent to the user.
         """
-        for intersection in self.graph:
+        for intersection in self:
             print(intersection.get_location())
 
     def driven_connection(self, prev_location, location, heading):
@@ -179,12 +337,10 @@ class MapGraph:
         inters = self.get_intersection(location)
         if inters == None:
             inters = Intersection(location, heading)
-            self.graph[inters] = []
+            self.add_intersection(inters)
         inters.set_connection(self.invert_heading(heading), DRV)
-        if prev_inters not in self.graph[inters]:
-            self.graph[inters].append(prev_inters)
-        if inters not in self.graph[prev_inters]:
-            self.graph[prev_inters].append(inters)
+        self.link(inters, prev_inters)
+        self.propagate([prev_location, location])
 
     def block_connection(self, prev_location, location, heading, out):
         """
@@ -226,6 +382,49 @@ class MapGraph:
                    heading: the heading for which no street exists
         """
         self.get_intersection(location).set_connection(heading, NNE)
+        self.propagate([location])
+
+    def propagate(self, locations):
+        """
+        Infers the streets which follow from those known, starting from the 
+        intersections at the given locations and spreading to those whose 
+        streets are inferred: streets never leave an intersection on adjacent 
+        headings, and a street leaving one intersection (or the lack of one) 
+        is a street arriving at the known intersection at its other end (or 
+        the lack of one) on the opposite heading.
+
+        Arguments: locations: the locations of the intersections changed
+        """
+        todo = list(locations)
+        while todo != []:
+            location = todo.pop()
+            inters = self.get_intersection(location)
+            if inters == None:
+                continue
+            for heading in range(8):
+                status = inters.check_connection(heading)
+                if status in [UND, DRV]:
+                    for side in [1, -1]:
+                        if inters.check_connection((heading + side) % 8) == UNK:
+                            inters.set_connection((heading + side) % 8, NNE)
+                other = self.get_intersection((
+                    location[0] + heading_map[heading][0],
+                    location[1] + heading_map[heading][1]))
+                if other == None:
+                    continue
+                status = inters.check_connection(heading)
+                opposite = self.invert_heading(heading)
+                theirs = other.check_connection(opposite)
+                if ((status != UNK and theirs == UNK) or 
+                    (status == DRV and theirs == UND)):
+                    other.set_connection(opposite, status)
+                    todo.append(other.get_location())
+                elif ((status == UNK and theirs != UNK) or 
+                      (status == UND and theirs == DRV)):
+                    inters.set_connection(heading, theirs)
+                    todo.append(location)
+                if DRV in [status, theirs]:
+                    self.link(inters, other)
 
 
     def markoff(self, location, angle, start_head, direction, out, responses, resp_flag):
@@ -253,6 +452,7 @@ class MapGraph:
             return False
         if inters.check_connection(heading) != DRV:
             inters.set_connection(heading, UND)
+        self.propagate([location])
         return True
 
     def clear_blockages(self):
@@ -260,39 +460,33 @@ class MapGraph:
         blockages are known. This will cause the bot to have to re-explore the
         map to determine the blockage status of anything undriven.
         """
-        for inters in self.graph:
+        for inters in self:
             inters.clear_blockages()
 
     def contains(self, location):
         """
         Returns true if an intersection location is in the map, false otherwise
         """
-        for intersection in self.graph:
-            if intersection.get_location() == location:
-                return True
-        return False
+        return location in self.locations
 
     def is_complete(self):
         """
         Returns true if all intersections in the map are fully explored, 
         false otherwise
         """
-        for intersection in self.graph:
+        for intersection in self:
             if not intersection.is_explored():
                 # make an exception to origin (0,0) if its heading 0 is blocked
                 if not intersection.location == (0, 0) or intersection.check_blockage(0) != BLK:
                     return False
-        return len(self.graph) != 0 
+        return len(self) != 0 
 
     def get_intersection(self, location):
         """
         Given a location, extracts the corresponding intersection object 
         from the graph
         """
-        for intersection in self.graph:
-            if location == intersection.get_location():
-                return intersection
-        return None
+        return self.locations.get(location)
 
     def neighbors(self, inters):
         """
@@ -304,7 +498,7 @@ class MapGraph:
         
         unblocked_neighbors = []
         loc2 = inters.get_location()
-        for chile in self.graph[inters]:
+        for chile in self.adjacent(inters):
             # loc2 = inters.get_location()
             # loc1 = chile.get_location()
             # relative_loc = (loc2[0] - loc1[0], loc2[1] - loc1[1])
@@ -321,7 +515,7 @@ class MapGraph:
     def unexp_inters(self):
         """ Returns a list of the locations of all unexplored intersections """
         unexp = []
-        for inters in self.graph:
+        for inters in self:
             if not inters.is_explored():
                 unexp.append(inters.get_location())
         return unexp
@@ -356,9 +550,8 @@ def unb_head(graph, location):
 
 def unk_dir(graph, inter, heading):
     """ returns the direction to turn to find the nearest unknown region """
-    """Determines whether turning left or right is better for exploring"""
     l_list = [inter.check_connection((heading + i) % 8) for i in range(4)]
-    r_list = [inter.check_connection((heading + i) % 8) for i in range(4)]
+    r_list = [inter.check_connection((heading - i) % 8) for i in range(4)]
     if UNK in l_list:
         if UNK in r_list:
             if r_list.index(UNK) < l_list.index(UNK):
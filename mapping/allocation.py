@@ -0,0 +1,89 @@
+"""
+This module implements the allocation of the frontier of a map shared by
+several robots, so that each robot explores a different unexplored
+intersection instead of all of them racing to the nearest one.
+
+Authors: Edward Speer, Garrett Knuf
+Date: 6/18/23
+"""
+
+from math import inf
+from constants import BLK
+from mapping.planning import Djikstra
+
+
+class FrontierAllocator:
+    """ Assigns the unexplored intersections (the frontier) of a shared map to
+    robots by auction. Each robot bids its path cost to each frontier
+    intersection, and the lowest bid of all is won, until every robot has a
+    frontier intersection or none are left. Assignments hold until they go
+    stale: when a robot's intersection is explored (by it or any other
+    robot), when a robot joins, or when a new blockage appears, the whole
+    frontier is auctioned again.
+    """
+
+    def __init__(self):
+        self.graph = None
+        self.robots = {}
+        self.targets = {}
+        self.stale = True
+
+    def attach(self, graph):
+        """Starts allocating the frontier of graph in place of any previously
+        attached graph
+        """
+        if self.graph != None:
+            self.graph.ignore(self.record)
+        self.graph = graph
+        self.stale = True
+        graph.observe(self.record)
+
+    def record(self, record):
+        """MapGraph observer noting when a new blockage calls for a new
+        auction
+        """
+        if record[0] == "bk" and record[3] == BLK:
+            self.stale = True
+
+    def move(self, robot, location):
+        """Records the location of a robot, adding it if it is new"""
+        if robot not in self.robots:
+            self.stale = True
+        self.robots[robot] = location
+
+    def remove(self, robot):
+        """Removes a robot from the allocation"""
+        if robot in self.robots:
+            del self.robots[robot]
+            self.targets.pop(robot, None)
+            self.stale = True
+
+    def target(self, robot):
+        """Returns the frontier intersection location assigned to a robot, or
+        None if there is none for it
+        """
+        target = self.targets.get(robot)
+        if target != None and self.graph.get_intersection(target).is_explored():
+            self.stale = True
+        if self.stale:
+            self.auction()
+        return self.targets.get(robot)
+
+    def auction(self):
+        """Assigns the frontier intersections to the robots by auction"""
+        frontier = self.graph.unexp_inters()
+        bids = []
+        for robot, location in self.robots.items():
+            djik = Djikstra(self.graph, location)
+            djik.run()
+            for inters in frontier:
+                if djik.get_cost(inters) != inf:
+                    bids.append((djik.get_cost(inters), robot, inters))
+        bids.sort()
+        self.targets = {}
+        taken = set()
+        for cost, robot, inters in bids:
+            if robot not in self.targets and inters not in taken:
+                self.targets[robot] = inters
+                taken.add(inters)
+        self.stale = False
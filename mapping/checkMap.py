@@ -7,63 +7,84 @@ Date: 6/3/23
 """
 
 import constants as const
+import mapping.heading as hd
 from interface.ui_util import post, get_resp, init_state, set_state
 
 
 def check_head(direction, graph, location, heading, orig_heading, ang, out, 
-               responses, resp_flag):
+               responses, resp_flag, passes=0, turns=None):
     """ Checks to make sure a turned angle was consistent with the map, 
-    and if it isn't, corrects the heading to a consistent heading.
+    and if it isn't, corrects the heading to the most likely heading given the 
+    angle and the streets known at the intersection, asking for the true 
+    heading only if that is not likely enough. If passes streets were passed 
+    in the turn, ang is the angle turned from the last of them. A turn whose 
+    heading is confirmed is fit by the TurnRates turns, if given. Only the
+    known streets of the map or the operator confirm a heading; a heading
+    believed from the turn's own timing is not fit, or misread turns would 
+    pull the fit toward misreading more.
     """
     inters = graph.get_intersection(location)
-    if inters.check_connection(heading) == const.NNE:
+    belief = hd.turn_posterior(inters, orig_heading, direction, ang, passes)
+    if belief == None:
+        return (heading, ang)
+    best, prob = hd.most_likely(belief)
+    confirmed = hd.map_heading(inters, orig_heading, direction) == best
+    if best != heading:
         post("Norman can't do math >:| Wrong angle, f***!", out)
-        increment = const.dirMap[direction[0]][1]
-        orig_heading = (orig_heading + increment) % 8
-        from_orig = 1
-        while inters.check_connection(orig_heading) == const.NNE:
-            from_orig += 1
-            orig_heading = (orig_heading + increment) % 8
-        heading = orig_heading
-        ang = from_orig * 45
-        if inters.check_connection(heading) == const.UNK:
+        heading = best
+        if prob < const.HEAD_CONFIDENCE:
+            confirmed = True
             post(f"Correcting error... am I facing heading {heading} (y/n)?", out)
             if(get_resp(responses, out, resp_flag).upper() == "N"):
                 post("Input true heading: ", out)
                 heading = int(get_resp(responses, out, resp_flag))
-                while orig_heading != heading:
-                    orig_heading = (orig_heading + increment) % 8
-                    from_orig += 1
-                ang = from_orig * 45
+        increment = const.dirMap[direction[0]][1]
+        ang = ((increment * (heading - orig_heading)) % 8) * 45
+    if turns != None:
+        increment = const.dirMap[direction[0]][1]
+        steps = (increment * (heading - orig_heading)) % 8
+        turns.confirm(steps if confirmed and passes == 0 else None)
     return (heading, ang)
 
 
-def check_end(sensor, graph, location, heading, out, responses, resp_flag, state):
+def check_end(sensor, graph, prev_loc, location, heading, out, responses, 
+              resp_flag, state):
     """ Checks the street exploration status of the road at the far end of an 
-    intersection when the robot arrives at an intersection, check for 
-    consistency, and updates the intersection state in the graph.
+    intersection when the robot arrives at an intersection from prev_loc, 
+    check for consistency, and records the street driven and the 
+    intersection state in the graph. If the reading conflicts with the map, 
+    the heading driven (and so the location) is corrected to the most likely 
+    one, asking for the true state only if that is not likely enough, before 
+    the street driven is recorded. Returns the location and heading.
     """
-    if sensor.read() == (0, 0, 0):
-        if graph.get_intersection(location).check_connection(heading) not in [const.UNK, const.NNE]:
-            post("Incorrect angle measured! Help!", out)
+    seen = sensor.read() != (0, 0, 0)
+    inters = graph.get_intersection(location)
+    known = inters.check_connection(heading) if inters != None else const.UNK
+    if (not seen and known not in [const.UNK, const.NNE]) or (
+        seen and known == const.NNE):
+        post("Incorrect angle measured! Help!", out)
+        prev_loc = (location[0] - const.heading_map[heading][0], 
+                    location[1] - const.heading_map[heading][1])
+        belief = hd.arrival_posterior(graph, prev_loc, heading, seen)
+        if belief != None and hd.most_likely(belief)[1] >= const.HEAD_CONFIDENCE:
+            heading = hd.most_likely(belief)[0]
+            location = (prev_loc[0] + const.heading_map[heading][0], 
+                        prev_loc[1] + const.heading_map[heading][1])
+            post(f"Corrected to {location} heading {heading}", out)
+        else:
             init_state(out, responses, resp_flag, state)
             location = state[0]
             heading = state[1]
             prev_loc = (location[0] - const.heading_map[heading][0], 
             location[1] - const.heading_map[heading][1])
-            set_state(state, location, heading)
-            graph.driven_connection(prev_loc, location, heading)
+        set_state(state, location, heading)
+    if prev_loc != location:
+        graph.driven_connection(prev_loc, location, heading)
+    if not seen:
         graph.no_connection(location, heading)
     else:
         inter = graph.get_intersection(location)
-        if inter.check_connection(heading) == const.NNE:
-            post("Incorrect angle measured! Help!", out)
-            init_state(out, responses, resp_flag, state)
-            location = state[0]
-            heading = state[1]
-            prev_loc = (location[0] - const.heading_map[heading][0], 
-            location[1] - const.heading_map[heading][1])
-            graph.driven_connection(prev_loc, location, heading)
-            set_state(state, location, heading)
         if inter.check_connection(heading) != const.DRV:
-            graph.get_intersection(location).set_connection(heading, const.UND)
+            inter.set_connection(heading, const.UND)
+            graph.propagate([location])
+    return (location, heading)
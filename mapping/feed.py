@@ -0,0 +1,69 @@
+"""
+This module implements the MapFeed, which hands the changes made to the
+robot's map by the robot thread to other threads (such as the ROS thread)
+which publish them.
+
+Authors: Edward Speer, Garrett Knuf
+Date: 6/15/23
+"""
+
+from collections import deque
+
+
+class MapFeed:
+    """ Observes the map being built by the robot thread and queues each change
+    record (see MapGraph.observe) for a consumer on another thread. The
+    consumer registers a wake up callback with listen, which is called on the
+    robot thread whenever records are queued, and then drains the queue on
+    its own thread. Consumers that need the whole map (such as those that
+    joined late) take a snapshot.
+    """
+
+    def __init__(self):
+        self.graph = None
+        self.pending = deque()
+        self.listeners = []
+        self.epoch = 0
+
+    def attach(self, graph):
+        """Starts feeding the changes to graph in place of any previously
+        attached graph. The epoch counts attached graphs, so that consumers
+        know to take a new snapshot.
+        """
+        if self.graph != None:
+            self.graph.ignore(self.record)
+        self.graph = graph
+        self.pending.clear()
+        self.epoch += 1
+        graph.observe(self.record)
+        self.wake()
+
+    def listen(self, callback):
+        """Registers a callback to be called when there are records to drain"""
+        self.listeners.append(callback)
+
+    def wake(self):
+        """Calls the listeners to let them know there is something to drain"""
+        for callback in self.listeners:
+            callback()
+
+    def record(self, record):
+        """MapGraph observer which queues a change record"""
+        self.pending.append(record)
+        self.wake()
+
+    def drain(self):
+        """Removes and returns the list of all queued change records"""
+        records = []
+        while len(self.pending) != 0:
+            records.append(self.pending.popleft())
+        return records
+
+    def snapshot(self):
+        """Returns the list of change records which rebuild the whole map.
+        Records still queued were made before the snapshot finished, so
+        applying them after it still gives the current map.
+        """
+        if self.graph == None:
+            return []
+        return list(self.graph.records())
@@ -0,0 +1,115 @@
+"""
+This module implements the frontier scorers which choose the unexplored
+intersection explore mode drives to next. A scorer is any object with a
+choose(graph, location, heading) method returning the location of an
+unexplored intersection (or None), so that auto_djik can be given whichever
+one suits the floor.
+
+Authors: Edward Speer, Garrett Knuf
+Date: 6/19/23
+"""
+
+from math import inf
+from constants import UNK, UND, BLK, DRIVE_T, SCAN_T, STREET_PRIOR, \
+                      heading_map
+from mapping.planning import Djikstra, find_unexplored, turn_time, layouts
+
+#Expected new streets found by exploring the unknown headings of each street
+#layout seen so far
+gain_table = {}
+
+
+def unknown_gain(streets, prior=STREET_PRIOR):
+    """Returns the expected number of streets on the unknown headings of an
+    intersection with the given street labels. Each unknown heading has a
+    street with the prior probability (one for all headings, or a tuple of 
+    one per heading), given that streets never exist on adjacent headings.
+    """
+    key = (tuple(streets[heading] for heading in range(8)), prior)
+    if key in gain_table:
+        return gain_table[key]
+    total = 0
+    expected = 0
+    for layout, weight in layouts(streets, prior):
+        total += weight
+        expected += weight * len(layout)
+    gain_table[key] = expected / total if total != 0 else 0
+    return gain_table[key]
+
+
+class FirstFound:
+    """ Chooses the first unexplored intersection found by find_unexplored's
+    depth first search
+    """
+
+    def choose(self, graph, location, heading):
+        """Returns the unexplored intersection to explore next"""
+        return find_unexplored(graph, location, [])
+
+
+class InfoGain:
+    """ Chooses the unexplored intersection with the most new streets
+    expected to be found there per second spent reaching and exploring it.
+    Streets found are the undriven streets of the intersection plus the
+    streets expected on its unknown headings, and time is the time to drive
+    there (turning onto the path first) plus the time to sweep its unknown
+    headings.
+
+    Inputs: prior - the probability an unknown heading has a street
+            predictor - a StreetPrior predicting each unknown heading in place
+                      of prior, if any
+    """
+
+    def __init__(self, prior=STREET_PRIOR, predictor=None):
+        self.prior = prior
+        self.predictor = predictor
+
+    def gain(self, inters, graph=None):
+        """Returns the number of new streets expected at an intersection"""
+        undriven = 0
+        for heading in range(8):
+            if (inters.check_connection(heading) == UND and
+                inters.check_blockage(heading) != BLK):
+                undriven += 1
+        prior = self.prior
+        if self.predictor != None and graph != None:
+            #Round the predictions so that gains stay cached
+            prior = tuple(round(prob, 2) for prob in 
+                          self.predictor.probs(graph, inters.get_location()))
+        return undriven + unknown_gain(inters.get_streets(), prior)
+
+    def cost(self, djik, location, heading, target):
+        """Returns the time to reach and explore target from location, given
+        a Djikstra run rooted at location
+        """
+        seconds = djik.get_cost(target) * DRIVE_T
+        if UNK in djik.graph.get_intersection(target).get_streets().values():
+            seconds += SCAN_T
+        #Follow the path back to location to find the heading it leaves on
+        step = target
+        back = None
+        while step != location and djik.get_dir(step) != None:
+            back = djik.get_dir(step)
+            step = (step[0] + heading_map[back][0],
+                    step[1] + heading_map[back][1])
+        if back != None:
+            seconds += turn_time(heading, (back + 4) % 8)
+        return seconds
+
+    def choose(self, graph, location, heading):
+        """Returns the unexplored intersection to explore next"""
+        djik = Djikstra(graph, location)
+        djik.run()
+        best = None
+        best_score = None
+        for target in graph.unexp_inters():
+            if target == location or djik.get_cost(target) == inf:
+                continue
+            seconds = self.cost(djik, location, heading, target)
+            score = (self.gain(graph.get_intersection(target), graph) / 
+                     seconds,
+                     -seconds)
+            if best_score == None or score > best_score:
+                best = target
+                best_score = score
+        return best
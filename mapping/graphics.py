@@ -46,7 +46,7 @@ class Visualizer:
         blockages = []
         for intersection in self.graph:
             start = intersection.get_location()
-            for conn in self.graph.get_graph()[intersection]:
+            for conn in self.graph.adjacent(intersection):
                 conn_loc = conn.get_location()
                 x_edges.append([start[0], conn_loc[0]])
                 y_edges.append([start[1], conn_loc[1]])
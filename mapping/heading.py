@@ -0,0 +1,120 @@
+"""
+This module estimates the robot's heading as a probability over the 8
+headings, fusing the angle a turn was timed at, the streets passed during the
+turn, and the streets the map knows leave the intersection, so that an angle
+read wrong can be corrected without asking for the true heading whenever the
+map makes the true heading clear.
+
+Authors: Edward Speer, Garrett Knuf
+Date: 6/19/23
+"""
+
+from itertools import product
+from math import exp
+import constants as const
+from constants import heading_map, UNK, UND, DRV
+
+
+def street_prob(inters, heading):
+    """Returns the probability a street leaves an intersection on heading"""
+    if inters == None or inters.check_connection(heading) == UNK:
+        return const.STREET_PRIOR
+    if inters.check_connection(heading) in [UND, DRV]:
+        return 1
+    return 0
+
+
+def map_heading(inters, orig_heading, direction, passes=0):
+    """Returns the heading the map alone says a turn from orig_heading in 
+    direction stops at, passing passes streets and stopping on the next: that
+    is when every heading up to it is known, so no timing is needed. Returns 
+    None if an unknown heading comes first.
+    """
+    if inters == None:
+        return None
+    sign = const.dirMap[direction[0]][1]
+    for steps in range(1, 9):
+        heading = (orig_heading + sign * steps) % 8
+        status = inters.check_connection(heading)
+        if status == UNK:
+            return None
+        if status in [UND, DRV]:
+            if passes == 0:
+                return heading
+            passes -= 1
+    return None
+
+
+def step_likelihood(steps, measured):
+    """Returns the likelihood of a turn of steps 45 degree steps being timed
+    at measured steps. calculate_angle reads at most 180 degrees.
+    """
+    return exp(-(min(steps, 4) - measured) ** 2 / (2 * const.TURN_SIGMA ** 2))
+
+
+def normalize(belief):
+    """Returns the belief scaled to sum to 1, or None if it is all 0"""
+    total = sum(belief)
+    if total == 0:
+        return None
+    return [p / total for p in belief]
+
+
+def turn_posterior(inters, orig_heading, direction, ang, passes=0):
+    """Returns the probability of facing each heading after turning from
+    orig_heading in direction, passing passes streets and stopping on the next
+    street, with the turn from the last street passed timed at ang degrees.
+    Returns None if no heading is consistent with the map.
+    """
+    sign = const.dirMap[direction[0]][1]
+    measured = abs(ang) / 45
+    belief = [0] * 8
+    for steps in range(1, 9):
+        heading = (orig_heading + sign * steps) % 8
+        end = street_prob(inters, heading)
+        if end == 0:
+            continue
+        between = [street_prob(inters, (orig_heading + sign * i) % 8)
+                   for i in range(1, steps)]
+
+        #Sum over which of the headings between have streets, as they must
+        # hold exactly the streets passed
+        for streets in product([0, 1], repeat=len(between)):
+            if sum(streets) != passes:
+                continue
+            prob = end
+            for i in range(len(between)):
+                prob *= between[i] if streets[i] else 1 - between[i]
+            if prob == 0:
+                continue
+            last = max([i + 1 for i in range(len(streets)) if streets[i]],
+                       default=0)
+            belief[int(heading)] += prob * step_likelihood(steps - last,
+                                                           measured)
+    return normalize(belief)
+
+
+def arrival_posterior(graph, prev_loc, heading, seen):
+    """Returns the probability of having driven each heading from prev_loc
+    when the heading driven was believed to be heading, given whether a street
+    was seen continuing ahead on arrival. Returns None if no heading is
+    consistent with the map.
+    """
+    belief = [0] * 8
+    for driven in range(8):
+        off = min((driven - heading) % 8, (heading - driven) % 8)
+        prob = step_likelihood(off, 0)
+        prob *= street_prob(graph.get_intersection(prev_loc), driven)
+        location = (prev_loc[0] + heading_map[driven][0],
+                    prev_loc[1] + heading_map[driven][1])
+        ahead = street_prob(graph.get_intersection(location), driven)
+        if not seen:
+            ahead = 1 - ahead
+        belief[driven] = prob * max(ahead, const.IR_ERR)
+    return normalize(belief)
+
+
+def most_likely(belief):
+    """Returns the most likely heading of a belief and its probability"""
+    best = belief.index(max(belief))
+    return (best, belief[best])
@@ -0,0 +1,305 @@
+"""
+This module implements a write-ahead journal of the changes made to the map
+explored by the robot for ME/CS/EE 129 Spring '23. Each change to a MapGraph
+is appended to a journal file as it happens, and the journal is periodically
+compacted into a snapshot of the whole map. After a crash, the map is
+recovered by loading the snapshot and replaying the journal over it.
+
+All file IO happens on a writer thread, so recording a change from the robot
+thread only costs putting the change record on a queue.
+
+Authors: Edward Speer, Garrett Knuf
+Date: 6/12/23
+"""
+
+import os
+import time
+import queue
+import shutil
+import tempfile
+import threading
+from random import Random
+from constants import CONDITIONS, STREET_CONDITIONS, JOURNAL_PATH, \
+                      SNAPSHOT_PATH, JOURNAL_COMPACT, heading_map, UND, BLK, UNB
+from mapping.MapGraph import MapGraph, Intersection, complete
+import mapping.mapfile as mapfile
+from interface.ui_util import post
+
+
+def encode(record):
+    """Encodes a MapGraph change record (see MapGraph.observe) as a single
+    line of text for the journal file
+    """
+    op = record[0]
+    if op == "add":
+        return f"add {record[1][0]} {record[1][1]}"
+    if op == "lnk":
+        return f"lnk {record[1][0]} {record[1][1]} {record[2][0]} {record[2][1]}"
+    if op == "st":
+        return (f"st {record[1][0]} {record[1][1]} {record[2]} " +
+                f"{CONDITIONS.index(record[3])}")
+    if op == "bk":
+        return (f"bk {record[1][0]} {record[1][1]} {record[2]} " +
+                f"{STREET_CONDITIONS.index(record[3])}")
+    raise Exception("journal.encode: Invalid record")
+
+
+def decode(line):
+    """Decodes a line of the journal file into a MapGraph change record.
+    Raises ValueError if the line is not a complete record.
+    """
+    fields = line.split()
+    if len(fields) == 0:
+        raise ValueError("journal.decode: Empty record")
+    nums = [int(field) for field in fields[1:]]
+    op = fields[0]
+    if op == "add" and len(nums) == 2:
+        return ("add", (nums[0], nums[1]))
+    if op == "lnk" and len(nums) == 4:
+        return ("lnk", (nums[0], nums[1]), (nums[2], nums[3]))
+    if op == "st" and len(nums) == 4:
+        return ("st", (nums[0], nums[1]), nums[2], CONDITIONS[nums[3]])
+    if op == "bk" and len(nums) == 4:
+        return ("bk", (nums[0], nums[1]), nums[2], STREET_CONDITIONS[nums[3]])
+    raise ValueError("journal.decode: Invalid record " + line)
+
+
+def apply(graph, record):
+    """Applies a change record to a MapGraph. Applying a record is
+    idempotent, so replaying records the graph already contains is harmless.
+    """
+    op = record[0]
+    if op == "add":
+        if not graph.contains(record[1]):
+            graph.add_intersection(Intersection(record[1]))
+    elif op == "lnk":
+        graph.link(graph.get_intersection(record[1]),
+                   graph.get_intersection(record[2]))
+    elif op == "st":
+        graph.get_intersection(record[1]).set_connection(record[2], record[3])
+    elif op == "bk":
+        graph.get_intersection(record[1]).set_blockage(record[2], record[3],
+                                                       None)
+
+
+def recover(path=JOURNAL_PATH, snap_path=SNAPSHOT_PATH):
+    """Rebuilds the map of the last run from the snapshot and the journal.
+    A torn record at the end of the journal (from a crash mid-write) ends the
+    replay. Returns None if there is nothing to recover.
+    """
+    if not os.path.exists(path) and not os.path.exists(snap_path):
+        return None
+    graph = MapGraph()
+    if os.path.exists(snap_path):
+        graph = mapfile.load(snap_path)
+    if os.path.exists(path):
+        with open(path, 'r') as journal:
+            for line in journal:
+                try:
+                    apply(graph, decode(line))
+                except (ValueError, IndexError, AttributeError):
+                    break
+    return graph
+
+
+class MapJournal:
+    """ Records every change made to an attached MapGraph to the journal file
+    on a background writer thread. The writer keeps its own copy of the map
+    built from the records it has written, and compacts the journal into a
+    snapshot of that copy every compact records, so neither journaling nor
+    compaction ever blocks the robot thread.
+
+    Inputs: path - the journal file
+            snap_path - the snapshot file the journal is compacted into
+            compact - the number of records between compactions
+            out - the GUI output errors writing are posted to, if any
+    """
+
+    def __init__(self, path=JOURNAL_PATH, snap_path=SNAPSHOT_PATH,
+                 compact=JOURNAL_COMPACT, out=None):
+        self.path = path
+        self.snap_path = snap_path
+        self.compact = compact
+        self.out = out
+        self.graph = None
+        self.q = queue.Queue()
+        if os.path.dirname(path) != '':
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.thread = threading.Thread(name="JournalThread", target=self.run,
+                                       daemon=True)
+        self.thread.start()
+
+    def attach(self, graph):
+        """Starts journaling the changes to graph in place of any previously
+        attached graph. The journal is restarted from a snapshot of graph.
+        """
+        if self.graph != None:
+            self.graph.ignore(self.record)
+        self.graph = graph
+        self.q.put(("reset", list(graph.records())))
+        graph.observe(self.record)
+
+    def record(self, record):
+        """MapGraph observer which queues a change record to be journaled"""
+        self.q.put(("rec", record))
+
+    def save(self, filename):
+        """Queues a save of the map as of all changes recorded so far. Maps
+        are saved as map files if filename has the map file extension, and as
+        pickles otherwise.
+        """
+        self.q.put(("save", filename))
+
+    def flush(self):
+        """Waits until every queued record has been written to the journal"""
+        self.q.join()
+
+    def close(self):
+        """Writes all queued records and stops the writer thread"""
+        if self.graph != None:
+            self.graph.ignore(self.record)
+        self.q.put(None)
+        self.thread.join()
+
+    def run(self):
+        """Writer thread loop. Appends queued records to the journal file,
+        flushing whenever the queue runs dry so that bursts of changes are
+        written together, and compacts the journal when it grows too long.
+        An error writing one item is reported and the thread goes on to the
+        next, so that a failed save does not stop the journal.
+        """
+        journal = open(self.path, 'a')
+        shadow = MapGraph()
+        count = 0
+        while True:
+            item = self.q.get()
+            if item == None:
+                self.q.task_done()
+                break
+            try:
+                if item[0] == "rec":
+                    journal.write(encode(item[1]) + "\n")
+                    apply(shadow, item[1])
+                    count += 1
+                elif item[0] == "reset":
+                    shadow = MapGraph()
+                    for record in item[1]:
+                        apply(shadow, record)
+                    count = self.compact
+                elif item[0] == "save":
+                    if item[1].endswith(mapfile.MAP_EXT):
+                        mapfile.save(shadow, item[1])
+                    else:
+                        complete(shadow, item[1])
+                if count >= self.compact:
+                    count = 0
+                    journal = self.compact_into(journal, shadow)
+                if self.q.empty():
+                    journal.flush()
+            except Exception as ex:
+                self.report(item, ex)
+                if journal.closed:
+                    journal = open(self.path, 'a')
+            finally:
+                self.q.task_done()
+        journal.close()
+
+    def report(self, item, ex):
+        """Reports an error writing a queued item to the GUI, if any"""
+        message = f"Journal failed to {item[0]}: {ex!r}"
+        if self.out != None:
+            post(message, self.out)
+        else:
+            print(message)
+
+    def compact_into(self, journal, shadow):
+        """Writes the snapshot of the map, then empties the journal. Returns
+        the reopened journal file.
+        """
+        journal.close()
+        mapfile.save(shadow, self.snap_path)
+        return open(self.path, 'w')
+
+
+def random_edits(num, seed=129):
+    """Generates a list of num random map edits made by a robot wandering a
+    grid, as calls to be made on a MapGraph. Used for benchmarking.
+    """
+    rand = Random(seed)
+    edits = []
+    location = (0, 0)
+    heading = 0
+    while len(edits) < num:
+        choice = rand.random()
+        if choice < .4:
+            nxt = (location[0] + heading_map[heading][0],
+                   location[1] + heading_map[heading][1])
+            edits.append(("driven_connection", location, nxt, heading))
+            location = nxt
+        elif choice < .6:
+            edits.append(("no_connection", location, rand.randrange(8)))
+        elif choice < .7:
+            edits.append(("undriven", location, rand.randrange(8)))
+        elif choice < .85:
+            edits.append(("block", location, rand.randrange(8)))
+        else:
+            edits.append(("unblock", location, rand.randrange(8)))
+        heading = rand.choice([0, 2, 4, 6])
+    return edits
+
+
+def make_edits(graph, edits):
+    """Makes a list of edits generated by random_edits on graph"""
+    for edit in edits:
+        if edit[0] == "driven_connection":
+            graph.driven_connection(edit[1], edit[2], edit[3])
+        elif edit[0] == "no_connection":
+            graph.no_connection(edit[1], edit[2])
+        elif edit[0] == "undriven":
+            if graph.get_intersection(edit[1]).check_connection(edit[2]) != UND:
+                graph.get_intersection(edit[1]).set_connection(edit[2], UND)
+        else:
+            status = BLK if edit[0] == "block" else UNB
+            graph.get_intersection(edit[1]).set_blockage(edit[2], status, None)
+
+
+def bench(num=100000):
+    """Benchmarks journaling num map edits: the cost of the edits to the robot
+    thread with and without a journal attached, the time for the writer
+    thread to catch up, and the time to recover the map after a crash.
+    """
+    edits = random_edits(num)
+    tempdir = tempfile.mkdtemp()
+    path = os.path.join(tempdir, 'journal.log')
+    snap_path = os.path.join(tempdir, 'snapshot' + mapfile.MAP_EXT)
+    try:
+        graph = MapGraph((0, 0), 0, (0, -1))
+        start = time.perf_counter()
+        make_edits(graph, edits)
+        bare = time.perf_counter() - start
+
+        graph = MapGraph((0, 0), 0, (0, -1))
+        journal = MapJournal(path, snap_path)
+        journal.attach(graph)
+        journal.flush()
+        start = time.perf_counter()
+        make_edits(graph, edits)
+        journaled = time.perf_counter() - start
+        journal.flush()
+        drained = time.perf_counter() - start
+        journal.close()
+
+        start = time.perf_counter()
+        recovered = recover(path, snap_path)
+        recovery = time.perf_counter() - start
+        same = sorted(recovered.records()) == sorted(graph.records())
+
+        print(f"{num} edits, {len(graph)} intersections")
+        print(f"Edits without journal:  {bare:8.3f} s")
+        print(f"Edits with journal:     {journaled:8.3f} s " +
+              f"({1e6 * (journaled - bare) / num:.2f} us/edit on robot thread)")
+        print(f"Journal written after:  {drained:8.3f} s")
+        print(f"Recovery:               {recovery:8.3f} s " +
+              f"({os.path.getsize(path)} byte journal, matches: {same})")
+    finally:
+        shutil.rmtree(tempdir)
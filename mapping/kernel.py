@@ -0,0 +1,303 @@
+"""
+This module is the table driven kernel of the decisions made at each
+intersection: which way to turn to face a heading, to find an undriven,
+unknown, or unblocked street, or the nearest street, and which undriven
+street to explore. The decision functions of planning and MapGraph build
+lists of string labels on every call; here each decision is one lookup in a
+table indexed by the robot's heading and a bit mask of the headings with the
+labels it depends on, taken from the packed state Intersection.pack keeps.
+
+The tables are generated by evaluating the list based functions on every
+mask, so they decide exactly as those do, which check() confirms.
+
+Authors: Edward Speer, Garrett Knuf
+Date: 6/19/23
+"""
+
+import time
+import constants as const
+from constants import CONDITIONS, UNK, UND, NNE, BLK, UNB
+from mapping.MapGraph import Intersection, unk_dir as list_unk_dir
+import mapping.planning as pln
+
+#Bit masks of the headings with each street label, by the street code packed
+#by Intersection.pack
+mask_table = {}
+
+#Number of headings set in each 8 bit mask
+POPCOUNT = [bin(mask).count('1') for mask in range(256)]
+
+
+def label_masks(code):
+    """Returns the masks of the headings labeled unknown, undriven, none and
+    driven in a packed street code
+    """
+    if code not in mask_table:
+        masks = [0, 0, 0, 0]
+        for heading in range(8):
+            masks[(code >> (2 * heading)) & 3] |= 1 << heading
+        mask_table[code] = tuple(masks)
+    return mask_table[code]
+
+
+def between(heading, next_h, sign):
+    """Returns the mask of the headings passed turning from heading to next_h
+    the way of sign
+    """
+    mask = 0
+    for i in range(1, (sign * (next_h - heading)) % 8):
+        mask |= 1 << ((heading + sign * i) % 8)
+    return mask
+
+
+def labeled(mask, label, other=NNE):
+    """Returns an Intersection with the headings in mask labeled label and the
+    rest labeled other
+    """
+    inters = Intersection(None)
+    for heading in range(8):
+        inters.streets[heading] = label if mask & (1 << heading) else other
+    return inters
+
+
+def generate():
+    """Builds the decision tables by evaluating the list based decision
+    functions on an Intersection with every mask of the labels they read.
+    Each table but UNX is indexed by heading << 8 | mask.
+    """
+    tables = {"UNX": [], "UNEX": [], "NEAREST": [], "UNB": [], "UNK": [],
+              "BETWEEN": [], "TO_HEAD": []}
+    for mask in range(256):
+        tables["UNX"].append(pln.unx_dir(labeled(mask, UND)))
+    for heading in range(8):
+        for mask in range(256):
+            tables["UNEX"].append(pln.l_r_unex(labeled(mask, UND), heading))
+            tables["NEAREST"].append(pln.l_r_nearest_rd(labeled(mask, UND),
+                                                        heading))
+            unblocked = labeled(0, UND)
+            for head in range(8):
+                if not mask & (1 << head):
+                    unblocked.blockages[head] = BLK
+            tables["UNB"].append(pln.l_r_unb(unblocked, heading))
+            tables["UNK"].append(list_unk_dir(None, labeled(mask, UNK),
+                                              heading))
+
+    #to_head times each way of turning by the steps turned and the streets
+    # stopped at, so its table is indexed by the steps turned left and the
+    # stops each way, with None where it breaks a tie by l_r_unex
+    for heading in range(8):
+        for next_h in range(8):
+            tables["BETWEEN"].append((between(heading, next_h, 1),
+                                      between(heading, next_h, -1)))
+    for steps in range(8):
+        for left in range(16):
+            for right in range(16):
+                times = {}
+                for direction, turned, stops in [("LEFT", steps, left),
+                                                 ("RIGHT", -steps % 8, right)]:
+                    times[direction] = (turned * const.TURN_T +
+                                        stops * const.TURN_STOP_T
+                                        if turned != 0 else 0)
+                if times["LEFT"] < times["RIGHT"]:
+                    tables["TO_HEAD"].append("LEFT")
+                elif times["RIGHT"] < times["LEFT"]:
+                    tables["TO_HEAD"].append("RIGHT")
+                elif steps == 4:
+                    tables["TO_HEAD"].append(None)
+                else:
+                    tables["TO_HEAD"].append("LEFT" if steps <= 4 else "RIGHT")
+    return tables
+
+
+TABLES = generate()
+UNX = TABLES["UNX"]
+UNEX = TABLES["UNEX"]
+NEAREST = TABLES["NEAREST"]
+UNB_DIR = TABLES["UNB"]
+UNK_DIR = TABLES["UNK"]
+BETWEEN = TABLES["BETWEEN"]
+TO_HEAD = TABLES["TO_HEAD"]
+
+
+def unx_dir(inter):
+    """Returns a heading which needs to be explored for a given intersection"""
+    code, blocked = inter.pack()
+    return UNX[label_masks(code)[1] & ~blocked & 0xff]
+
+
+def l_r_unex(inter, heading):
+    """Determines whether turning left or right is better for exploring"""
+    return UNEX[heading << 8 | label_masks(inter.pack()[0])[1]]
+
+
+def l_r_nearest_rd(inter, heading):
+    """Determines whether turning left or right if better for finding nearest
+    road
+    """
+    masks = label_masks(inter.pack()[0])
+    return NEAREST[heading << 8 | masks[1] | masks[3]]
+
+
+def l_r_unb(inter, heading):
+    """Determines whether left or right is better for finding an unblocked
+    intersection
+    """
+    return UNB_DIR[heading << 8 | (~inter.pack()[1] & 0xff)]
+
+
+def unk_dir(inter, heading):
+    """Returns the direction to turn to find the nearest unknown region"""
+    return UNK_DIR[heading << 8 | label_masks(inter.pack()[0])[0]]
+
+
+def to_head(heading, next_h, graph, location):
+    """Computes the direction to turn to achieve a certain heading, as
+    pln.to_head does
+    """
+    inters = graph.get_intersection(location)
+    left = right = 1
+    if inters != None:
+        unknown, undriven, none, driven = label_masks(inters.pack()[0])
+        streets = undriven | driven
+        l_mask, r_mask = BETWEEN[heading << 3 | next_h]
+        if unknown & l_mask:
+            left += POPCOUNT[streets & l_mask]
+        if unknown & r_mask:
+            right += POPCOUNT[streets & r_mask]
+    direction = TO_HEAD[((next_h - heading) % 8) << 8 | left << 4 | right]
+    if direction == None:
+        return UNEX[heading << 8 | undriven] if inters != None else "LEFT"
+    return direction
+
+
+def check():
+    """Checks that the kernel decides as the list based functions do on every
+    packed street code, from every heading to every target heading, with a
+    sample of the blockage masks, and from the headings the robot faces after
+    timed turns, raising an Exception if not
+    """
+    from mapping.MapGraph import MapGraph
+    for code in range(1 << 16):
+        inters = Intersection(None)
+        for heading in range(8):
+            inters.streets[heading] = CONDITIONS[(code >> (2 * heading)) & 3]
+        graph = MapGraph()
+        graph.locations[None] = inters
+        for mask in [0, code & 0xff, code >> 8]:
+            for heading in range(8):
+                inters.blockages[heading] = BLK if mask & (1 << heading) \
+                                            else UNB
+            inters.packed = None
+            if unx_dir(inters) != pln.unx_dir(inters):
+                raise Exception(f"kernel.check: unx_dir differs on {code}")
+            for heading in range(8):
+                if (l_r_unb(inters, heading) != pln.l_r_unb(inters, heading)):
+                    raise Exception(f"kernel.check: l_r_unb differs on {code}")
+        for heading in range(8):
+            if (l_r_unex(inters, heading) != pln.l_r_unex(inters, heading) or
+                l_r_nearest_rd(inters, heading) !=
+                pln.l_r_nearest_rd(inters, heading) or
+                unk_dir(inters, heading) !=
+                list_unk_dir(graph, inters, heading)):
+                raise Exception(f"kernel.check: decision differs on {code}")
+            for next_h in range(8):
+                if (to_head(heading, next_h, graph, None) !=
+                    pln.to_head(heading, next_h, graph, None)):
+                    raise Exception(f"kernel.check: to_head differs on {code}")
+
+    #The robot's heading after a turn is computed from the angle timed, which
+    # may be a float
+    graph = MapGraph((0, 0), 2, (0, -1))
+    inters = graph.get_intersection((0, 0))
+    known = labeled(0b01000101, UND)
+    streets = {head for head in range(8)
+               if known.check_connection(head) == UND}
+    step_t = {"LEFT": const.TURN_T, "RIGHT": const.TURN_T}
+    for heading in range(8):
+        for direction in ["LEFT", "RIGHT"]:
+            for ang in [45, 90.0, -135, 180.0, 225.0]:
+                turn = pln.turned(float(heading), direction, ang)
+                if type(turn) != int:
+                    raise Exception("kernel.check: turned heading not an int")
+                for next_h in range(8):
+                    if (to_head(turn, next_h, graph, (0, 0)) !=
+                        pln.to_head(turn, next_h, graph, (0, 0))):
+                        raise Exception("kernel.check: to_head differs " +
+                                        "after a turn")
+                if (l_r_unex(inters, turn) != pln.l_r_unex(inters, turn) or
+                    l_r_nearest_rd(inters, turn) !=
+                    pln.l_r_nearest_rd(inters, turn)):
+                    raise Exception("kernel.check: decision differs after a " +
+                                    "turn")
+
+                #Turns through known streets are planned and timed from the
+                # turned heading alike
+                for next_h in range(8):
+                    plan = pln.turn_plan(known, turn, next_h)
+                    seconds = pln.depart_time(streets, turn, next_h, step_t)
+                    if plan == None:
+                        if next_h != turn or seconds != 0:
+                            raise Exception("kernel.check: turn_plan found " +
+                                            "no turn after a turn")
+                        continue
+                    sign = const.dirMap[plan[0][0]][1]
+                    steps = (sign * (next_h - turn)) % 8
+                    if (seconds != steps * const.TURN_T + const.TURN_STOP_T or
+                        [type(head) for head in plan[1]] !=
+                        [int] * len(plan[1])):
+                        raise Exception("kernel.check: turn_plan differs " +
+                                        "from depart_time after a turn")
+
+
+def bench(calls=200000, seed=129):
+    """Checks the kernel, then compares the time per decision of the list
+    based functions and the kernel on the intersections of a simulated map
+    """
+    from random import Random
+    from sim.world import World
+    from sim.routing import known_map
+    start = time.perf_counter()
+    generate()
+    print(f"Tables generated in {1000 * (time.perf_counter() - start):.1f} ms")
+    start = time.perf_counter()
+    check()
+    print(f"Checked every state in {time.perf_counter() - start:.1f} s")
+
+    rand = Random(seed)
+    graph = known_map(World(16, 16, seed=seed, diagonal=.2))
+    #Forget some streets so that the states are not all explored
+    for inters in graph:
+        for heading in range(8):
+            if rand.random() < .3:
+                inters.streets[heading] = UNK
+        inters.packed = None
+    states = [(inters.get_location(), rand.randrange(8), rand.randrange(8))
+              for inters in graph]
+    states = [states[rand.randrange(len(states))] for i in range(calls)]
+    decisions = {
+        "unx_dir": (lambda g, l, h, n: pln.unx_dir(g.get_intersection(l)),
+                    lambda g, l, h, n: unx_dir(g.get_intersection(l))),
+        "l_r_unex": (lambda g, l, h, n: pln.l_r_unex(g.get_intersection(l), h),
+                     lambda g, l, h, n: l_r_unex(g.get_intersection(l), h)),
+        "l_r_nearest_rd": (lambda g, l, h, n:
+                           pln.l_r_nearest_rd(g.get_intersection(l), h),
+                           lambda g, l, h, n:
+                           l_r_nearest_rd(g.get_intersection(l), h)),
+        "l_r_unb": (lambda g, l, h, n: pln.l_r_unb(g.get_intersection(l), h),
+                    lambda g, l, h, n: l_r_unb(g.get_intersection(l), h)),
+        "unk_dir": (lambda g, l, h, n:
+                    list_unk_dir(g, g.get_intersection(l), h),
+                    lambda g, l, h, n: unk_dir(g.get_intersection(l), h)),
+        "to_head": (lambda g, l, h, n: pln.to_head(h, n, g, l),
+                    lambda g, l, h, n: to_head(h, n, g, l))}
+    print(f"{len(graph)} intersections, {calls} calls each (ns per call)")
+    print("decision            lists   kernel  speedup")
+    for name, (lists, kernel) in decisions.items():
+        seconds = []
+        for func in [lists, kernel]:
+            start = time.perf_counter()
+            for location, heading, next_h in states:
+                func(graph, location, heading, next_h)
+            seconds.append(time.perf_counter() - start)
+        print(f"{name:16s} {1e9 * seconds[0] / calls:8.0f} " +
+              f"{1e9 * seconds[1] / calls:8.0f} {seconds[0] / seconds[1]:7.1f}x")
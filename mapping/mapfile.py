@@ -0,0 +1,237 @@
+"""
+This module defines the compact binary file format in which the maps explored
+by the robot for ME/CS/EE 129 Spring '23 are saved, in place of pickles of the
+MapGraph object. Only the map itself is stored, not any planning state, so
+files stay loadable as the classes change.
+
+A map file is laid out as (all little endian):
+    header:        magic b'NMAP', u16 version, u16 reserved,
+                   u32 intersection count, u32 edge count
+    intersections: i32 x, i32 y, u16 street labels, u8 blockage mask
+    edges:         u32 index, u32 index into the intersections array
+
+Street labels hold 2 bits per heading (heading h in bits 2h, 2h + 1) giving the
+index of the label in CONDITIONS. Bit h of the blockage mask is set if the
+street on heading h is blocked.
+
+Authors: Edward Speer, Garrett Knuf
+Date: 6/13/23
+"""
+
+import gc
+import os
+import sys
+import mmap
+import time
+import glob
+import pickle
+import struct
+import tempfile
+from math import inf
+from constants import CONDITIONS, UNK, BLK, UNB, PICKLE_PATH
+from mapping.MapGraph import MapGraph, Intersection
+
+MAGIC = b'NMAP'
+VERSION = 1
+MAP_EXT = '.nmap'
+
+HEADER = struct.Struct('<4sHHII')
+INTERS = struct.Struct('<iiHB')
+EDGE = struct.Struct('<II')
+
+# Street labels and blockages decoded from each packed value seen so far,
+# copied into each Intersection loaded
+street_table = {}
+block_table = {}
+
+
+def pack_streets(inters):
+    """Packs the street labels of an Intersection into 16 bits"""
+    code = 0
+    for heading in range(8):
+        code |= CONDITIONS.index(inters.check_connection(heading)) << (2 * heading)
+    return code
+
+
+def pack_blockages(inters):
+    """Packs the blockages of an Intersection into an 8 bit mask"""
+    mask = 0
+    for heading in range(8):
+        if inters.check_blockage(heading) == BLK:
+            mask |= 1 << heading
+    return mask
+
+
+def unpack_streets(code):
+    """Returns the street label dictionary packed into 16 bits"""
+    if code not in street_table:
+        street_table[code] = {heading: CONDITIONS[(code >> (2 * heading)) & 3]
+                              for heading in range(8)}
+    return street_table[code].copy()
+
+
+def unpack_blockages(mask):
+    """Returns the blockage dictionary packed into an 8 bit mask"""
+    if mask not in block_table:
+        block_table[mask] = {heading: BLK if mask & (1 << heading) else UNB
+                             for heading in range(8)}
+    return block_table[mask].copy()
+
+
+def encode(graph):
+    """Encodes a MapGraph in the map file format, returning the bytes"""
+    inters_list = list(graph)
+    index = {}
+    body = bytearray()
+    for i in range(len(inters_list)):
+        inters = inters_list[i]
+        location = inters.get_location()
+        index[inters] = i
+        body += INTERS.pack(location[0], location[1], pack_streets(inters),
+                            pack_blockages(inters))
+    num_edges = 0
+    for inters in inters_list:
+        for chile in graph.adjacent(inters):
+            if index[inters] < index[chile]:
+                body += EDGE.pack(index[inters], index[chile])
+                num_edges += 1
+    return HEADER.pack(MAGIC, VERSION, 0, len(inters_list), num_edges) + body
+
+
+def decode(buffer):
+    """Builds a MapGraph from a buffer holding a map file"""
+    magic, version, _, num_inters, num_edges = HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise Exception("mapfile.decode: Not a map file")
+    if version != VERSION:
+        raise Exception(f"mapfile.decode: Unsupported map version {version}")
+    start = HEADER.size
+    end = start + num_inters * INTERS.size
+    view = memoryview(buffer)
+    graph = MapGraph()
+    adjacency = graph.graph
+    locations = graph.locations
+    inters_list = []
+    #Nothing built here can be garbage, so skip collecting while building it
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        #Intersections are built directly rather than through __init__, which 
+        #would fill in street and blockage dictionaries only to replace them
+        for x, y, code, mask in INTERS.iter_unpack(view[start:end]):
+            inters = Intersection.__new__(Intersection)
+            inters.__dict__ = {'location': (x, y), 'cost': inf, 
+                               'direction': None, 'observer': graph.notify,
+                               'streets': unpack_streets(code),
+                               'blockages': unpack_blockages(mask),
+                               'packed': (code, mask)}
+            adjacency[inters] = []
+            locations[(x, y)] = inters
+            inters_list.append(inters)
+        for i, j in EDGE.iter_unpack(view[end:end + num_edges * EDGE.size]):
+            adjacency[inters_list[i]].append(inters_list[j])
+            adjacency[inters_list[j]].append(inters_list[i])
+    finally:
+        view.release()
+        if collecting:
+            gc.enable()
+    return graph
+
+
+def save(graph, filename):
+    """Saves a MapGraph to a map file. The file is written under a temporary
+    name and moved into place, so a crash never leaves a partial map file.
+    """
+    temp = filename + '.tmp'
+    with open(temp, 'wb') as filen:
+        filen.write(encode(graph))
+    os.replace(temp, filename)
+
+
+def load(filename):
+    """Loads the MapGraph saved in a map file, reading it through mmap"""
+    with open(filename, 'rb') as filen:
+        with mmap.mmap(filen.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            return decode(buffer)
+
+
+def convert(pickle_name, filename=None):
+    """Converts a map saved as a MapGraph pickle to a map file of the same
+    name with the map file extension. Returns the name of the map file.
+    """
+    if filename == None:
+        filename = os.path.splitext(pickle_name)[0] + MAP_EXT
+    with open(pickle_name, 'rb') as pick:
+        graph = pickle.load(pick)
+    save(graph, filename)
+    return filename
+
+
+def grid_map(size):
+    """Builds a size x size grid map with every intersection explored, for
+    benchmarking
+    """
+    graph = MapGraph()
+    for x in range(size):
+        for y in range(size):
+            inters = Intersection((x, y))
+            for heading in range(8):
+                inters.set_connection(heading, 
+                                      CONDITIONS[2 + (heading % 2 == 0)])
+            graph.add_intersection(inters)
+    for x in range(size):
+        for y in range(size):
+            if x + 1 < size:
+                graph.link(graph.get_intersection((x, y)),
+                           graph.get_intersection((x + 1, y)))
+            if y + 1 < size:
+                graph.link(graph.get_intersection((x, y)),
+                           graph.get_intersection((x, y + 1)))
+    return graph
+
+
+def bench(size=1000):
+    """Benchmarks saving and loading a size x size grid map as a map file and
+    as a pickle
+    """
+    graph = grid_map(size)
+    tempdir = tempfile.mkdtemp()
+    filename = os.path.join(tempdir, 'map' + MAP_EXT)
+    pickle_name = os.path.join(tempdir, 'map.pickle')
+    try:
+        start = time.perf_counter()
+        save(graph, filename)
+        saved = time.perf_counter() - start
+        start = time.perf_counter()
+        with open(pickle_name, 'wb') as pick:
+            pickle.dump(graph, pick)
+        pickled = time.perf_counter() - start
+        del graph
+
+        start = time.perf_counter()
+        graph = load(filename)
+        loaded = time.perf_counter() - start
+        del graph
+        start = time.perf_counter()
+        with open(pickle_name, 'rb') as pick:
+            graph = pickle.load(pick)
+        unpickled = time.perf_counter() - start
+
+        print(f"{size * size} intersection map")
+        print(f"Map file: save {saved:7.3f} s, load {loaded:7.3f} s, " +
+              f"{os.path.getsize(filename)} bytes")
+        print(f"Pickle:   save {pickled:7.3f} s, load {unpickled:7.3f} s, " +
+              f"{os.path.getsize(pickle_name)} bytes")
+    finally:
+        for name in glob.glob(os.path.join(tempdir, '*')):
+            os.remove(name)
+        os.rmdir(tempdir)
+
+
+if __name__ == "__main__":
+    #Convert the given map pickles, or all of them, to map files
+    names = sys.argv[1:]
+    if names == []:
+        names = glob.glob(PICKLE_PATH + '*.pickle')
+    for name in names:
+        print(f"Converted {name} to {convert(name)}")
@@ -0,0 +1,385 @@
+"""
+This module implements a map server shared by several robots exploring the
+same floor, reachable over a Unix socket, and the client each robot uses to
+share its map through it. Every robot pushes the changes it makes to its own
+MapGraph, and pulls the changes the others made into it, so each one plans
+over the merged map.
+
+The server holds the map as a state which merges observations without
+conflicts, in any order, any number of times:
+    intersections and the links between them only grow
+    each street label only moves up the rank UNKNOWN < NONE < UNDRIVEN <
+        DRIVEN, so an observation that a street exists beats one that it does
+        not, and having driven a street beats both
+    each blockage is the latest observation of it, by (timestamp, robot,
+        status) so that ties are broken the same way everywhere
+
+Changes travel as lines of text in the journal encoding (see
+mapping/journal.py), with blockage lines followed by their timestamp (in
+nanoseconds) and robot. A client sends change lines to push them, and
+"pull N" to receive every change the server accepted after its first N,
+followed by "end M" where M is the number to pull from next. Robots also
+send "pos ROBOT X Y" lines giving their latest location, and the server
+sends the latest location of every robot before "end". A robot which has
+disconnected, or not sent its location for POSITION_TIMEOUT seconds, is
+taken to have gone and its location is no longer sent. All robots must share
+one coordinate frame for their maps.
+
+Authors: Edward Speer, Garrett Knuf
+Date: 6/17/23
+"""
+
+import os
+import sys
+import time
+import queue
+import socket
+import threading
+import socketserver
+from constants import MAP_SOCKET, POSITION_TIMEOUT, UNK, NNE, UND, DRV
+from mapping.MapGraph import Intersection
+from mapping.journal import encode, decode
+
+#The rank of each street label. Merging keeps the highest ranked label
+RANK = {UNK: 0, NNE: 1, UND: 2, DRV: 3}
+
+
+def encode_op(op):
+    """Encodes a map server change (or robot location) as a line of text"""
+    if op[0] == "pos":
+        return f"pos {op[1]} {op[2][0]} {op[2][1]}"
+    if op[0] == "bk":
+        return encode(op[:4]) + f" {op[4]} {op[5]}"
+    return encode(op)
+
+
+def decode_op(line):
+    """Decodes a line of text into a map server change (or robot location).
+    Raises ValueError if the line is not a complete change.
+    """
+    fields = line.split()
+    if len(fields) == 4 and fields[0] == "pos":
+        return ("pos", fields[1], (int(fields[2]), int(fields[3])))
+    if len(fields) == 7 and fields[0] == "bk":
+        return decode(" ".join(fields[:5])) + (int(fields[5]), fields[6])
+    if len(fields) != 0 and fields[0] == "bk":
+        raise ValueError("mapserver.decode_op: Invalid change " + line)
+    return decode(line)
+
+
+def order(op):
+    """Returns the key by which blockage changes are ordered, latest last"""
+    return (op[4], op[5], op[3])
+
+
+class MapState:
+    """ The merged map of every robot, as sets of intersections and links,
+    the highest ranked label of each street, and the latest observation of
+    each blockage
+    """
+
+    def __init__(self):
+        self.inters = set()
+        self.links = set()
+        self.streets = {}
+        self.blockages = {}
+
+    def merge(self, op):
+        """Merges a change into the state. Returns True if the state changed.
+        Links and streets of intersections never added are merged as well, so
+        changes may arrive in any order.
+        """
+        if op[0] == "add":
+            if op[1] in self.inters:
+                return False
+            self.inters.add(op[1])
+        elif op[0] == "lnk":
+            link = (min(op[1], op[2]), max(op[1], op[2]))
+            if link in self.links:
+                return False
+            self.links.add(link)
+        elif op[0] == "st":
+            key = (op[1], op[2])
+            if RANK[op[3]] <= RANK[self.streets.get(key, UNK)]:
+                return False
+            self.streets[key] = op[3]
+        elif op[0] == "bk":
+            key = (op[1], op[2])
+            if key in self.blockages and order(op) <= self.blockages[key]:
+                return False
+            self.blockages[key] = order(op)
+        return True
+
+    def merge_state(self, other):
+        """Merges every change held by another MapState into this one"""
+        for op in other.ops():
+            self.merge(op)
+
+    def ops(self):
+        """Generates changes which rebuild the state when merged"""
+        for location in self.inters:
+            yield ("add", location)
+        for link in self.links:
+            yield ("lnk", link[0], link[1])
+        for key, status in self.streets.items():
+            yield ("st", key[0], key[1], status)
+        for key, block in self.blockages.items():
+            yield ("bk", key[0], key[1], block[2], block[0], block[1])
+
+    def __eq__(self, other):
+        return (self.inters == other.inters and self.links == other.links and
+                self.streets == other.streets and
+                self.blockages == other.blockages)
+
+
+class MapServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """ Serves the merged map to the robots connected to a Unix socket. The
+    server logs each change which changed the map, numbered in the order
+    accepted, so clients pull only what they have not seen.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path=MAP_SOCKET):
+        if os.path.exists(path):
+            os.remove(path)
+        self.state = MapState()
+        self.log = []
+        self.positions = {}
+        self.lock = threading.Lock()
+        super().__init__(path, MapHandler)
+
+    def push(self, op):
+        """Merges a change, logging it if it changed the map"""
+        with self.lock:
+            if self.state.merge(op):
+                self.log.append(encode_op(op))
+
+    def move(self, robot, location):
+        """Records the latest location of a robot and when it was sent"""
+        with self.lock:
+            self.positions[robot] = (location, time.time())
+
+    def remove(self, robot):
+        """Forgets the location of a robot which has gone"""
+        with self.lock:
+            self.positions.pop(robot, None)
+
+    def pull(self, start):
+        """Returns the logged changes from the start'th on followed by the
+        locations of the robots which have not timed out, and the number of
+        changes logged
+        """
+        with self.lock:
+            lines = self.log[start:]
+            now = time.time()
+            for robot, (location, sent) in list(self.positions.items()):
+                if now - sent > POSITION_TIMEOUT:
+                    del self.positions[robot]
+                else:
+                    lines.append(encode_op(("pos", robot, location)))
+            return lines, len(self.log)
+
+
+class MapHandler(socketserver.StreamRequestHandler):
+    """ Handles the lines sent by one client connection, forgetting the
+    robots located over it when it closes
+    """
+
+    def handle(self):
+        robots = set()
+        try:
+            self.serve_lines(robots)
+        finally:
+            for robot in robots:
+                self.server.remove(robot)
+
+    def serve_lines(self, robots):
+        """Serves the lines sent until the connection closes, adding each
+        robot located to robots
+        """
+        for line in self.rfile:
+            line = line.decode()
+            if line.startswith("pull"):
+                lines, end = self.server.pull(int(line.split()[1]))
+                lines.append(f"end {end}")
+                self.wfile.write(("\n".join(lines) + "\n").encode())
+            else:
+                try:
+                    op = decode_op(line)
+                except (ValueError, IndexError):
+                    continue
+                if op[0] == "pos":
+                    self.server.move(op[1], op[2])
+                    robots.add(op[1])
+                else:
+                    self.server.push(op)
+
+
+class MapClient:
+    """ Shares an attached MapGraph through the map server. Changes made to
+    the graph are pushed on a background thread, so the robot thread only
+    queues them. Changes made by other robots are pulled into the graph by
+    sync, which must be called on the thread that changes the graph.
+
+    Pulled street labels only replace lower ranked ones, and pulled
+    blockages only replace ones observed earlier, so a robot's own latest
+    observations are never lost.
+
+    Inputs: path - the map server socket
+            robot - the name of this robot, unique among those sharing a map
+    """
+
+    def __init__(self, path=MAP_SOCKET, robot=None):
+        if robot == None:
+            robot = f"{socket.gethostname()}-{os.getpid()}"
+        self.robot = robot
+        self.graph = None
+        self.seq = 0
+        self.stamps = {}
+        self.applying = False
+        self.applied = 0
+        self.positions = {}
+        self.pusher = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.pusher.connect(path)
+        self.puller = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.puller.connect(path)
+        self.replies = self.puller.makefile('r')
+        self.q = queue.Queue()
+        self.thread = threading.Thread(name="MapClientThread",
+                                       target=self.run, daemon=True)
+        self.thread.start()
+
+    def attach(self, graph):
+        """Starts sharing graph in place of any previously attached graph,
+        pushing all of it and pulling the merged map into it. Blockages
+        already in graph are pushed as the oldest observations of them.
+        """
+        if self.graph != None:
+            self.graph.ignore(self.record)
+        self.graph = graph
+        self.stamps = {}
+        for record in graph.records():
+            self.q.put(self.stamp(record, 0))
+        graph.observe(self.record)
+        self.seq = 0
+        self.sync()
+
+    def stamp(self, record, stamp):
+        """Returns the change to push for a graph change record, noting the
+        time of blockage observations
+        """
+        if record[0] != "bk":
+            return record
+        op = record + (stamp, self.robot)
+        self.stamps[(record[1], record[2])] = order(op)
+        return op
+
+    def record(self, record):
+        """MapGraph observer which queues a change to be pushed. Changes
+        pulled from the server are not pushed back.
+        """
+        if self.applying:
+            self.applied += 1
+            return
+        self.q.put(self.stamp(record, time.time_ns()))
+
+    def move(self, location):
+        """Queues this robot's location to be shared with the others"""
+        self.q.put(("pos", self.robot, location))
+
+    def run(self):
+        """Pusher thread loop, sending queued changes to the server"""
+        while True:
+            op = self.q.get()
+            if op == None:
+                break
+            lines = [encode_op(op)]
+            while not self.q.empty():
+                op = self.q.get()
+                if op == None:
+                    break
+                lines.append(encode_op(op))
+            self.pusher.sendall(("\n".join(lines) + "\n").encode())
+            if op == None:
+                break
+
+    def sync(self):
+        """Pulls the changes made by other robots into the graph, and the
+        latest locations of the robots into positions, in place of those of
+        the robots which have gone. Returns the number of changes made to the
+        graph.
+        """
+        self.puller.sendall(f"pull {self.seq}\n".encode())
+        self.applied = 0
+        self.applying = True
+        positions = {}
+        try:
+            for line in self.replies:
+                if line.startswith("end"):
+                    self.seq = int(line.split()[1])
+                    break
+                op = decode_op(line)
+                if op[0] == "pos":
+                    positions[op[1]] = op[2]
+                else:
+                    self.apply(op)
+            self.positions = positions
+        finally:
+            self.applying = False
+        return self.applied
+
+    def apply(self, op):
+        """Applies a merged change to the graph"""
+        graph = self.graph
+        if op[0] == "add":
+            if not graph.contains(op[1]):
+                graph.add_intersection(Intersection(op[1]))
+        elif op[0] == "lnk":
+            for location in op[1:]:
+                if not graph.contains(location):
+                    graph.add_intersection(Intersection(location))
+            graph.link(graph.get_intersection(op[1]),
+                       graph.get_intersection(op[2]))
+        elif op[0] == "st":
+            if not graph.contains(op[1]):
+                graph.add_intersection(Intersection(op[1]))
+            inters = graph.get_intersection(op[1])
+            if RANK[op[3]] > RANK[inters.check_connection(op[2])]:
+                inters.set_connection(op[2], op[3])
+        elif op[0] == "bk":
+            key = (op[1], op[2])
+            if key in self.stamps and order(op) <= self.stamps[key]:
+                return
+            self.stamps[key] = order(op)
+            if not graph.contains(op[1]):
+                graph.add_intersection(Intersection(op[1]))
+            inters = graph.get_intersection(op[1])
+            if inters.check_blockage(op[2]) != op[3]:
+                inters.set_blockage(op[2], op[3], None)
+
+    def close(self):
+        """Pushes all queued changes and disconnects from the server"""
+        if self.graph != None:
+            self.graph.ignore(self.record)
+        self.q.put(None)
+        self.thread.join()
+        self.pusher.close()
+        self.replies.close()
+        self.puller.close()
+
+
+def serve(path=MAP_SOCKET):
+    """Runs the map server until interrupted"""
+    with MapServer(path) as server:
+        print(f"Serving the shared map on {path}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    #Serve on the given socket, or the default one
+    serve(*sys.argv[1:2])
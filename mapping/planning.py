@@ -7,17 +7,23 @@ Date: 5/8/23
 """
 
 from mapping.MapGraph import MapGraph
-from queue import PriorityQueue
+from heapq import heappush, heappop
 import constants as const
-from mapping.graphics import Visualizer
+import os
 import pickle
-from math import dist, inf
+import mapping.mapfile as mapfile
+from mapping.tiles import TiledMapGraph
+from math import dist, inf, sqrt
+from itertools import product
 from constants import heading_map, UNK, UND, DRV, UNB, BLK, NNE
 
 
 class Djikstra:
     """Contains all the objects needed to run Djikstra's, and 
-    the function which computes the shortest path
+    the function which computes the shortest path. The cost and optimal 
+    leaving direction found for each location are kept by the Djikstra object
+    rather than in the Intersections, so resetting is free and the map may 
+    unload Intersections while a plan is in progress.
     
     Inputs: graph - A MapGraph giving the layout of the Intersections/ streets 
             origin - The goal Intersection location of Djikstra's
@@ -25,13 +31,10 @@ class Djikstra:
 
     def __init__(self, graph, origin):
         self.graph = graph
-        self.goal = graph.get_intersection(origin)
-        self.goal.set_cost(0)
-        self.q = PriorityQueue()
-        self.q.put((0, self.goal))
+        self.reset(origin)
 
     def get_goal(self):
-        return self.goal.get_location()
+        return self.goal
 
     def reset(self, origin):
         """Reinitializes the Djikstra object over the given map to use a 
@@ -39,78 +42,271 @@ class Djikstra:
 
         Arguements: origin - the new goal Intersection location    
         """
-        for node in self.graph:
-            node.reset()
-        self.goal = self.graph.get_intersection(origin)
-        self.goal.set_cost(0)
-        self.q = PriorityQueue()
-        self.q.put((0, self.goal))
-
-    def run(self):
+        self.goal = origin
+        self.costs = {origin: 0}
+        self.dirs = {}
+        self.q = [(0, origin)]
+
+    def get_cost(self, location):
+        """Returns the cost of the best path found from location to the goal"""
+        return self.costs.get(location, inf)
+
+    def get_dir(self, location):
+        """Returns the optimal leaving direction found from location"""
+        return self.dirs.get(location)
+
+    def run(self, stop=None):
         """ Run Djikstra's algorithm on the graph. This will assign a cost and 
-        direction to each Intersection in the graph stored in these fields 
-        internally in each Intersection object
+        direction to each location reachable from the goal, stored in the 
+        Djikstra object. If a stop location is given, the run pauses once the 
+        optimal path from stop is known, and picks up from there if run again.
         """
-        while not self.q.empty():
-            curr = self.q.get()[1]
-            for chile in self.graph.neighbors(curr):
-                delta = (curr.get_location()[0] - chile.get_location()[0],
-                         curr.get_location()[1] - chile.get_location()[1])
+        while self.q != []:
+            cost, loc = heappop(self.q)
+            if cost > self.get_cost(loc):
+                continue
+            if loc == stop:
+                heappush(self.q, (cost, loc))
+                return
+            for chile in self.graph.neighbors(self.graph.get_intersection(loc)):
+                chile_loc = chile.get_location()
+                delta = (loc[0] - chile_loc[0], loc[1] - chile_loc[1])
                 pot_dir = const.invert_h_map[delta]
-                pot_cost = curr.get_cost() + 1
-                if pot_cost < chile.get_cost():
-                    if chile.get_cost() != float('inf'):
-                        self.q.queue.remove((chile.get_cost(), chile))
-                    chile.set_cost(pot_cost)
-                    chile.set_dir(pot_dir)
-                    self.q.put((chile.get_cost(), chile))
-
-    def gen_path(self, start_point):
+                pot_cost = cost + 1
+                if pot_cost < self.get_cost(chile_loc):
+                    self.costs[chile_loc] = pot_cost
+                    self.dirs[chile_loc] = pot_dir
+                    heappush(self.q, (pot_cost, chile_loc))
+
+    def gen_path(self, start_point, heading=None):
         """ Generates a path from the given start point to the goal node of 
         the Djikstra object. Runs Djikstra's, then follows the directions stored 
         in each Intersection until the goal is reached.
 
         Arguments: start_point - the location where the path begins in the graph
+                   heading - the heading of the bot (unused, as turns are free)
 
         Returns: path - a list of headings to follow sequentially to reach the 
                         goal.
         """
         path = []
-        self.run()
-        node = self.graph.get_intersection(start_point)
-        while node.get_dir() != None:
-            path.append(node.get_dir())
-            next_n = (node.get_location()[0] + 
-                      const.heading_map[node.get_dir()][0], 
-                      node.get_location()[1] + 
-                      const.heading_map[node.get_dir()][1])
-            node = self.graph.get_intersection(next_n)
+        self.run(start_point)
+        node = start_point
+        while self.get_dir(node) != None:
+            path.append(self.get_dir(node))
+            node = (node[0] + const.heading_map[self.get_dir(node)][0], 
+                    node[1] + const.heading_map[self.get_dir(node)][1])
         return path
 
 
+class TimedDjikstra(Djikstra):
+    """Runs Djikstra's over (location, heading) states, with the estimated 
+    time to turn and drive as the cost of each step, so that the paths found 
+    finish fastest rather than in the fewest streets. The state (location, h) 
+    is the bot reaching location facing heading h, so a path costs the turns 
+    onto each street (stopping at each street passed while turning) as well as 
+    the streets, diagonal streets being sqrt(2) long, and stopping at each 
+    intersection on the way. The bot passes explored intersections it drives 
+    straight through without stopping (see pass_through), and starts out 
+    stopped.
+
+    Streets with measured drive times are costed by their mean time, and 
+    turns by the calibrated turn rates if given.
+
+    Inputs: graph - A MapGraph giving the layout of the Intersections/ streets 
+            origin - The goal Intersection location of Djikstra's
+            times - StreetTimes measured on the map, if any
+            turns - TurnRates calibrated on the robot, if any
+    """
+
+    def __init__(self, graph, origin, times=None, turns=None):
+        self.times = times
+        self.turns = turns
+        self.start = None
+        super().__init__(graph, origin)
+
+    def reset(self, origin):
+        """Reinitializes the Djikstra object over the given map to use a 
+        different goal node, reached facing any heading.
+        """
+        self.goal = origin
+        self.costs = {}
+        self.dirs = {}
+        self.q = []
+        for heading in range(8):
+            self.costs[(origin, heading)] = 0
+            self.q.append((0, (origin, heading)))
+
+    def best_heading(self, location):
+        """Returns the heading from which the goal is reached fastest"""
+        return min(range(8), key=lambda h: self.costs.get((location, h), inf))
+
+    def get_cost(self, location, heading=None):
+        """Returns the time of the best path found from location (facing 
+        heading, or the best heading) to the goal
+        """
+        if heading == None:
+            heading = self.best_heading(location)
+        return self.costs.get((location, heading), inf)
+
+    def get_dir(self, location, heading=None):
+        """Returns the optimal leaving direction found from location facing 
+        heading (or the best heading)
+        """
+        if heading == None:
+            heading = self.best_heading(location)
+        return self.dirs.get((location, heading))
+
+    def run(self, stop=None, heading=None):
+        """ Run Djikstra's algorithm on the graph. If a stop location is 
+        given, the run pauses once the optimal path from stop (facing heading, 
+        if given) is known, and picks up from there if run again.
+        """
+        while self.q != []:
+            cost, state = heappop(self.q)
+            if cost > self.costs.get(state, inf):
+                continue
+            loc, arrive = state
+            if loc == stop and (heading == None or arrive == heading):
+                heappush(self.q, (cost, state))
+                return
+            #The bot reaches loc facing arrive from the location behind it
+            prev = (loc[0] - heading_map[arrive][0], 
+                    loc[1] - heading_map[arrive][1])
+            prev_inters = self.graph.get_intersection(prev)
+            if (prev_inters == None or prev_inters not in 
+                self.graph.neighbors(self.graph.get_intersection(loc))):
+                continue
+            cost += drive_time(prev, arrive, self.times)
+            through = prev != self.start and prev_inters.is_explored()
+            for face in range(8):
+                if face == arrive and through:
+                    pot_cost = cost
+                else:
+                    pot_cost = cost + turn_time(face, arrive, prev_inters,
+                                                self.turns)
+                    if prev != self.start:
+                        pot_cost += const.STOP_T
+                if pot_cost < self.costs.get((prev, face), inf):
+                    self.costs[(prev, face)] = pot_cost
+                    self.dirs[(prev, face)] = arrive
+                    heappush(self.q, (pot_cost, (prev, face)))
+
+    def gen_path(self, start_point, heading=None):
+        """ Generates the fastest path from the given start point, facing 
+        heading (or the best heading, if not given), to the goal node.
+
+        Returns: path - a list of headings to follow sequentially to reach the 
+                        goal.
+        """
+        path = []
+        #The bot is stopped at the start, so paths from elsewhere are replanned
+        if start_point != self.start:
+            self.start = start_point
+            self.reset(self.goal)
+        self.run(start_point, heading)
+        if heading == None:
+            heading = self.best_heading(start_point)
+        node = start_point
+        while self.get_dir(node, heading) != None:
+            heading = self.get_dir(node, heading)
+            path.append(heading)
+            node = (node[0] + heading_map[heading][0], 
+                    node[1] + heading_map[heading][1])
+        return path
+
+
+def drive_time(location, heading, times=None):
+    """Estimates the time to drive the street leaving location on heading, 
+    by its mean measured time if it has one in times
+    """
+    length = sqrt(2) if heading % 2 == 1 else 1
+    if times == None:
+        return length * const.DRIVE_T
+    return times.mean(location, heading, length * const.DRIVE_T)
+
+
+def street_time(location, heading, times=None):
+    """Estimates the time to drive the street leaving location on heading 
+    to the next intersection, including stopping and pulling up there
+    """
+    return drive_time(location, heading, times) + const.STOP_T
+
+
+def pass_through(graph, location, heading, path):
+    """Returns whether the bot driving the street leaving location on heading 
+    can pass the intersection at its end without stopping: that is when the 
+    path continues straight on (the next heading is the current one) and the 
+    intersection is explored, so there is nothing to check there.
+    """
+    if path == None or path == [] or path[0] != heading or graph == None:
+        return False
+    inters = graph.get_intersection((location[0] + heading_map[heading][0],
+                                     location[1] + heading_map[heading][1]))
+    return (inters != None and inters.is_explored() and 
+            inters.check_connection(heading) == DRV and
+            inters.check_blockage(heading) != BLK)
+
+
+def path_time(graph, location, heading, path, times=None, turns=None):
+    """Estimates the time to follow a path of headings from location, 
+    starting out stopped facing heading, passing explored intersections 
+    straight through, and stopping at the end
+    """
+    seconds = 0
+    for i in range(len(path)):
+        next_h = path[i]
+        inters = graph.get_intersection(location)
+        if i != 0 and (next_h != heading or not inters.is_explored()):
+            seconds += const.STOP_T
+        seconds += (turn_time(heading, next_h, inters, turns) + 
+                    drive_time(location, next_h, times))
+        heading = next_h
+        location = (location[0] + heading_map[heading][0], 
+                    location[1] + heading_map[heading][1])
+    if path != []:
+        seconds += const.STOP_T
+    return seconds
+
+
 def find_unexplored(graph, curr, seen):
     """Uses a DFS to find a nearby intersection with unexplored headings, so 
     that Djikstra may then compute a path to that intersection for exploration
     Update: also makes sure intersection returned is not blocked off
     
+    The search keeps its own stack rather than recursing, so that it is not 
+    limited by the recursion depth on large maps.
+    
     Arguments: graph: a MapGraph object to search over 
                curr: the current location of the bot in the graph
     """
     if curr == None:
         return None
-    inters = graph.get_intersection(curr)
-    nexts = graph.neighbors(inters)
-    seen.append(curr)
-    for chile in nexts:
+    seen = set(seen)
+    seen.add(curr)
+    stack = [(curr, iter(graph.neighbors(graph.get_intersection(curr))))]
+    while stack != []:
+        loc, nexts = stack[-1]
+        chile = next(nexts, None)
+        if chile == None:
+            stack.pop()
+            continue
         if not chile.is_explored():
-            heading = heading_from(inters.get_location(), chile.get_location())
+            heading = heading_from(loc, chile.get_location())
             if chile.check_blockage(heading) == const.UNB:
-                print("next target " + str(chile.location))
-                return chile.location
+                #Pass the target back up the search, resuming the search from 
+                #the target itself if it is further up the search
+                stack.pop()
+                while stack != [] and stack[-1][0] != chile.location:
+                    stack.pop()
+                if stack == []:
+                    print("next target " + str(chile.location))
+                    return chile.location
+                continue
         if chile.location not in seen:
-            nxt = find_unexplored(graph, chile.location, seen)
-            if nxt != None and nxt != curr:
-                return nxt
+            seen.add(chile.location)
+            stack.append((chile.location, 
+                          iter(graph.neighbors(chile))))
     return None
     
 
@@ -124,11 +320,21 @@ def heading_from(loc1, loc2):
 
 def from_pickle(map_num = None):
     """Returns the graph giving the map of a previously explored tape map
-    from the stored pickle file of the graph
+    from the stored map file of the graph, or from the stored pickle file of 
+    the graph if the map has not been converted to a map file. Maps stored as 
+    tile files are opened in place rather than loaded.
     """
     if map_num == None:
         map_num = input("Which map are you NormStorming on? (Number): ")
-    filename = f'pickles/map{map_num}.pickle'
+    filename = f'{const.PICKLE_PATH}map{map_num}.tiles'
+    if os.path.exists(filename):
+        print(f'Opening the map in {filename}.')
+        return TiledMapGraph(filename)
+    filename = f'{const.PICKLE_PATH}map{map_num}{mapfile.MAP_EXT}'
+    if os.path.exists(filename):
+        print(f'Loading the map from {filename}.')
+        return mapfile.load(filename)
+    filename = f'{const.PICKLE_PATH}map{map_num}.pickle'
     print(f'Loading the map from {filename}.')
     toRet = None
     try:
@@ -139,14 +345,27 @@ def from_pickle(map_num = None):
     return toRet
 
 
-def init_plan(location, heading, prev_loc):
+def init_plan(location, heading, prev_loc, times=None, turns=None):
     """Initializes the variables needed for route planning by a behavior
     
     Arguments: location - the current robot location
                heading - the current robot heading
     """
+    #Imported here so that planning can be used without a display (in the
+    #simulator) where matplotlib is not available
+    from mapping.graphics import Visualizer
     graph = MapGraph(location, heading, prev_loc)
-    return (graph, Visualizer(graph), Djikstra(graph, prev_loc))
+    return (graph, Visualizer(graph), TimedDjikstra(graph, prev_loc, times, 
+                                                    turns))
+
+
+def turned(heading, direction, ang):
+    """Returns the heading faced after turning ang degrees from heading in
+    direction, rounded to a whole heading so that it indexes the decision 
+    tables and counts turn steps
+    """
+    return (round(heading) + const.dirMap[direction[0]][1] *
+            round(abs(ang) / 45)) % 8
 
 
 def to_head(heading, next_h, graph, location):
@@ -154,7 +373,15 @@ def to_head(heading, next_h, graph, location):
 
     Arguments: heading - the current bot heading
                next_h - the desired next heading of the bot
+
+    Turns the faster way, given the streets the turn would stop at, and 
+    otherwise the shorter way.
     """
+    times = turn_times(heading, next_h, graph.get_intersection(location))
+    if times["LEFT"] < times["RIGHT"]:
+        return "LEFT"
+    if times["RIGHT"] < times["LEFT"]:
+        return "RIGHT"
     if (heading + 4) % 8 == next_h:
         return l_r_unex(graph.get_intersection(location), heading)
     if  next_h in [(heading + i) % 8 for i in range(5)]:
@@ -163,6 +390,201 @@ def to_head(heading, next_h, graph, location):
         return "RIGHT"
     
 
+def turn_plan(inters, heading, next_h):
+    """Plans a turn from heading to next_h in one continuous spin, as 
+    exec_turn turns through the streets it is told to pass. This needs the map 
+    to know every heading between, so the streets passed can be counted. 
+    Turns the way passing fewer streets, then the shorter way.
+
+    Returns the direction to turn and the headings of the streets passed on
+    the way, or None if the map does not know the headings between either way.
+    """
+    if inters == None or heading == next_h:
+        return None
+    plans = []
+    for direction, sign in [("LEFT", 1), ("RIGHT", -1)]:
+        steps = (sign * (next_h - heading)) % 8
+        between = [(heading + sign * i) % 8 for i in range(1, steps)]
+        if UNK in [inters.check_connection(head) for head in between]:
+            continue
+        passed = [head for head in between 
+                  if inters.check_connection(head) in [UND, DRV]]
+        plans.append((len(passed), steps, direction, passed))
+    if plans == []:
+        return None
+    plans.sort(key=lambda plan: plan[:2])
+    return (plans[0][2], plans[0][3])
+
+
+def turn_times(heading, next_h, inters=None, turns=None):
+    """Estimates the time to turn from heading to next_h turning each way, 
+    returned as a dictionary by direction. A turn stops at each street it 
+    passes (when the intersection is known), as exec_turn turns to the next 
+    street, unless every heading it passes is known, when it turns through 
+    them and stops once. Turns are timed by the calibrated TurnRates turns 
+    if given.
+    """
+    times = {}
+    for direction, sign in [("LEFT", 1), ("RIGHT", -1)]:
+        steps = (sign * (next_h - heading)) % 8
+        stops = 1
+        if inters != None:
+            between = [inters.check_connection((heading + sign * i) % 8) 
+                       for i in range(1, steps)]
+            if UNK in between:
+                stops += between.count(UND) + between.count(DRV)
+        step_t = const.TURN_T if turns == None else turns.step_time(direction)
+        times[direction] = (steps * step_t + stops * const.TURN_STOP_T 
+                            if steps != 0 else 0)
+    return times
+
+
+def turn_time(heading, next_h, inters=None, turns=None):
+    """Estimates the time to turn from heading to next_h, the way turn_plan
+    turns when it can plan the turn, and otherwise the faster way
+    """
+    times = turn_times(heading, next_h, inters, turns)
+    plan = turn_plan(inters, heading, next_h)
+    if plan != None:
+        return times[plan[0]]
+    return min(times.values())
+
+
+def layouts(streets, prior=None):
+    """Generates each possible layout of the unknown headings of an 
+    intersection with the given street labels which keeps streets off 
+    adjacent headings, as the set of unknown headings with streets and the
+    weight of that layout. Each unknown heading has a street with the prior 
+    probability (one for all headings or a tuple of one per heading).
+    """
+    if prior == None:
+        prior = const.STREET_PRIOR
+    if not isinstance(prior, tuple):
+        prior = (prior,) * 8
+    unknown = [head for head in range(8) if streets[head] == UNK]
+    known = {head for head in range(8) if streets[head] in [UND, DRV]}
+    for found in product([False, True], repeat=len(unknown)):
+        layout = {unknown[i] for i in range(len(unknown)) if found[i]}
+        crowded = [head for head in layout
+                   if {(head + 1) % 8, (head - 1) % 8} & (layout | known)]
+        if crowded != []:
+            continue
+        weight = 1
+        for head in unknown:
+            weight *= prior[head] if head in layout else 1 - prior[head]
+        yield (layout, weight)
+
+
+def spin(streets, heading, sign):
+    """Returns the heading of the next street turning from heading the way of
+    sign, given the set of headings with streets, and the 45 degree steps
+    turned to face it
+    """
+    for steps in range(1, 9):
+        if (heading + sign * steps) % 8 in streets:
+            return ((heading + sign * steps) % 8, steps)
+    return (heading, 0)
+
+
+def depart_time(streets, heading, depart, step_t):
+    """Returns the time to turn from heading to depart in one spin through the
+    set of headings with streets, the way turn_plan turns
+    """
+    if depart == None or depart == heading:
+        return 0
+    plans = []
+    for direction, sign in [("LEFT", 1), ("RIGHT", -1)]:
+        steps = (sign * (depart - heading)) % 8
+        passed = len([i for i in range(1, steps)
+                      if (heading + sign * i) % 8 in streets])
+        plans.append((passed, steps, direction))
+    passed, steps, direction = min(plans)
+    return steps * step_t[direction] + const.TURN_STOP_T
+
+
+def scan_time(inters, heading, legs, layout, depart=None, step_t=None):
+    """Returns the time to scan an intersection from heading by turning legs,
+    when its unknown headings with streets are those in layout, and then turn
+    to depart (by default the heading unx_dir leaves on once scanned). Each
+    leg is a (direction, heading) pair: turn that way street by street, as
+    explore_turn does, until heading is known.
+    """
+    if step_t == None:
+        step_t = {"LEFT": const.TURN_T, "RIGHT": const.TURN_T}
+    streets = set(layout)
+    known = set()
+    for head in range(8):
+        if inters.check_connection(head) in [UND, DRV]:
+            streets.add(head)
+        if inters.check_connection(head) != UNK:
+            known.add(head)
+    seconds = 0
+    for direction, target in legs:
+        sign = const.dirMap[direction[0]][1]
+        while target not in known:
+            nxt, steps = spin(streets, heading, sign)
+            if steps == 0:
+                break
+            known |= {(heading + sign * i) % 8 for i in range(1, steps + 1)}
+            seconds += steps * step_t[direction] + const.TURN_STOP_T
+            heading = nxt
+    if depart == None:
+        undriven = [head for head in streets
+                    if inters.check_connection(head) != DRV and
+                    inters.check_blockage(head) != BLK]
+        depart = min(undriven, default=None)
+    return seconds + depart_time(streets, heading, depart, step_t)
+
+
+def scan_plans(inters, heading):
+    """Returns the ways to scan the unknown headings of an intersection from
+    heading: turning one way until the last of them is known, or turning one
+    way until some of them are known and back for the rest. Each is a list of
+    legs, as scan_time takes.
+    """
+    unknown = [head for head in range(8)
+               if inters.check_connection(head) == UNK]
+    plans = []
+    for direction, sign, back in [("LEFT", 1, "RIGHT"), ("RIGHT", -1, "LEFT")]:
+        order = sorted(unknown, key=lambda head:
+                       (sign * (head - heading)) % 8 or 8)
+        for i in range(1, len(order) + 1):
+            legs = [(direction, order[i - 1])]
+            if i < len(order):
+                legs.append((back, order[i]))
+            plans.append(legs)
+    return plans
+
+
+def scan_plan(inters, heading, depart=None, turns=None, prior=None):
+    """Plans the turns which find every unknown heading of an intersection in
+    the least expected time, counting the turn to depart afterward (by
+    default the heading unx_dir leaves on once scanned). Each unknown heading
+    has a street with the prior probability (one for all headings or a tuple
+    of one per heading), given that streets never exist on adjacent headings.
+    Turns are timed by the calibrated TurnRates turns if given.
+
+    Returns the legs to turn (see scan_time), or [] if no heading is unknown.
+    """
+    step_t = {}
+    for direction in ["LEFT", "RIGHT"]:
+        step_t[direction] = (const.TURN_T if turns == None else
+                             turns.step_time(direction))
+    streets = inters.get_streets()
+    known = {head for head in range(8) if streets[head] in [UND, DRV]}
+    plans = scan_plans(inters, heading)
+    if plans == []:
+        return []
+    expected = [0] * len(plans)
+    for layout, weight in layouts(streets, prior):
+        if layout | known == set():
+            continue
+        for i in range(len(plans)):
+            expected[i] += weight * scan_time(inters, heading, plans[i],
+                                              layout, depart, step_t)
+    return plans[expected.index(min(expected))]
+
+
 def unx_dir(inter):
     """Returns a heading which needs to be explored for a given intersection"""
     for i in range(len(inter.get_streets())):
@@ -175,7 +597,7 @@ def unx_dir(inter):
 def l_r_unex(inter, heading):
     """Determines whether turning left or right is better for exploring"""
     l_list = [inter.check_connection((heading + i) % 8) for i in range(4)]
-    r_list = [inter.check_connection((heading + i) % 8) for i in range(4)]
+    r_list = [inter.check_connection((heading - i) % 8) for i in range(4)]
     if const.UND in l_list:
         if const.UND in r_list:
             if r_list.index(const.UND) < l_list.index(const.UND):
@@ -198,20 +620,82 @@ def l_r_unb(inter, heading):
     """Determines whether left or right is better for finding an unblocked 
     intersection
     """
-    l_list = [inter.check_connection((heading + i) % 8) for i in range(4)]
-    r_list = [inter.check_connection((heading + i) % 8) for i in range(4)]
+    l_list = [inter.check_blockage((heading + i) % 8) for i in range(4)]
+    r_list = [inter.check_blockage((heading - i) % 8) for i in range(4)]
     if const.UNB in l_list:
         if const.UNB in r_list:
             if r_list.index(const.UNB) < l_list.index(const.UNB):
                 return "RIGHT"
     return "LEFT"
 
-def l_r_s_to_target(inter, heading, target):
+def target_dist(location, heading, target):
+    """ Returns the distance to target from the end of the street leaving 
+        location on heading, counting diagonal streets slightly further """
+    new_loc = (location[0] + heading_map[heading][0],
+               location[1] + heading_map[heading][1])
+    if heading % 2 != 0:
+        return dist(new_loc, target) + 0.1
+    return dist(new_loc, target)
+
+def turn_dist(graph, predictor, location, heading, direction, target):
+    """ Returns the distance to target expected from the end of the street
+        the robot stops on turning from heading in direction, the turn 
+        stopping on the first street found with the chance predicted,
+        or None if no street can be found """
+    sign = 1 if direction == "LEFT" else -1
+    inters = graph.get_intersection(location)
+    missed = 1
+    expected = 0
+    for i in range(1, 8):
+        turned = (heading + sign * i) % 8
+        prob = predictor.prob(graph, location, turned)
+        if prob == 0:
+            continue
+        if inters.check_blockage(turned) == BLK:
+            cost = dist(location, target) + const.DEAD_END_DIST
+        else:
+            cost = target_dist(location, turned, target)
+        expected += missed * prob * cost
+        missed *= 1 - prob
+    if missed == 1:
+        return None
+    return expected / (1 - missed)
+
+def expected_dists(graph, predictor, location, heading, target):
+    """ Returns the distance to target expected driving each street which 
+        may leave location other than back the way heading arrived, a street
+        found missing leaving the robot at location """
+    inters = graph.get_intersection(location)
+    missing = dist(location, target) + const.DEAD_END_DIST
+    distances = []
+    for turned in range(8):
+        if turned == (heading + 4) % 8 or inters.check_blockage(turned) != UNB:
+            continue
+        prob = predictor.prob(graph, location, turned)
+        if prob != 0:
+            distances.append(prob * target_dist(location, turned, target) +
+                             (1 - prob) * missing)
+    return distances
+
+def l_r_s_to_target(inter, heading, target, graph=None, predictor=None):
     """ Determines whether left, right, or straight is optimal for directed
-        explore to a target """
+        explore to a target. Given a StreetPrior, the direction leaving the
+        robot closest to the target on the streets expected is taken. """
+    location = inter.get_location()
+    if predictor != None:
+        options = {}
+        if (inter.get_streets()[heading] in [UND, DRV] and 
+            inter.get_blockages()[heading] == UNB):
+            options["STRAIGHT"] = target_dist(location, heading, target)
+        for direction in ["LEFT", "RIGHT"]:
+            expected = turn_dist(graph, predictor, location, heading, 
+                                 direction, target)
+            if expected != None:
+                options[direction] = expected
+        if options != {}:
+            return min(options, key=options.get)
 
     # Determine if left, right, or straight is closest to target
-    location = inter.get_location()
     straight_loc = (location[0] + heading_map[heading][0],
                     location[1] + heading_map[heading][1])
     left_loc = (location[0] + heading_map[(heading + 2) % 8][0],
@@ -258,22 +742,27 @@ def l_r_s_to_target(inter, heading, target):
         return "RIGHT"
     return "LEFT"
 
-def closest_subtarget(graph, location, heading, target, djik):
+def closest_subtarget(graph, location, heading, target, djik, 
+                      predictor=None):
     """ Determines the closest subtarget to drive to for directed explore.
         The closest subtarget is an unexplored intersection with a road
         that could potentially connect to an intersection with the closest
-        distance to the target """
-    unexp_inters = graph.unexp_inters()
-    if unexp_inters == []:
+        distance to the target. Unexplored intersections are considered 
+        nearest the target first, stopping once none left can be closer. 
+        Given a StreetPrior, roads are weighed by the chance they exist, a
+        missing road leaving the robot at the subtarget. """
+    if graph.closest_unexplored(target) == None:
         raise ("No unexplored intersections could be found...robot stuck")
-    print("Unexplored inters " + str(unexp_inters))
     closest_subtarget = None
     closest_distance = inf
     closest_path_len = inf
-    for subtarget in unexp_inters:
+    for subtarget in graph.spatial().by_distance(target, unexplored=True):
+        # roads from the subtarget end at most a diagonal street closer
+        if dist(subtarget, target) - sqrt(2) > closest_distance:
+            break
         # get heading the robot will face if it travels to the subtarget
         djik.reset(subtarget)
-        path = djik.gen_path(location)
+        path = djik.gen_path(location, heading)
         subheading = heading
 
         if path == []:
@@ -283,19 +772,23 @@ def closest_subtarget(graph, location, heading, target, djik):
             subheading = path[-1]
         # determine distances of adjacent intersections to target
         # make sure that unexplored streets exist in possible directions
-        streets = graph.get_intersection(location).get_streets()
-        blockages = graph.get_intersection(location).get_blockages()
-        distances = []
-        for i in range(0, 8):
-            if i != 4:
-                condition = streets[(subheading + i) % 8]
-                blockage = blockages[(subheading + i) % 8]
-                if (condition == UND or condition == UNK or condition == DRV) and blockage == UNB:
-                    new_loc = (subtarget[0] + heading_map[i][0], subtarget[1] + heading_map[i][1])
-                    if i % 2 != 0:
-                        distances.append(dist(new_loc, target) + 0.1)
-                    else:
-                        distances.append(dist(new_loc, target))
+        if predictor != None:
+            distances = expected_dists(graph, predictor, subtarget, 
+                                       subheading, target)
+        else:
+            streets = graph.get_intersection(location).get_streets()
+            blockages = graph.get_intersection(location).get_blockages()
+            distances = []
+            for i in range(0, 8):
+                if i != 4:
+                    condition = streets[(subheading + i) % 8]
+                    blockage = blockages[(subheading + i) % 8]
+                    if (condition == UND or condition == UNK or condition == DRV) and blockage == UNB:
+                        new_loc = (subtarget[0] + heading_map[i][0], subtarget[1] + heading_map[i][1])
+                        if i % 2 != 0:
+                            distances.append(dist(new_loc, target) + 0.1)
+                        else:
+                            distances.append(dist(new_loc, target))
         # check if there is a new closest option
         for distance in distances:
             if distance < closest_distance:
@@ -309,7 +802,7 @@ def closest_subtarget(graph, location, heading, target, djik):
                 closest_distance = distance
                 closest_path_len = len(path)
     print("TARG: " + str(closest_subtarget))
-    if subtarget == location:
+    if closest_subtarget == location:
         return None
     return closest_subtarget
 
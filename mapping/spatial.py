@@ -0,0 +1,185 @@
+"""
+This module implements a spatial index over the intersection locations of a
+MapGraph, used to answer nearest-intersection and radius queries without
+measuring the distance to every intersection in the map.
+
+Locations are hashed into square grid cells, and queries search outwards from
+the query point ring of cells by ring. The index observes its MapGraph, so it
+is kept up to date as intersections are added and explored, and keeps a
+second grid holding only the unexplored intersections.
+
+Authors: Edward Speer, Garrett Knuf
+Date: 6/14/23
+"""
+
+from heapq import heappush, heappop
+from math import dist
+from constants import SPATIAL_CELL
+
+
+class SpatialIndex:
+    """ A grid hash of the intersection locations in a MapGraph, and of the
+    locations of the unexplored intersections in it.
+
+    Inputs: graph - the MapGraph to index
+            cell - the side length of a grid cell
+    """
+
+    def __init__(self, graph, cell=SPATIAL_CELL):
+        self.graph = graph
+        self.cell = cell
+        self.all = {}
+        self.unexplored = {}
+        self.bounds = None
+        for inters in graph:
+            self.insert(self.all, inters.get_location())
+            self.update(inters.get_location())
+        graph.observe(self.record)
+
+    def key(self, location):
+        """Returns the grid cell containing a location"""
+        return (location[0] // self.cell, location[1] // self.cell)
+
+    def insert(self, cells, location):
+        """Adds a location to a grid"""
+        key = self.key(location)
+        if key not in cells:
+            cells[key] = set()
+        cells[key].add(location)
+        if self.bounds == None:
+            self.bounds = [key[0], key[1], key[0], key[1]]
+        else:
+            self.bounds = [min(self.bounds[0], key[0]),
+                           min(self.bounds[1], key[1]),
+                           max(self.bounds[2], key[0]),
+                           max(self.bounds[3], key[1])]
+
+    def remove(self, cells, location):
+        """Removes a location from a grid if it is in it"""
+        key = self.key(location)
+        if key in cells:
+            cells[key].discard(location)
+            if len(cells[key]) == 0:
+                del cells[key]
+
+    def update(self, location):
+        """Moves a location in or out of the unexplored grid to match whether
+        its intersection is explored
+        """
+        if self.graph.get_intersection(location).is_explored():
+            self.remove(self.unexplored, location)
+        else:
+            self.insert(self.unexplored, location)
+
+    def record(self, record):
+        """MapGraph observer keeping the index up to date"""
+        if record[0] == "add":
+            self.insert(self.all, record[1])
+            self.update(record[1])
+        elif record[0] in ["st", "bk"]:
+            self.update(record[1])
+
+    def check(self):
+        """Raises an Exception unless the unexplored grid holds exactly the
+        unexplored intersections of the map
+        """
+        indexed = set()
+        for cell in self.unexplored.values():
+            indexed |= cell
+        if indexed != set(self.graph.unexp_inters()):
+            raise Exception("SpatialIndex.check: Unexplored grid is stale")
+
+    def ring(self, center, radius):
+        """Generates the grid cells at a Chebyshev distance of radius cells
+        from the center cell
+        """
+        if radius == 0:
+            yield center
+            return
+        for i in range(-radius, radius + 1):
+            yield (center[0] + i, center[1] + radius)
+            yield (center[0] + i, center[1] - radius)
+        for i in range(-radius + 1, radius):
+            yield (center[0] + radius, center[1] + i)
+            yield (center[0] - radius, center[1] + i)
+
+    def by_distance(self, point, unexplored=False):
+        """Generates the indexed locations in order of increasing distance
+        from a point. Only unexplored intersections are generated if
+        unexplored is True.
+        """
+        cells = self.unexplored if unexplored else self.all
+        if self.bounds == None:
+            return
+        center = self.key(point)
+        reach = max(abs(center[0] - self.bounds[0]),
+                    abs(center[0] - self.bounds[2]),
+                    abs(center[1] - self.bounds[1]),
+                    abs(center[1] - self.bounds[3]))
+        heap = []
+        for radius in range(reach + 1):
+            for key in self.ring(center, radius):
+                for location in cells.get(key, ()):
+                    heappush(heap, (dist(point, location), location))
+            #Every location not yet seen is at least this far from the point
+            while heap != [] and heap[0][0] <= radius * self.cell:
+                yield heappop(heap)[1]
+        while heap != []:
+            yield heappop(heap)[1]
+
+    def nearest(self, point, k=1, unexplored=False):
+        """Returns a list of the k indexed locations nearest to a point,
+        nearest first
+        """
+        nearest = []
+        for location in self.by_distance(point, unexplored):
+            if len(nearest) == k:
+                break
+            nearest.append(location)
+        return nearest
+
+    def within(self, point, radius, unexplored=False):
+        """Returns a list of the indexed locations within radius of a point,
+        nearest first
+        """
+        within = []
+        for location in self.by_distance(point, unexplored):
+            if dist(point, location) > radius:
+                break
+            within.append(location)
+        return within
+
+
+def check(size=12, seeds=5, seed=129):
+    """Checks that the index of partly explored size x size simulated maps
+    follows their unexplored intersections as blockages are found and
+    cleared, raising an Exception if not
+    """
+    import io
+    from random import Random
+    from contextlib import redirect_stdout
+    from sim.world import World
+    from sim.multirobot import SimRobot
+    from mapping.MapGraph import MapGraph
+    from constants import UND, BLK
+    rand = Random(seed)
+    for world_seed in range(seeds):
+        graph = MapGraph()
+        robot = SimRobot(0, World(size, size, seed=world_seed), graph, (0, 0))
+        with redirect_stdout(io.StringIO()):
+            while len(graph) < size * size // 2:
+                if robot.step() == None:
+                    break
+        index = graph.spatial()
+        index.check()
+        #Block the undriven streets, some of them the only way on from an
+        # intersection, then clear them all
+        for inters in list(graph):
+            for heading in range(8):
+                if (inters.check_connection(heading) == UND and 
+                    rand.random() < .5):
+                    inters.set_blockage(heading, BLK, None)
+        index.check()
+        graph.clear_blockages()
+        index.check()
+    print(f"Spatial index matched the map on {seeds} maps")
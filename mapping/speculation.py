@@ -0,0 +1,243 @@
+"""
+This module implements speculative planning: while the robot drives a street,
+a planner thread makes the decision the robot will need when it arrives at
+the intersection at the end of it, so that the robot does not sit at the
+intersection while planning.
+
+A speculative plan is made on the planner's copy of the map, kept up to date
+from the map's change records. The robot uses the plan at arrival only if it
+arrived where (and facing the way) the plan expected, and neither the map nor
+the street times and turn rates the plan was timed with have changed since
+the plan was started, as then planning again would give the same result.
+Otherwise the plan is thrown away and the robot plans as usual.
+
+Authors: Edward Speer, Garrett Knuf
+Date: 6/19/23
+"""
+
+import io
+import time
+import threading
+import traceback
+from contextlib import redirect_stdout
+from statistics import median
+from constants import heading_map
+from mapping.planning import TimedDjikstra, find_unexplored, pass_through
+from mapping.tiles import TiledMapGraph
+from mapping.MapGraph import MapGraph
+from mapping.journal import apply
+
+
+def plan_explore(graph, location, heading, scorer=None, times=None, 
+                 turns=None):
+    """Chooses the unexplored intersection to explore next from location, as
+    auto_djik does, and plans the fastest path there. Returns the chosen
+    intersection location (or None) and the path.
+    """
+    if scorer != None:
+        dest = scorer.choose(graph, location, heading)
+    else:
+        dest = find_unexplored(graph, location, [])
+    if dest == None:
+        return (None, [])
+    return (dest, TimedDjikstra(graph, dest, times, turns).gen_path(location, 
+                                                                    heading))
+
+
+def plan_goal(graph, location, heading, dest, times=None, turns=None):
+    """Plans the fastest path from location to a goal in the map"""
+    return TimedDjikstra(graph, dest, times, turns).gen_path(location, heading)
+
+
+def arrival(graph, location, heading, path):
+    """Returns the location the bot stops at driving the street leaving
+    location on heading, passing straight through intersections as
+    adv_line_follow does, and the path left to follow from there
+    """
+    path = list(path)
+    while pass_through(graph, location, heading, path):
+        path.pop(0)
+        location = (location[0] + heading_map[heading][0],
+                    location[1] + heading_map[heading][1])
+    return ((location[0] + heading_map[heading][0],
+             location[1] + heading_map[heading][1]), path)
+
+
+class SpeculativePlanner:
+    """ Runs speculative plans on a worker thread. Plans are identified by a
+    key giving the decision they make and the state the robot is expected to
+    arrive in, such as ("explore", location, heading). Only the latest plan
+    asked for is kept.
+
+    The planner observes the attached MapGraph, and the StreetTimes and
+    TurnRates plans are timed with, counting the changes made to them; a plan
+    is valid if the count has not moved since the plan was started. Plans are
+    made on a copy of the map, built from its records when attached and
+    brought up to date with the records made since before each plan, so the
+    robot thread never changes the map a plan is reading. Tiled maps load and
+    unload tiles as they are read, so are not planned on speculatively.
+    """
+
+    def __init__(self):
+        self.graph = None
+        self.shadow = None
+        self.pending = None
+        self.version = 0
+        self.job = None
+        self.result = None
+        self.current = None
+        self.hits = 0
+        self.misses = 0
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(name="PlannerThread", target=self.run,
+                                       daemon=True)
+        self.thread.start()
+
+    def attach(self, graph):
+        """Starts speculating on graph in place of any previously attached
+        graph, dropping any plans made on it
+        """
+        if self.graph != None:
+            self.graph.ignore(self.record)
+        with self.cond:
+            self.graph = graph
+            self.version += 1
+            self.job = None
+            self.result = None
+            self.shadow = None
+            self.pending = None
+            if not isinstance(graph, TiledMapGraph):
+                self.pending = list(graph.records())
+        graph.observe(self.record)
+
+    def record(self, record):
+        """MapGraph observer which queues the record for the copy of the map
+        and invalidates the plans made so far
+        """
+        with self.cond:
+            self.version += 1
+            if self.pending != None:
+                self.pending.append(record)
+
+    def changed(self, record):
+        """StreetTimes and TurnRates observer which invalidates the plans made
+        so far
+        """
+        with self.cond:
+            self.version += 1
+
+    def speculate(self, key, func, *args):
+        """Queues the plan func(*args) to be made for the arrival state in
+        key, in place of any plan queued and not yet started
+        """
+        if isinstance(self.graph, TiledMapGraph):
+            return
+        with self.cond:
+            if (self.current == key or (self.result != None and 
+                self.result[0] == key and self.result[1] == self.version)):
+                return
+            self.job = (key, func, args)
+            self.cond.notify_all()
+
+    def take(self, key):
+        """Returns the plan made for the arrival state in key, waiting for it
+        if it is being made, or None if there is no valid plan for key
+        """
+        with self.cond:
+            if self.job != None and self.job[0] == key:
+                self.job = None
+            while self.current == key:
+                self.cond.wait()
+            result = self.result
+            self.result = None
+        if (result == None or result[0] != key or
+            result[1] != self.version):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return result[2]
+
+    def run(self):
+        """Planner thread loop, making each plan queued"""
+        while True:
+            with self.cond:
+                while self.job == None:
+                    self.cond.wait()
+                key, func, args = self.job
+                self.job = None
+                self.result = None
+                self.current = key
+                version = self.version
+                graph = self.graph
+                if self.shadow == None:
+                    self.shadow = MapGraph()
+                shadow = self.shadow
+                records = self.pending
+                self.pending = []
+            try:
+                for record in records:
+                    apply(shadow, record)
+                args = tuple(shadow if arg is graph else arg for arg in args)
+                plan = func(*args)
+                result = (key, version, plan)
+            except Exception as ex:
+                print("Speculative plan failed: %s" % repr(ex))
+                traceback.print_exc()
+                result = None
+            with self.cond:
+                self.current = None
+                if version == self.version:
+                    self.result = result
+                self.cond.notify_all()
+
+
+def bench(size=32, trials=40, seed=129):
+    """Compares the time from arriving at an intersection to having the next
+    exploration decision when planning on arrival and when taking the plan
+    made speculatively while driving, over a partly explored size x size map
+    """
+    from sim.world import World
+    from sim.multirobot import SimRobot
+    from mapping.MapGraph import MapGraph
+    from mapping.frontier import InfoGain
+    world = World(size, size, seed=seed)
+    graph = MapGraph()
+    scorer = InfoGain()
+    robot = SimRobot(0, world, graph, (0, 0), scorer=scorer)
+    with redirect_stdout(io.StringIO()):
+        while len(graph) < size * size // 2:
+            if robot.step() == None:
+                break
+    stops = [inters.get_location() for inters in graph
+             if inters.is_explored()][:trials]
+    spec = SpeculativePlanner()
+    spec.attach(graph)
+
+    direct = []
+    hidden = []
+    for location in stops:
+        heading = robot.heading
+        start = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            plan = plan_explore(graph, location, heading, scorer)
+        direct.append(time.perf_counter() - start)
+
+        key = ("explore", location, heading)
+        spec.speculate(key, plan_explore, graph, location, heading, scorer)
+        #Driving the street to location takes longer than any plan
+        while spec.current != None or spec.job != None:
+            time.sleep(.001)
+        start = time.perf_counter()
+        taken = spec.take(key)
+        hidden.append(time.perf_counter() - start)
+        if taken != plan:
+            raise Exception("speculation.bench: Speculative plan differs")
+    print(f"{len(graph)} intersection map, {len(stops)} arrivals")
+    print(f"Planning on arrival: {1000 * median(direct):8.3f} ms median, " +
+          f"{1000 * max(direct):8.3f} ms max")
+    print(f"Speculative plan:    {1000 * median(hidden):8.3f} ms median, " +
+          f"{1000 * max(hidden):8.3f} ms max")
+
+
+if __name__ == "__main__":
+    bench()
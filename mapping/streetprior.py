@@ -0,0 +1,255 @@
+"""
+This module predicts whether unknown headings of the map have streets. Tape
+floors are near-regular grids: streets run on the same headings at most
+intersections, carry straight on through intersections, and line up with the
+streets of neighboring intersections. The predictor counts how often known
+headings have streets given the streets around them, on the current map and
+on any saved maps, and gives each unknown heading the chance it has a street
+in the same surroundings.
+
+Authors: Edward Speer, Garrett Knuf
+Date: 6/19/23
+"""
+
+import constants as const
+from constants import heading_map, UNK, UND, DRV, NNE
+
+
+def neighbor(location, heading):
+    """Returns the location next to location on heading"""
+    return (location[0] + heading_map[heading][0],
+            location[1] + heading_map[heading][1])
+
+
+def label(graph, location, heading):
+    """Returns whether the intersection at location has a street on heading:
+    'S' if it does, 'N' if it does not, and 'U' if that is unknown. The
+    streets of intersections not yet mapped are known from the mapped
+    intersections at their other ends.
+    """
+    inters = graph.get_intersection(location)
+    if inters == None:
+        inters = graph.get_intersection(neighbor(location, heading))
+        heading = (heading + 4) % 8
+    if inters == None:
+        return 'U'
+    status = inters.check_connection(heading)
+    if status in [UND, DRV]:
+        return 'S'
+    if status == NNE:
+        return 'N'
+    return 'U'
+
+
+def beside(graph, location, heading):
+    """Returns whether a street is known on a heading adjacent to heading,
+    which leaves no room for a street on heading
+    """
+    return 'S' in [label(graph, location, (heading + side) % 8)
+                   for side in [1, -1]]
+
+
+def features(graph, location, heading):
+    """Returns the surroundings of a heading the predictor conditions on:
+    whether it is diagonal, whether the street carries on through the
+    intersection (the opposite heading), whether the street behind on the same
+    line has it, and whether the neighbors to either side have streets
+    parallel to it
+    """
+    sides = [label(graph, neighbor(location, (heading + side) % 8), heading)
+             for side in [2, -2]]
+    if 'S' in sides:
+        parallel = 'S'
+    elif sides == ['N', 'N']:
+        parallel = 'N'
+    else:
+        parallel = 'U'
+    return (heading % 2, label(graph, location, (heading + 4) % 8),
+            label(graph, neighbor(location, (heading + 4) % 8), heading), 
+            parallel)
+
+
+class StreetPrior:
+    """ Predicts the chance that unknown headings have streets, from counts of
+    the known headings of maps with the same surroundings. Counts of each
+    surrounding are smoothed toward the counts of all headings of the same
+    kind (straight or diagonal), and those toward STREET_PRIOR, each weighing
+    as PRIOR_WEIGHT headings, so that rare surroundings lean on common ones.
+
+    Headings next to a known street are left out of the counts, as the map
+    already knows they have no street. The current map is counted again only
+    after it changes, into new counts. A copy of the map (such as the one the
+    planner thread plans on) is counted apart, so that predicting on it does
+    not take the predictor off the map.
+
+    Inputs: corpus - saved MapGraphs of similar floors counted with the map
+    """
+
+    def __init__(self, corpus=[]):
+        self.base = {}
+        for graph in corpus:
+            self.count(graph, self.base)
+        self.graph = None
+        self.counts = self.base
+        self.stale = True
+        self.copy = None
+        self.copy_counts = self.base
+        self.copy_stale = True
+
+    def attach(self, graph):
+        """Starts predicting on graph in place of any previous graph"""
+        if self.graph != None:
+            self.graph.ignore(self.record)
+        self.graph = graph
+        self.stale = True
+        graph.observe(self.record)
+
+    def record(self, record):
+        """MapGraph observer marking the counts of the map out of date"""
+        self.stale = True
+
+    def copy_record(self, record):
+        """MapGraph observer marking the counts of the copy out of date"""
+        self.copy_stale = True
+
+    def count(self, graph, counts):
+        """Adds the known headings of a map to counts, keyed by surroundings
+        (and by kind alone), as [headings, streets] pairs
+        """
+        for inters in list(graph):
+            location = inters.get_location()
+            for heading in range(8):
+                known = label(graph, location, heading)
+                if known == 'U' or beside(graph, location, heading):
+                    continue
+                key = features(graph, location, heading)
+                for entry in [key, key[0]]:
+                    pair = counts.setdefault(entry, [0, 0])
+                    pair[0] += 1
+                    pair[1] += known == 'S'
+
+    def refresh(self, graph):
+        """Counts the map again if it changed, and returns its counts. The
+        first map given is attached if none is, and any other map is counted
+        as the copy.
+        """
+        if self.graph == None:
+            self.attach(graph)
+        if graph is self.graph:
+            if self.stale:
+                self.stale = False
+                self.counts = self.recount(graph)
+            return self.counts
+        if graph is not self.copy:
+            if self.copy != None:
+                self.copy.ignore(self.copy_record)
+            self.copy = graph
+            self.copy_stale = True
+            graph.observe(self.copy_record)
+        if self.copy_stale:
+            self.copy_stale = False
+            self.copy_counts = self.recount(graph)
+        return self.copy_counts
+
+    def recount(self, graph):
+        """Returns new counts of the saved maps and graph"""
+        counts = {key: list(pair) for key, pair in self.base.items()}
+        self.count(graph, counts)
+        return counts
+
+    def prob(self, graph, location, heading):
+        """Returns the chance that the intersection at location has a street
+        on heading
+        """
+        known = label(graph, location, heading)
+        if known != 'U':
+            return 1 if known == 'S' else 0
+        if beside(graph, location, heading):
+            return 0
+        counts = self.refresh(graph)
+        key = features(graph, location, heading)
+        total, streets = counts.get(key[0], [0, 0])
+        kind = ((streets + const.PRIOR_WEIGHT * const.STREET_PRIOR) /
+                (total + const.PRIOR_WEIGHT))
+        total, streets = counts.get(key, [0, 0])
+        return (streets + const.PRIOR_WEIGHT * kind) / (total +
+                                                         const.PRIOR_WEIGHT)
+
+    def probs(self, graph, location):
+        """Returns the chance of a street on each heading of location"""
+        return tuple(self.prob(graph, location, heading) for heading in range(8))
+
+
+def load_corpus(map_nums=const.PRIOR_MAPS):
+    """Returns the saved maps of the given numbers to count in a StreetPrior"""
+    from mapping.planning import from_pickle
+    corpus = []
+    for map_num in map_nums:
+        graph = from_pickle(map_num)
+        if graph != None:
+            corpus.append(graph)
+    return corpus
+
+
+
+def bench(size=16, seeds=5, explored=(.25, .5)):
+    """Compares how well the predictor and the flat STREET_PRIOR predict the
+    streets of partly explored size x size worlds which the map leaves
+    unknown, at the intersections mapped and those next to them: the mean
+    squared error of the chance given each unknown heading with room for a
+    street, and the mean error of the new streets the frontier scorer expects
+    at each intersection
+    """
+    import io
+    from contextlib import redirect_stdout
+    from sim.world import World
+    from sim.multirobot import SimRobot
+    from mapping.MapGraph import MapGraph
+    from mapping.frontier import InfoGain, unknown_gain
+    print(f"{size} x {size} worlds, average over {seeds} seeds " +
+          "(flat prior / predicted)")
+    print("explored  headings    heading error     streets error")
+    for part in explored:
+        headings = 0
+        places = 0
+        errors = [0, 0]
+        gains = [0, 0]
+        for seed in range(seeds):
+            world = World(size, size, seed=seed)
+            graph = MapGraph()
+            robot = SimRobot(0, world, graph, (0, 0), scorer=InfoGain())
+            with redirect_stdout(io.StringIO()):
+                while len(graph) < part * size * size:
+                    if robot.step() == None:
+                        break
+            predictor = StreetPrior()
+            locations = set()
+            for inters in list(graph):
+                for heading in range(8):
+                    locations.add(neighbor(inters.get_location(), heading))
+            for location in locations:
+                if not (0 <= location[0] < size and 0 <= location[1] < size):
+                    continue
+                unknown = [heading for heading in range(8)
+                           if label(graph, location, heading) == 'U']
+                if unknown == []:
+                    continue
+                streets = {heading: {'S': UND, 'N': NNE, 'U': UNK}[
+                           label(graph, location, heading)] 
+                           for heading in range(8)}
+                probs = predictor.probs(graph, location)
+                found = 0
+                for heading in unknown:
+                    street = world.street(location, heading) == UND
+                    found += street
+                    if beside(graph, location, heading):
+                        continue
+                    headings += 1
+                    errors[0] += (const.STREET_PRIOR - street) ** 2
+                    errors[1] += (probs[heading] - street) ** 2
+                places += 1
+                gains[0] += abs(unknown_gain(streets) - found)
+                gains[1] += abs(unknown_gain(streets, probs) - found)
+        print(f"{100 * part:7.0f}% {headings:9d} " +
+              f"{errors[0] / headings:7.3f} / {errors[1] / headings:5.3f} " +
+              f"{gains[0] / places:9.2f} / {gains[1] / places:4.2f}")
@@ -0,0 +1,344 @@
+"""
+This module implements a MapGraph backed by a memory-mapped tile file, for
+maps with far more intersections than fit in memory as Intersection objects.
+
+The plane is split into square tiles of TILE_SIZE x TILE_SIZE locations. The
+tile file holds a slot for each tile with an intersection in it, and each
+slot holds a packed record for every location in the tile (all little
+endian):
+    slot header: i32 tile x, i32 tile y
+    records:     u16 street labels, u8 blockage mask, u8 link mask, u8 present
+Street labels and blockages are packed as in map files (see mapping.mapfile).
+Bit h of the link mask is set if a street connects the location to the
+location on heading h.
+
+Intersections are only built for tiles in use, which are kept in a least
+recently used cache of TILE_CACHE tiles. Tiles leaving the cache are written
+back to the file, so an Intersection should be looked up again with
+get_intersection rather than held onto across long operations.
+
+Authors: Edward Speer, Garrett Knuf
+Date: 6/14/23
+"""
+
+import os
+import mmap
+import time
+import struct
+import weakref
+import resource
+import tempfile
+from collections import OrderedDict
+from constants import TILE_SIZE, TILE_CACHE, heading_map, invert_h_map, \
+                      CONDITIONS
+from mapping.MapGraph import MapGraph, Intersection
+from mapping.mapfile import pack_streets, pack_blockages, unpack_streets, \
+                            unpack_blockages
+import mapping.mapfile as mapfile
+
+MAGIC = b'NTIL'
+VERSION = 1
+
+HEADER = struct.Struct('<4sHHI')
+SLOT = struct.Struct('<ii')
+CELL = struct.Struct('<HBBB')
+SLOT_SIZE = SLOT.size + TILE_SIZE * TILE_SIZE * CELL.size
+
+
+def tile_of(location):
+    """Returns the key of the tile containing a location"""
+    return (location[0] // TILE_SIZE, location[1] // TILE_SIZE)
+
+
+class TiledMapGraph(MapGraph):
+    """ A MapGraph whose intersections are stored in a memory-mapped tile file
+    and only built into Intersection objects while their tile is cached. It
+    offers the same interface as a MapGraph.
+
+    Inputs: filename - the tile file, which is opened if it exists and
+                       created otherwise
+            location, heading, prev_loc - as for MapGraph, to start a new map
+            cache - the number of tiles to keep built
+    """
+
+    def __init__(self, filename, location=None, heading=None, prev_loc=None,
+                 cache=TILE_CACHE):
+        self.observers = []
+        self.index = None
+        self.filename = filename
+        self.cache = cache
+        self.hot = OrderedDict()
+        self.live = weakref.WeakValueDictionary()
+        self.slots = {}
+        self.count = 0
+        if not os.path.exists(filename):
+            with open(filename, 'wb') as filen:
+                filen.write(HEADER.pack(MAGIC, VERSION, TILE_SIZE, 0))
+                filen.write(bytes(SLOT_SIZE))
+        self.file = open(filename, 'r+b')
+        self.mm = mmap.mmap(self.file.fileno(), 0)
+        magic, version, size, num_slots = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION or size != TILE_SIZE:
+            raise Exception("TiledMapGraph: Incompatible tile file")
+        for slot in range(num_slots):
+            base = HEADER.size + slot * SLOT_SIZE
+            self.slots[SLOT.unpack_from(self.mm, base)] = slot
+            present = self.mm[base + SLOT.size + CELL.size - 1:
+                              base + SLOT_SIZE:CELL.size]
+            self.count += len(present) - present.count(0)
+        if location != None:
+            origin = Intersection(prev_loc)
+            point = Intersection(location, heading)
+            self.add_intersection(point)
+            self.add_intersection(origin)
+            self.link(point, origin)
+
+    def __getstate__(self):
+        raise TypeError("TiledMapGraph: Save tiled maps with mapfile.save")
+
+    def offset(self, location):
+        """Returns the offset in the file of the record of a location, or None
+        if its tile has no slot
+        """
+        slot = self.slots.get(tile_of(location))
+        if slot == None:
+            return None
+        x = location[0] % TILE_SIZE
+        y = location[1] % TILE_SIZE
+        return (HEADER.size + slot * SLOT_SIZE + SLOT.size +
+                (y * TILE_SIZE + x) * CELL.size)
+
+    def new_slot(self, key):
+        """Adds a slot for a tile to the file, growing the file as needed"""
+        slot = len(self.slots)
+        end = HEADER.size + (slot + 1) * SLOT_SIZE
+        if end > len(self.mm):
+            self.mm.close()
+            self.file.truncate(HEADER.size + 2 * (slot + 1) * SLOT_SIZE)
+            self.mm = mmap.mmap(self.file.fileno(), 0)
+        SLOT.pack_into(self.mm, end - SLOT_SIZE, key[0], key[1])
+        self.slots[key] = slot
+        HEADER.pack_into(self.mm, 0, MAGIC, VERSION, TILE_SIZE, len(self.slots))
+
+    def tile(self, key):
+        """Returns the dictionary of locations to Intersections in a tile,
+        building it if it isn't cached
+        """
+        if key in self.hot:
+            self.hot.move_to_end(key)
+            return self.hot[key]
+        cells = {}
+        if key in self.slots:
+            base = HEADER.size + self.slots[key] * SLOT_SIZE + SLOT.size
+            records = CELL.iter_unpack(self.mm[base:base + SLOT_SIZE -
+                                               SLOT.size])
+            i = 0
+            for code, mask, _, present in records:
+                if present:
+                    location = (key[0] * TILE_SIZE + i % TILE_SIZE,
+                                key[1] * TILE_SIZE + i // TILE_SIZE)
+                    inters = self.live.get(location)
+                    if inters == None:
+                        inters = Intersection(location)
+                        inters.streets = unpack_streets(code)
+                        inters.blockages = unpack_blockages(mask)
+                        inters.packed = (code, mask)
+                        inters.observer = self.notify
+                        self.live[location] = inters
+                    cells[location] = inters
+                i += 1
+        self.hot[key] = cells
+        while len(self.hot) > self.cache:
+            self.write_back(self.hot.popitem(last=False)[1])
+        return cells
+
+    def write_back(self, cells):
+        """Writes the streets and blockages of built Intersections to the file"""
+        for location in cells:
+            offset = self.offset(location)
+            code = pack_streets(cells[location])
+            mask = pack_blockages(cells[location])
+            _, _, links, _ = CELL.unpack_from(self.mm, offset)
+            CELL.pack_into(self.mm, offset, code, mask, links, 1)
+
+    def flush(self):
+        """Writes every built Intersection back to the file"""
+        self.write_back(dict(self.live.items()))
+        self.mm.flush()
+
+    def close(self):
+        """Writes back all Intersections and closes the tile file"""
+        self.flush()
+        self.hot.clear()
+        self.mm.close()
+        self.file.close()
+
+    def add_intersection(self, inters):
+        """Adds a new Intersection with no streets driven to the graph"""
+        location = inters.get_location()
+        key = tile_of(location)
+        if key not in self.slots:
+            self.new_slot(key)
+        self.tile(key)[location] = inters
+        self.live[location] = inters
+        CELL.pack_into(self.mm, self.offset(location), pack_streets(inters),
+                       pack_blockages(inters), 0, 1)
+        self.count += 1
+        inters.observer = self.notify
+        for record in inters.records():
+            self.notify(record)
+
+    def links(self, location):
+        """Returns the link mask of a location"""
+        return self.mm[self.offset(location) + CELL.size - 2]
+
+    def link(self, inters1, inters2):
+        """Records that a street connects two Intersections in the graph"""
+        loc1 = inters1.get_location()
+        loc2 = inters2.get_location()
+        heading = invert_h_map[(loc2[0] - loc1[0], loc2[1] - loc1[1])]
+        if self.links(loc1) & (1 << heading):
+            return
+        offset = self.offset(loc1) + CELL.size - 2
+        self.mm[offset] = self.mm[offset] | (1 << heading)
+        offset = self.offset(loc2) + CELL.size - 2
+        self.mm[offset] = self.mm[offset] | (1 << ((heading + 4) % 8))
+        self.notify(("lnk", loc1, loc2))
+
+    def adjacent(self, inters):
+        """Returns the list of Intersections connected to inters by driven
+        streets, blocked or not
+        """
+        location = inters.get_location()
+        links = self.links(location)
+        adjacent = []
+        for heading in range(8):
+            if links & (1 << heading):
+                adjacent.append(self.get_intersection(
+                    (location[0] + heading_map[heading][0],
+                     location[1] + heading_map[heading][1])))
+        return adjacent
+
+    def get_intersection(self, location):
+        """
+        Given a location, extracts the corresponding intersection object
+        from the graph
+        """
+        key = tile_of(location)
+        if key not in self.slots:
+            return None
+        return self.tile(key).get(location)
+
+    def contains(self, location):
+        """
+        Returns true if an intersection location is in the map, false otherwise
+        """
+        return self.get_intersection(location) != None
+
+    def get_graph(self):
+        """
+        Returns a dictionary of each Intersection to its adjacent Intersections.
+        This builds every Intersection in the map at once.
+        """
+        return {inters: self.adjacent(inters) for inters in self}
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        """
+        Iterates over the Intersections in the map a tile at a time, so that
+        only the tiles in the cache are built at once
+        """
+        for key in list(self.slots):
+            yield from list(self.tile(key).values())
+
+
+def from_mapfile(filename, tiles_name):
+    """Converts a map file to a tile file, writing the packed records of the
+    map file straight into the tile file without building any Intersections.
+    Returns the TiledMapGraph of the tile file.
+    """
+    with open(filename, 'rb') as filen:
+        buffer = filen.read()
+    _, _, _, num_inters, num_edges = mapfile.HEADER.unpack_from(buffer, 0)
+    start = mapfile.HEADER.size
+    end = start + num_inters * mapfile.INTERS.size
+    if os.path.exists(tiles_name):
+        os.remove(tiles_name)
+    graph = TiledMapGraph(tiles_name)
+    locations = []
+    for x, y, code, mask in mapfile.INTERS.iter_unpack(buffer[start:end]):
+        if tile_of((x, y)) not in graph.slots:
+            graph.new_slot(tile_of((x, y)))
+        CELL.pack_into(graph.mm, graph.offset((x, y)), code, mask, 0, 1)
+        locations.append((x, y))
+    graph.count = num_inters
+    for i, j in mapfile.EDGE.iter_unpack(
+            buffer[end:end + num_edges * mapfile.EDGE.size]):
+        loc1 = locations[i]
+        loc2 = locations[j]
+        heading = invert_h_map[(loc2[0] - loc1[0], loc2[1] - loc1[1])]
+        offset = graph.offset(loc1) + CELL.size - 2
+        graph.mm[offset] = graph.mm[offset] | (1 << heading)
+        offset = graph.offset(loc2) + CELL.size - 2
+        graph.mm[offset] = graph.mm[offset] | (1 << ((heading + 4) % 8))
+    return graph
+
+
+def bench(size=1000):
+    """Benchmarks opening and planning over a size x size grid map stored as
+    a tile file, reporting the resident memory used
+    """
+    from mapping.planning import Djikstra
+    tempdir = tempfile.mkdtemp()
+    filename = os.path.join(tempdir, 'map' + mapfile.MAP_EXT)
+    tiles_name = os.path.join(tempdir, 'map.tiles')
+    try:
+        mapfile.save(mapfile.grid_map(size // 4), filename)
+        start = time.perf_counter()
+        from_mapfile(filename, tiles_name).close()
+        converted = time.perf_counter() - start
+        os.remove(filename)
+
+        #Build the full size map in the tile file, a column at a time
+        os.remove(tiles_name)
+        graph = TiledMapGraph(tiles_name)
+        code = pack_streets(mapfile.grid_map(1).get_intersection((0, 0)))
+        for x in range(size):
+            for y in range(size):
+                if tile_of((x, y)) not in graph.slots:
+                    graph.new_slot(tile_of((x, y)))
+                links = (0b1 if y + 1 < size else 0) | \
+                        (0b100 if x > 0 else 0) | \
+                        (0b10000 if y > 0 else 0) | \
+                        (0b1000000 if x + 1 < size else 0)
+                CELL.pack_into(graph.mm, graph.offset((x, y)), code, 0, links, 1)
+        graph.close()
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        start = time.perf_counter()
+        graph = TiledMapGraph(tiles_name)
+        opened = time.perf_counter() - start
+        start = time.perf_counter()
+        djik = Djikstra(graph, (0, 0))
+        path = djik.gen_path((size // 2, size // 2))
+        planned = time.perf_counter() - start
+        start = time.perf_counter()
+        complete = graph.is_complete()
+        scanned = time.perf_counter() - start
+        graph.close()
+
+        print(f"{size * size} intersection tile map, {TILE_CACHE} tile cache")
+        print(f"Convert {(size // 4) ** 2} intersection map file: " +
+              f"{converted:7.3f} s")
+        print(f"Open:               {opened:7.3f} s")
+        print(f"Plan {len(path)} step path: {planned:7.3f} s")
+        print(f"Scan whole map:     {scanned:7.3f} s (complete: {complete})")
+        print(f"Peak resident memory {rss / 1024:.0f} MB before planning, " +
+              f"{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f}" +
+              " MB after")
+    finally:
+        for name in os.listdir(tempdir):
+            os.remove(os.path.join(tempdir, name))
+        os.rmdir(tempdir)
@@ -0,0 +1,156 @@
+"""
+This module keeps the measured time to drive each street of a map, so that
+route planning can use how long streets actually take (diagonal, curved or
+badly taped streets take longer than the planning time model says) and get
+better with each run on the same floor.
+
+Times are kept per directed street, as a street is not always as fast one
+way as the other, and saved as a text file next to the map, one line per
+street:
+    x y heading count mean m2 last
+where (x, y) is the location the street leaves on heading, mean and m2 the
+running mean and sum of squared differences from it of the times measured
+(in seconds), and last the time the street was last driven.
+
+Authors: Edward Speer, Garrett Knuf
+Date: 6/19/23
+"""
+
+import os
+import sys
+import time
+import tempfile
+from math import sqrt
+from constants import PICKLE_PATH, TIMES_PATH, TIMES_EXT
+
+
+def times_path(map_num=None):
+    """Returns the street times file of the stored map with the given
+    number, or of the journaled map if none
+    """
+    if map_num == None:
+        return TIMES_PATH
+    return f'{PICKLE_PATH}map{map_num}{TIMES_EXT}'
+
+
+class StreetTimes:
+    """ The statistics of the time taken to drive each directed street of a
+    map, updated with each time measured by Welford's method so no times need
+    be kept.
+
+    Inputs: path - the file the times are loaded from and saved to
+            load - whether to load the times saved in path, False for a new
+                   map whose times are to replace them
+    """
+
+    def __init__(self, path=TIMES_PATH, load=True):
+        self.path = path
+        self.stats = {}
+        self.observers = []
+        if load and os.path.exists(path):
+            self.load(path)
+
+    def record(self, location, heading, seconds):
+        """Records the time taken to drive the street leaving location on
+        heading
+        """
+        count, mean, m2, last = self.stats.get((location, heading),
+                                               (0, 0, 0, 0))
+        count += 1
+        delta = seconds - mean
+        mean += delta / count
+        m2 += delta * (seconds - mean)
+        self.stats[(location, heading)] = (count, mean, m2, time.time())
+        for callback in self.observers:
+            callback(("tm", location, heading))
+
+    def observe(self, callback):
+        """Registers callback to be called with ("tm", location, heading)
+        each time a street time is recorded
+        """
+        self.observers.append(callback)
+
+    def count(self, location, heading):
+        """Returns the number of times the street has been measured"""
+        return self.stats.get((location, heading), (0,))[0]
+
+    def mean(self, location, heading, default=None):
+        """Returns the mean time to drive the street, or default if it has
+        never been measured
+        """
+        if (location, heading) not in self.stats:
+            return default
+        return self.stats[(location, heading)][1]
+
+    def variance(self, location, heading):
+        """Returns the sample variance of the times to drive the street, or 0
+        if it has been measured less than twice
+        """
+        count, mean, m2, last = self.stats.get((location, heading),
+                                               (0, 0, 0, 0))
+        if count < 2:
+            return 0
+        return m2 / (count - 1)
+
+    def last(self, location, heading):
+        """Returns the time the street was last driven, or None"""
+        if (location, heading) not in self.stats:
+            return None
+        return self.stats[(location, heading)][3]
+
+    def slowest(self, num=10):
+        """Returns the num streets with the longest mean times, slowest first,
+        as ((location, heading), mean) pairs
+        """
+        streets = sorted(self.stats.items(), key=lambda item: -item[1][1])
+        return [(street, stats[1]) for street, stats in streets[:num]]
+
+    def load(self, path):
+        """Loads the times saved in a file, replacing any held"""
+        self.stats = {}
+        with open(path, 'r') as times:
+            for line in times:
+                fields = line.split()
+                if len(fields) != 7:
+                    continue
+                self.stats[((int(fields[0]), int(fields[1])),
+                            int(fields[2]))] = (int(fields[3]),
+                                                float(fields[4]),
+                                                float(fields[5]),
+                                                float(fields[6]))
+
+    def save(self, path=None):
+        """Saves the times to a file (by default the one they were loaded
+        from), replacing it only once completely written
+        """
+        if path == None:
+            path = self.path
+        directory = os.path.dirname(path)
+        if directory != '':
+            os.makedirs(directory, exist_ok=True)
+        fd, temp = tempfile.mkstemp(dir=directory if directory != '' else '.')
+        with os.fdopen(fd, 'w') as times:
+            for (location, heading), stats in self.stats.items():
+                times.write(f"{location[0]} {location[1]} {heading} " +
+                            f"{stats[0]} {stats[1]!r} {stats[2]!r} " +
+                            f"{stats[3]!r}\n")
+        os.replace(temp, path)
+
+
+def report(path=TIMES_PATH, num=10):
+    """Prints the slowest streets of the map whose times are saved in path"""
+    times = StreetTimes(path)
+    if times.stats == {}:
+        print(f"No street times saved in {path}")
+        return
+    print(f"Slowest streets of {len(times.stats)} measured in {path}")
+    print("  from      heading    mean (s)  std dev (s)  drives")
+    for (location, heading), mean in times.slowest(num):
+        print(f"  {str(location):10}{heading:7d}{mean:12.2f}" +
+              f"{sqrt(times.variance(location, heading)):13.2f}" +
+              f"{times.count(location, heading):8d}")
+
+
+if __name__ == "__main__":
+    #Report on the given map number, or the journaled map
+    report(times_path(*sys.argv[1:2]))
@@ -8,28 +8,47 @@
 #   Node:       /unicron        (this will use your Pi's name)
 #
 #   Publish:    ~/pose                  geometry_msgs/Pose
+#   Publish:    ~/map                   std_msgs/String
 #   Subscribe:  ~/goal                  geometry_msgs/Point
 #   Subscribe:  ~/explore               std_msgs/Empty
 #
-import rclpy
+#   The pose is published as soon as the robot thread sets the state (and
+#   re-sent every 5s).  Each ~/map message holds lines of map change records
+#   in the journal encoding (see mapping/journal.py).  The first line is
+#   either "diff", followed by the changes since the last message, or
+#   "snapshot", followed by records rebuilding the whole map.  Snapshots are
+#   sent every 5s and whenever the robot starts a new map, so late joining
+#   subscribers catch up; diffs are sent as soon as the map changes.
+#
+#   Without a ROS install, the in-process stand-in in fakeros.py is used.
+#
 import socket
+import threading
+import time
 import traceback
-from interface.ui_util import set_flags_to
+from interface.ui_util import set_flags_to, watch_state
 import constants as const
-from interface.ui_util import post
+from interface.ui_util import post, MessageBuffer
+from mapping.journal import encode
 
 from math import pi, sin, cos
 
-from rclpy.node                 import Node
-from rclpy.time                 import Time, Duration
-from geometry_msgs.msg          import Point, Pose
-from std_msgs.msg               import Empty
+try:
+    import rclpy
+    from rclpy.node             import Node
+    from rclpy.time             import Time, Duration
+    from geometry_msgs.msg      import Point, Pose
+    from std_msgs.msg           import Empty, String
+except ImportError:
+    import fakeros as rclpy
+    from fakeros                import Node, Time, Duration
+    from fakeros                import Point, Pose, Empty, String
 
 
 #   Simple Node Class
 class SimpleNode(Node):
     # Initialization.
-    def __init__(self, name, state, flags_in, out):
+    def __init__(self, name, state, flags_in, out, feed=None):
         # Initialize the node, naming it as specified
         super().__init__(name)
 
@@ -40,29 +59,50 @@ class SimpleNode(Node):
         self.time  = Time()
         self.flags = flags_in
         self.out = out
+        self.state = state
+        self.feed = feed
+        self.epoch = None
+        self.maptime = Time()
 
-        # Create the publisher for the pose information.
+        # Create the publishers for the pose and map information.
         self.pub = self.create_publisher(Pose, '~/pose', 10)
+        self.mappub = self.create_publisher(String, '~/map', 10)
 
         # Then create subscribers for goal and explore commands.
         self.create_subscription(Point, '~/goal',    self.cb_goal,    10)
         self.create_subscription(Empty, '~/explore', self.cb_explore, 10)
 
-        # Finally create a timer to drive the node.
-        self.timer = self.create_timer(0.1, lambda: self.cb_timer(state))
+        # Create guard conditions, triggered from the robot thread, to
+        # publish the pose and map changes as soon as they happen.
+        self.poseguard = self.create_guard_condition(self.cb_pose)
+        watch_state(state, self.poseguard.trigger)
+        self.mapguard = self.create_guard_condition(self.cb_map)
+        if feed != None:
+            feed.listen(self.mapguard.trigger)
+
+        # Finally create a timer to re-send the pose and map snapshots.
+        self.timer = self.create_timer(1.0, lambda: self.cb_timer(state))
 
         # Report and return.
         self.get_logger().info("ROS Node '%s' running" % (name))
 
     # Shutdown.
     def shutdown(self):
-        # Destroy the timer and shut down the node.
+        # Destroy the timer, guard conditions, and shut down the node.
         self.destroy_timer(self.timer)
+        self.destroy_guard_condition(self.poseguard)
+        self.destroy_guard_condition(self.mapguard)
         self.destroy_node()
 
 
     # Timer callback.
     def cb_timer(self, state):
+        self.cb_pose()
+        self.cb_map()
+
+    # Pose callback, run when the state is set and on each timer tick.
+    def cb_pose(self):
+        state = self.state
         if state[0] != (None, None):
             posx  = float(state[0][0])
             posy  = float(state[0][1])
@@ -88,6 +128,30 @@ class SimpleNode(Node):
                 self.theta = theta
                 self.time  = now
 
+    # Map callback, run when the map changes and on each timer tick.
+    def cb_map(self):
+        if self.feed == None or self.feed.graph == None:
+            return
+
+        # Send a snapshot for a new map or if 5s have passed, else a diff.
+        now = self.get_clock().now()
+        if ((self.feed.epoch != self.epoch) or
+            (now - self.maptime > Duration(seconds=5.0))):
+            records = self.feed.drain()
+            lines = ["snapshot"] + [encode(r) for r in self.feed.snapshot()]
+            self.epoch   = self.feed.epoch
+            self.maptime = now
+        else:
+            records = self.feed.drain()
+            if records == []:
+                return
+            lines = ["diff"] + [encode(r) for r in records]
+
+        # Populate the message with the records and send.
+        msg = String()
+        msg.data = "\n".join(lines)
+        self.mappub.publish(msg)
+
 
     # Goal command callback.
     def cb_goal(self, msg):
@@ -100,13 +164,10 @@ class SimpleNode(Node):
         post(f"Received ROS Goal Command ({xgoal}, {ygoal})", self.out)
 
         # Inject the goal command into your robot thread, just as if
-        # you had typed the goal command in the UI thread.
-        cmd = const.CMD_DICT['goal']
-        cmd.append(f"{int(xgoal)},{int(ygoal)}")
-        cmd[const.DATA] = cmd[len(cmd) - 1]
-        print(cmd)
+        # you had typed the goal command in the UI thread.  The command
+        # is copied so the shared command list does not grow per message.
+        cmd = const.CMD_DICT['goal'] + [f"{int(xgoal)},{int(ygoal)}"]
         set_flags_to(self.flags, cmd)
-        print(cmd)
 
     # Explore command callback.
     def cb_explore(self, msg):
@@ -117,8 +178,7 @@ class SimpleNode(Node):
         # Inject the explore command into your robot thread, just as
         # if you had typed the explore command in the UI thread.
         
-        cmd = const.CMD_DICT['explore']
-        cmd.append(None)
+        cmd = const.CMD_DICT['explore'] + [None]
         set_flags_to(self.flags, cmd)
 
 
@@ -126,12 +186,12 @@ class SimpleNode(Node):
 #
 #   Main ROS Thread Code
 #
-def runros(state, flags, out):
+def runros(state, flags, out, feed=None):
     # Initialize ROS.
     rclpy.init()
 
     # Instantiate the simple node, named after the host name.
-    node = SimpleNode(socket.gethostname(), state, flags, out)
+    node = SimpleNode(socket.gethostname(), state, flags, out, feed)
 
     # Spin the node until interrupted.
     try:
@@ -144,5 +204,105 @@ def runros(state, flags, out):
     node.shutdown()
     rclpy.shutdown()
 
+
+#
+#   Command Throughput Benchmark
+#
+def bench(num=10000, paced=200, poll=0.05):
+    # First send paced goal commands one at a time, timing how long each
+    # takes to reach the flags and to be seen by a thread polling the flags
+    # every poll seconds, as the robot thread does between behaviors.  Then
+    # flood ~/goal and ~/explore with num messages each as fast as they can
+    # be published, and count how many commands are lost along the way.
+    rclpy.init()
+    state = [(0, 0), 0]
+    flags = [False] * const.DATA + [None]
+    out = [None, None, MessageBuffer()]
+    node = SimpleNode('bench', state, flags, out)
+    flooder = Node('flooder')
+    goalpub = flooder.create_publisher(Point, '/bench/goal', 10)
+    explorepub = flooder.create_publisher(Empty, '/bench/explore', 10)
+
+    def spin():
+        try:
+            rclpy.spin(node)
+        except BaseException:
+            pass
+    spinner = threading.Thread(name="ROSThread", target=spin)
+    spinner.start()
+
+    # Poll the flags, noting each new command seen and when.
+    seen = []
+    done = threading.Event()
+    def master():
+        last = None
+        while not done.is_set():
+            cmd = (flags[const.EXP_FLAG], flags[const.GL_FLAG], 
+                   flags[const.DATA])
+            if cmd != last:
+                seen.append((time.perf_counter(), cmd))
+                last = cmd
+            time.sleep(poll)
+    poller = threading.Thread(name="RobotThread", target=master)
+    poller.start()
+
+    # Paced goals, sent at points spread across the polling interval.
+    to_flags = []
+    to_master = []
+    for i in range(paced):
+        time.sleep((i % 10) * poll / 10)
+        msg = Point()
+        msg.x = float(i + 1)
+        goal = f"{i + 1},0"
+        start = time.perf_counter()
+        goalpub.publish(msg)
+        while flags[const.DATA] != goal:
+            time.sleep(0)
+        to_flags.append(time.perf_counter() - start)
+        while seen[-1][1][2] != goal:
+            time.sleep(0.001)
+        to_master.append(seen[-1][0] - start)
+
+    # Flood of goals and explores, alternating.
+    handled = out[2].posted
+    commands = len(seen)
+    start = time.perf_counter()
+    for i in range(num):
+        msg = Point()
+        msg.x = float(-i)
+        goalpub.publish(msg)
+        explorepub.publish(Empty())
+    flooded = time.perf_counter() - start
+    while True:
+        posted = out[2].posted
+        time.sleep(0.5 + 2 * poll)
+        if out[2].posted == posted:
+            break
+    handled = out[2].posted - handled
+    commands = len(seen) - commands
+
+    done.set()
+    poller.join()
+    rclpy.shutdown()
+    spinner.join()
+    node.shutdown()
+    flooder.destroy_node()
+
+    to_flags.sort()
+    to_master.sort()
+    print(f"{paced} paced goal commands:")
+    print(f"Command to flags:  median {1e3 * to_flags[paced // 2]:7.3f} ms, " +
+          f"max {1e3 * to_flags[-1]:7.3f} ms")
+    print(f"Command to master: median {1e3 * to_master[paced // 2]:7.3f} ms, " +
+          f"max {1e3 * to_master[-1]:7.3f} ms (polling every {poll} s)")
+    print(f"Flood of {num} goal and {num} explore commands published in " +
+          f"{flooded:.3f} s ({2 * num / flooded:.0f} msgs/s):")
+    print(f"Handled by the node: {handled} " +
+          f"({2 * num - handled} dropped from the subscription queues)")
+    print(f"Seen by master:      {commands} " +
+          f"(the rest overwritten in the flags between polls)")
+    print(f"Last command won:    {seen[-1][1][0] == True}")
+
+
 if __name__ == "__main__":
     runros()
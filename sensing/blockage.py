@@ -0,0 +1,97 @@
+"""
+This file implements the blockage detector, which evaluates the ultrasound
+readings taken while the robot approaches and settles on an intersection, so
+that which of the streets leaving it are blocked is known on arrival, without
+stopping to sample the ultrasounds there.
+
+Authors: Edward Speer, Garrett Knuf
+Date: 6/19/23
+"""
+
+import constants as const
+
+
+class BlockageDetector:
+    """ Collects the readings of the left, center and right ultrasounds while
+    the robot drives a street toward an intersection, and projects them onto
+    the streets leaving the intersection on the robot's heading and to either
+    side of it. A reading taken d meters before arriving sees an object r
+    meters ahead of the robot r - d meters down the street ahead, while the
+    side sensors only look down the side streets from (nearly) the
+    intersection itself.
+
+    Only new readings are kept, as the sensors are triggered in turn and
+    read() returns a sensor's last reading until the next.
+
+    Inputs: ultraSense: a ProximitySensor giving the ultrasound readings
+            heading: the heading of the street being driven
+            Ntime: the time the robot started driving the street
+    """
+
+    # Sensors further than this before the intersection do not see down the
+    # side streets
+    SIDE_REACH = .05
+
+    def __init__(self, ultraSense, heading, Ntime):
+        self.ultraSense = ultraSense
+        self.heading = heading
+        self.start = Ntime
+        self.last_time = None
+        self.last = (None, None, None)
+        self.samples = ([], [], [])
+        self.arrived = None
+        self.speed = None
+
+    def update(self, Ntime):
+        """ Records any new readings of the sensors, at most every SAMPLE_T"""
+        if self.last_time != None and Ntime - self.last_time < const.SAMPLE_T:
+            return
+        self.last_time = Ntime
+        reading = self.ultraSense.read()
+        for i in range(3):
+            if reading[i] != self.last[i]:
+                self.samples[i].append((Ntime, reading[i]))
+        self.last = reading
+
+    def arrive(self, Ntime):
+        """ Records that the intersection was reached, giving the speed the
+        street was driven at
+        """
+        self.arrived = Ntime
+        length = const.STREET_LEN
+        if self.heading % 2 == 1:
+            length *= 2 ** .5
+        self.speed = length / max(Ntime - self.start, const.SAMPLE_T)
+
+    def projected(self, sensor):
+        """ Returns the distances of the objects seen by a sensor (0 left, 1
+        center, 2 right) from the intersection along the street it looks
+        down, oldest first
+        """
+        reach = const.APPROACH_REACH if sensor == 1 else self.SIDE_REACH
+        distances = []
+        for Ntime, reading in self.samples[sensor]:
+            before = max(self.arrived - Ntime, 0) * self.speed
+            if before <= reach:
+                distances.append(reading - before if sensor == 1 else reading)
+        return distances
+
+    def verdicts(self):
+        """ Returns whether the streets ahead of the left, center and right
+        sensors are blocked, or None if the intersection has not been reached
+        or a sensor has too few readings of them. A street is blocked if the
+        latest BLOCK_SAMPLES readings all see an object within the blocking
+        distance.
+        """
+        if self.arrived == None:
+            return None
+        threshold = const.BLOCK_DIST
+        if self.heading % 2 != 0:
+            threshold = const.BLOCK_DIST_DIAG
+        verdicts = []
+        for sensor in range(3):
+            distances = self.projected(sensor)[-const.BLOCK_SAMPLES:]
+            if len(distances) < const.BLOCK_SAMPLES:
+                return None
+            verdicts.append(max(distances) <= threshold)
+        return tuple(verdicts)
@@ -0,0 +1,125 @@
+"""
+This file implements the collision predictor, which estimates how fast the
+robot is closing on an object ahead from the center ultrasound readings, so
+that line following slows progressively as the time to contact shrinks and
+stops before contact, rather than stopping hard at a fixed distance.
+
+Authors: Edward Speer, Garrett Knuf
+Date: 6/19/23
+"""
+
+import constants as const
+
+
+class CollisionPredictor:
+    """ Keeps the latest new center ultrasound readings with the times they
+    were taken, and fits a line through them for the closing speed on the
+    object ahead. Readings are up to a full trigger cycle old, so the distance
+    now is extrapolated from the last at the closing speed. Readings beyond
+    COLLISION_RANGE see nothing ahead, and clear the series.
+
+    Given the heading of the street being driven, the object is placed along
+    the street from the first reading of it, taking the robot to have driven
+    at the closing speed until then (as BlockageDetector takes it to), so 
+    that an object the robot would only reach past the intersection ahead is
+    left to be found blocking the street beyond on arrival.
+
+    Inputs: ultraSense: a ProximitySensor giving the ultrasound readings
+            Ntime: the time the robot started driving
+            heading: the heading of the street being driven, if known
+    """
+
+    def __init__(self, ultraSense, Ntime, heading=None):
+        self.ultraSense = ultraSense
+        self.samples = []
+        self.last = None
+        self.start = Ntime
+        self.first = None
+        self.length = None
+        if heading != None:
+            self.length = const.STREET_LEN
+            if heading % 2 == 1:
+                self.length *= 2 ** .5
+        self.update(Ntime)
+
+    def update(self, Ntime):
+        """ Records the center reading if it is new"""
+        reading = self.ultraSense.read()[1]
+        if reading == self.last:
+            return
+        self.last = reading
+        if reading > const.COLLISION_RANGE:
+            self.samples = []
+            self.first = None
+            return
+        if self.first == None:
+            self.first = (Ntime, reading)
+        self.samples.append((Ntime, reading))
+        self.samples = self.samples[-const.COLLISION_SAMPLES:]
+
+    def closing_speed(self):
+        """ Returns the speed the robot is closing on the object ahead (0 if
+        not closing), from a least squares fit of the readings
+        """
+        if len(self.samples) < 2:
+            return 0
+        mean_t = sum(t for t, d in self.samples) / len(self.samples)
+        mean_d = sum(d for t, d in self.samples) / len(self.samples)
+        var = sum((t - mean_t) ** 2 for t, d in self.samples)
+        if var == 0:
+            return 0
+        slope = sum((t - mean_t) * (d - mean_d)
+                    for t, d in self.samples) / var
+        return max(0, -slope)
+
+    def distance(self, Ntime):
+        """ Returns the estimated distance to the object ahead now, or None if
+        there is none in range
+        """
+        if self.samples == []:
+            return None
+        Stime, reading = self.samples[-1]
+        return reading - self.closing_speed() * (Ntime - Stime)
+
+    def time_to_contact(self, Ntime):
+        """ Returns the time until the robot comes within the collision
+        distance of the object ahead at the closing speed, or None if it is
+        not closing on one
+        """
+        dist = self.distance(Ntime)
+        speed = self.closing_speed()
+        if dist == None or speed == 0:
+            return None
+        return max(0, dist - const.OBJECT_COLLISION_DIST) / speed
+
+    def past_end(self):
+        """ Returns whether the object ahead is far enough past the 
+        intersection ahead that the robot reaches the intersection first, 
+        False if the street is not known
+        """
+        if self.length == None or self.first == None:
+            return False
+        Ftime, reading = self.first
+        where = reading + self.closing_speed() * (Ftime - self.start)
+        return where - const.OBJECT_COLLISION_DIST > self.length
+
+    def stop(self, Ntime):
+        """ Returns whether the robot must stop now to avoid contact. Stopping
+        early for the time to contact is only done when contact would come 
+        short of the intersection ahead.
+        """
+        dist = self.distance(Ntime)
+        if dist != None and dist <= const.OBJECT_COLLISION_DIST:
+            return True
+        ttc = self.time_to_contact(Ntime)
+        return ttc != None and ttc <= const.TTC_STOP and not self.past_end()
+
+    def scale(self, Ntime):
+        """ Returns the fraction of the PWM values to drive at, slowing from 1
+        at TTC_SLOW from contact to MIN_SCALE at TTC_STOP
+        """
+        ttc = self.time_to_contact(Ntime)
+        if ttc == None or ttc >= const.TTC_SLOW:
+            return 1
+        frac = max(0, ttc - const.TTC_STOP) / (const.TTC_SLOW - const.TTC_STOP)
+        return const.MIN_SCALE + (1 - const.MIN_SCALE) * frac
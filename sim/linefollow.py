@@ -0,0 +1,457 @@
+"""
+This module simulates the robot following a tape line, to compare the
+feedback table line follow against the PID controller and tune the PID gains
+and speeds without driving the robot.
+
+The robot is simulated as a differential drive with its three IR sensors a
+short way ahead of the wheels. Each wheel's speed lags the speed its PWM value
+drives it at, and the sensors occasionally misread. The tape is straight, or
+weaves gently as badly laid tape does.
+
+Authors: Edward Speer, Garrett Knuf
+Date: 6/19/23
+"""
+
+import sys
+import time
+from math import sin, cos, atan, pi, sqrt
+from random import Random
+import constants as const
+from constants import OBJECT_COLLISION_DIST, COLLISION_RANGE
+from driving.controller import LineController
+from driving.driveSystem import DriveSystem
+from sensing.collision import CollisionPredictor
+from sensing.filters import Filters, LRDetector
+
+#Robot geometry (m): distance between the wheels, distance of the sensors
+#ahead of the wheels, and spacing of the sensors
+TRACK = .13
+AHEAD = .07
+SPACING = .015
+
+#Width of the tape (m)
+TAPE = .019
+
+#Wheel speed (m/s) at full PWM, PWM below which the wheels do not turn, and
+#time constant (s) of the wheel speed following the PWM
+V_MAX = .45
+DEAD = 60
+TAU = .08
+
+#The right motor is weaker, so that the STRAIGHT PWM values drive straight
+RIGHT_TRIM = (const.MODES["STRAIGHT"][None][0] /
+              -const.MODES["STRAIGHT"][None][1])
+
+#Chance of each sensor misreading
+NOISE = .002
+
+#Simulation and control loop periods (s)
+SIM_DT = .001
+CONTROL_DT = .002
+
+#Offset (m) of the sensors from the tape at which the line is lost
+LOST = .05
+
+#Time (s) between new readings of the center ultrasound, which is triggered 
+#every third trigger, and the noise (m) of its readings
+ECHO_T = .15
+ECHO_NOISE = .005
+
+#Distances (m) past the end of the street driven of the blocks which the bot
+#should reach the intersection before stopping for
+PAST = [.12, .16, .2]
+
+#Distance (m) ahead of the sensors of the block approached when stopping
+BLOCK = 1.2
+
+#The courses driven: amplitude and wavelength (m) of the tape's weave
+COURSES = {"straight": (0, 1), "weaving": (.02, .6)}
+
+
+class SimLineSensor:
+    """ A LineSensor reading the IR sensors of a SimBot, so the real
+    detectors can filter the simulated readings
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+
+    def read(self):
+        return self.bot.reading
+
+
+class CountingIO:
+    """ A pigpio interface which only counts the duty cycle writes made"""
+
+    def __init__(self):
+        self.writes = 0
+
+    def set_mode(self, pin, mode):
+        pass
+
+    def set_PWM_range(self, pin, value):
+        pass
+
+    def set_PWM_frequency(self, pin, freq):
+        pass
+
+    def set_PWM_dutycycle(self, pin, duty):
+        self.writes += 1
+
+
+class SimUltrasound:
+    """ A ProximitySensor for a SimBot, with a block the given distance ahead
+    of its start. Only the center sensor sees anything, and it reads anew 
+    every ECHO_T.
+    """
+
+    def __init__(self, bot, seed=0, block=BLOCK):
+        self.bot = bot
+        self.block = bot.x + AHEAD + block
+        self.rand = Random(seed)
+        self.last_time = None
+        self.center = None
+
+    def gap(self):
+        """Returns the distance between the front of the bot and the block"""
+        return self.block - self.bot.x - AHEAD
+
+    def sample(self, Ntime):
+        """Takes a new reading of the center sensor if one is due"""
+        if self.last_time == None or Ntime - self.last_time >= ECHO_T:
+            self.last_time = Ntime
+            self.center = self.gap() + self.rand.gauss(0, ECHO_NOISE)
+
+    def read(self):
+        return (2 * COLLISION_RANGE, self.center, 2 * COLLISION_RANGE)
+
+
+class SimBot:
+    """ A simulated robot on a course, tape weaving by amplitude amp with the
+    given wavelength along the x axis.
+
+    Inputs: course: the (amplitude, wavelength) of the tape
+            offset: the starting offset (m) of the robot left of the tape
+            angle: the starting angle (rad) of the robot left of the tape
+            seed: seed of the sensor noise
+    """
+
+    def __init__(self, course, offset=0, angle=0, seed=0):
+        self.amp, self.wave = course
+        self.x = 0
+        self.y = self.tape(0) + offset
+        self.theta = atan(self.slope(0)) + angle
+        self.v_l = 0
+        self.v_r = 0
+        self.pwm_l = 0
+        self.pwm_r = 0
+        self.rand = Random(seed)
+        self.reading = self.sense()
+
+    def tape(self, x):
+        """Returns the y of the tape at x"""
+        return self.amp * sin(2 * pi * x / self.wave)
+
+    def slope(self, x):
+        """Returns the slope of the tape at x"""
+        return self.amp * 2 * pi / self.wave * cos(2 * pi * x / self.wave)
+
+    def offset(self, lateral=0):
+        """Returns the distance of a sensor (lateral m left of center) left of
+        the tape
+        """
+        x = self.x + AHEAD * cos(self.theta) - lateral * sin(self.theta)
+        y = self.y + AHEAD * sin(self.theta) + lateral * cos(self.theta)
+        return (y - self.tape(x)) * cos(atan(self.slope(x)))
+
+    def sense(self):
+        """Returns the (left, center, right) IR reading"""
+        reading = []
+        for lateral in [SPACING, 0, -SPACING]:
+            seen = int(abs(self.offset(lateral)) < TAPE / 2)
+            if self.rand.random() < NOISE:
+                seen = 1 - seen
+            reading.append(seen)
+        return tuple(reading)
+
+    def pwm(self, PWM_L, PWM_R):
+        """Sets the PWM values driving the wheels, as DriveSystem.pwm"""
+        self.pwm_l = PWM_L
+        self.pwm_r = PWM_R
+
+    def step(self, dt):
+        """Advances the simulation by dt seconds"""
+        self.v_l += dt / TAU * (wheel_speed(self.pwm_l) - self.v_l)
+        self.v_r += dt / TAU * (RIGHT_TRIM * wheel_speed(-self.pwm_r) -
+                                self.v_r)
+        v = (self.v_l + self.v_r) / 2
+        self.theta += (self.v_r - self.v_l) / TRACK * dt
+        self.x += v * cos(self.theta) * dt
+        self.y += v * sin(self.theta) * dt
+        self.reading = self.sense()
+
+
+def wheel_speed(pwm):
+    """Returns the speed a wheel is driven at by a PWM value"""
+    if abs(pwm) <= DEAD:
+        return 0
+    speed = V_MAX * (min(abs(pwm), 255) - DEAD) / (255 - DEAD)
+    return speed if pwm > 0 else -speed
+
+
+def table_control(bot):
+    """Returns the feedback table line follow of line_follow driving bot, as
+    a function of the time giving the PWM values, or None if the line is lost
+    """
+    lr = LRDetector(SimLineSensor(bot), const.LR_T, 0)
+
+    def control(Ntime):
+        lr.update(Ntime)
+        if bot.reading == (0, 0, 0):
+            direction = {-1: "LEFT", 0: None, 1: "RIGHT"}[lr.get(Ntime)]
+            if direction == None:
+                return None
+            return const.MODES["TURN"][direction]
+        if bot.reading in const.FEEDBACK_TABLE:
+            mode, direction = const.FEEDBACK_TABLE[bot.reading]
+            return const.MODES[mode][direction]
+        return (bot.pwm_l, bot.pwm_r)
+    return control
+
+
+def pid_control(bot, gains=const.PID_GAINS, speeds=const.PID_SPEEDS):
+    """Returns the PID line follow of line_follow driving bot, as a function 
+    of the time giving the PWM values, or None if the line is lost
+    """
+    controller = LineController(0, gains, speeds)
+    lr = LRDetector(SimLineSensor(bot), const.LR_T, 0)
+    off_line = Filters(SimLineSensor(bot), const.INTER_T, 0)
+
+    def control(Ntime):
+        lr.update(Ntime)
+        if off_line.get(Ntime) == [0, 0, 0] and lr.get(Ntime) == 0:
+            return None
+        return controller.update(bot.reading, Ntime)
+    return control
+
+
+def commanded(make_control, driveSys):
+    """Returns make_control, with the PWM values of the controls it makes
+    also commanded of driveSys
+    """
+    def make(bot, **params):
+        control = make_control(bot, **params)
+
+        def command(Ntime):
+            pwms = control(Ntime)
+            if pwms != None:
+                driveSys.pwm(*pwms)
+            return pwms
+        return command
+    return make
+
+
+def drive(bot, control, length=2.0, timeout=20):
+    """Simulates bot following the tape length m along the course under a
+    control. Returns the time taken (None if the line was lost), the RMS
+    offset of the sensors from the tape, and the number of times the sensors
+    crossed the tape per meter.
+    """
+    now = 0
+    next_control = 0
+    squares = 0
+    steps = 0
+    crossings = 0
+    side = 0
+    while bot.x < length:
+        if now >= next_control:
+            pwms = control(now)
+            if pwms == None:
+                return (None, 0, 0)
+            bot.pwm(*pwms)
+            next_control += CONTROL_DT
+        bot.step(SIM_DT)
+        now += SIM_DT
+        offset = bot.offset()
+        if abs(offset) > LOST or now > timeout:
+            return (None, 0, 0)
+        squares += offset ** 2
+        steps += 1
+        if abs(offset) > TAPE / 4:
+            if side != 0 and (offset > 0) != (side > 0):
+                crossings += 1
+            side = offset
+    return (now, sqrt(squares / steps), crossings / length)
+
+
+def trial(make_control, seeds=5, **params):
+    """Drives each course from several starting offsets and angles under
+    controls made by make_control(bot, **params). Returns the mean time, RMS
+    offset and crossings per meter over the drives, and the number of drives
+    on which the line was lost.
+    """
+    times = []
+    rms = []
+    weaves = []
+    lost = 0
+    for course in COURSES.values():
+        for seed in range(seeds):
+            rand = Random(seed)
+            bot = SimBot(course, rand.uniform(-.006, .006),
+                         rand.uniform(-.1, .1), seed)
+            taken, error, crossings = drive(bot, make_control(bot, **params))
+            if taken == None:
+                lost += 1
+                continue
+            times.append(taken)
+            rms.append(error)
+            weaves.append(crossings)
+    if times == []:
+        return (None, None, None, lost)
+    return (sum(times) / len(times), sum(rms) / len(rms),
+            sum(weaves) / len(weaves), lost)
+
+
+def tune(seeds=5):
+    """Searches the PID gains and fastest speed for the fastest line follow
+    which never loses the line, printing the best found
+    """
+    best = None
+    for kp in [.3, .6, 1, 1.5, 2.5]:
+        for kd in [0, .01, .02, .04]:
+            for ki in [0, 1]:
+                for fast in [1, 1.1, 1.2, 1.27]:
+                    gains = (kp, ki, kd)
+                    speeds = (const.PID_SPEEDS[0], fast)
+                    taken, error, weaves, lost = trial(pid_control, seeds,
+                                                       gains=gains,
+                                                       speeds=speeds)
+                    if lost == 0 and (best == None or
+                                      (taken, error) < best[0:2]):
+                        best = (taken, error, gains, speeds)
+    if best == None:
+        print("No gains followed every course")
+        return None
+    print(f"Best gains {best[2]}, speeds {best[3]}: {best[0]:.2f} s, " +
+          f"{1000 * best[1]:.1f} mm RMS")
+    return best
+
+
+def approach(fast, predict, seed=0, block=BLOCK, heading=None, aware=True):
+    """Simulates bot following straight tape at the fastest speed fast toward
+    a block, stopping when the center ultrasound reads within the collision
+    distance, or if predict, when the CollisionPredictor says so (slowing as
+    it closes). Given the heading of the street driven, the bot stops on 
+    reaching the intersection at its end, and the predictor knows the street
+    if aware. Returns the time taken to stop, the gap left to the block, and
+    whether the intersection was reached.
+    """
+    bot = SimBot(COURSES["straight"], seed=seed)
+    ultraSense = SimUltrasound(bot, seed, block)
+    ultraSense.sample(0)
+    controller = LineController(0, const.PID_GAINS,
+                                (const.PID_SPEEDS[0], fast))
+    collide = CollisionPredictor(ultraSense, 0, heading if aware else None)
+    length = None
+    if heading != None:
+        length = const.STREET_LEN * (sqrt(2) if heading % 2 == 1 else 1)
+    arrived = False
+    now = 0
+    next_control = 0
+    while True:
+        ultraSense.sample(now)
+        if length != None and bot.x >= length:
+            arrived = True
+            break
+        if now >= next_control:
+            next_control += CONTROL_DT
+            collide.update(now)
+            if ultraSense.read()[1] <= OBJECT_COLLISION_DIST:
+                break
+            if predict and collide.stop(now):
+                break
+            scale = collide.scale(now) if predict else 1
+            PWM_L, PWM_R = controller.update(bot.reading, now)
+            bot.pwm(scale * PWM_L, scale * PWM_R)
+        bot.step(SIM_DT)
+        now += SIM_DT
+    stopped = now
+    bot.pwm(0, 0)
+    while bot.v_l + bot.v_r > .001:
+        bot.step(SIM_DT)
+    return (stopped, ultraSense.gap(), arrived)
+
+
+def bench_stop(seeds=10):
+    """Compares stopping before a block at a fixed distance and by predicted
+    time to contact, following the line at several top speeds. Then counts
+    the arrivals at the intersection ahead with a block just past it, which
+    the bot should reach and find blocking the street beyond, rather than 
+    stopping short and turning back.
+    """
+    print(f"Approaching a block {BLOCK} m ahead, {seeds} runs each " +
+          f"(collision distance {OBJECT_COLLISION_DIST} m)")
+    print("top speed  stop by        time (s)  mean gap (m)  min gap (m)  " +
+          "contacts")
+    for fast in [1, const.PID_SPEEDS[1]]:
+        for name, predict in [("fixed distance", False),
+                              ("time to contact", True)]:
+            runs = [approach(fast, predict, seed) for seed in range(seeds)]
+            gaps = [gap for taken, gap, arrived in runs]
+            taken = sum(run[0] for run in runs) / seeds
+            print(f"{fast:9.2f}  {name:15}{taken:8.2f}" +
+                  f"{sum(gaps) / seeds:14.3f}{min(gaps):13.3f}" +
+                  f"{sum(gap <= 0 for gap in gaps):10d}")
+    print(f"Driving a {const.STREET_LEN} m street, {seeds} runs each " +
+          "(arrivals at the intersection ahead)")
+    print("top speed  block past  fixed distance  time to contact  " +
+          "short of street end")
+    for fast in [1, const.PID_SPEEDS[1]]:
+        for past in PAST:
+            block = const.STREET_LEN + past
+            arrivals = []
+            for predict, aware in [(False, True), (True, False), (True, True)]:
+                runs = [approach(fast, predict, seed, block, 0, aware)
+                        for seed in range(seeds)]
+                arrivals.append(sum(run[2] for run in runs))
+            print(f"{fast:9.2f}{past:10.2f} m{arrivals[0]:12d}" +
+                  f"{arrivals[1]:17d}{arrivals[2]:21d}")
+
+
+def bench(seeds=5):
+    """Compares the feedback table line follow against the PID controller
+    over the simulated courses
+    """
+    start = time.perf_counter()
+    print(f"{len(COURSES)} courses of 2 m, {seeds} starts each")
+    print("controller       time (s)  RMS offset (mm)  crossings/m  lost")
+    for name, make_control in [("feedback table", table_control),
+                               ("PID", pid_control)]:
+        taken, error, weaves, lost = trial(make_control, seeds)
+        if taken == None:
+            print(f"{name:15}      -             -             -     {lost:4d}")
+            continue
+        print(f"{name:15}{taken:9.2f}{1000 * error:15.1f}{weaves:15.1f}" +
+              f"{lost:8d}")
+    print("controller       motor commands  pigpio writes  writes/command")
+    for name, make_control in [("feedback table", table_control),
+                               ("PID", pid_control)]:
+        driveSys = DriveSystem(CountingIO(), const.L_MOTOR_PINS,
+                               const.R_MOTOR_PINS, const.PWM_FREQ, None)
+        trial(commanded(make_control, driveSys), seeds)
+        writes = driveSys.left_motor.writes + driveSys.right_motor.writes
+        print(f"{name:15}{driveSys.commands:16d}{writes:15d}" +
+              f"{writes / driveSys.commands:16.3f}")
+    print("(every command made 4 writes before they were cached)")
+    print(f"Simulated in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    #Tune the PID controller or compare stopping before a block if asked, 
+    #otherwise compare the controllers
+    if sys.argv[1:2] == ["tune"]:
+        tune()
+    elif sys.argv[1:2] == ["stop"]:
+        bench_stop()
+    else:
+        bench()
@@ -0,0 +1,236 @@
+"""
+This module simulates several robots exploring one simulated tape map in a
+single process, to compare how long they take to map it when exploring
+independently, when sharing one map, and when sharing one map with the
+frontier allocated between them.
+
+Simulated robots follow the same exploration rules as auto_djik: follow the
+path planned to an unexplored intersection to its end (or until a different
+intersection is allocated to them), then scan the current intersection if it
+has unknown streets, drive any undriven street leaving it, and otherwise plan
+a path to the unexplored intersection allocated to them or chosen by a
+frontier scorer. Time is simulated
+with the planning time model: each scan takes SCAN_T, each street driven its
+street_time, and each turn onto a street its turn_time.
+
+Authors: Edward Speer, Garrett Knuf
+Date: 6/18/23
+"""
+
+import io
+import time
+from contextlib import redirect_stdout
+from heapq import heappush, heappop
+from constants import UNK, BLK, SCAN_T
+from mapping.MapGraph import MapGraph, Intersection
+from mapping.allocation import FrontierAllocator
+from mapping.frontier import FirstFound, InfoGain
+from mapping.planning import TimedDjikstra, turn_time, street_time
+from mapping.kernel import unx_dir
+from sim.world import World
+
+#Simulated seconds to wait before checking for work again when a robot has 
+#nothing to explore
+WAIT_T = 1.0
+
+#The exploration modes compared
+MODES = ["independent", "shared", "allocated"]
+
+
+class SimRobot:
+    """ A simulated robot exploring a World, building the map in graph.
+
+    Inputs: name - the robot's name in the allocation
+            world - the World explored
+            graph - the MapGraph the robot builds, shared or its own
+            location - the start location
+            allocator - the FrontierAllocator of the shared map, if any
+            scorer - the frontier scorer choosing unallocated targets
+    """
+
+    def __init__(self, name, world, graph, location, allocator=None,
+                 scorer=None):
+        self.name = name
+        self.world = world
+        self.graph = graph
+        self.location = location
+        self.heading = 0
+        self.allocator = allocator
+        self.scorer = scorer if scorer != None else FirstFound()
+        self.dest = None
+        self.path = []
+        self.driven = 0
+        if not graph.contains(location):
+            graph.add_intersection(Intersection(location))
+        if allocator != None:
+            allocator.move(name, location)
+
+    def step(self):
+        """Takes the robot's next exploration action. Returns the simulated
+        time the action took, or None if the robot had nothing to explore.
+        """
+        if self.allocator != None:
+            dest = self.allocator.target(self.name)
+            if dest != self.dest:
+                self.dest = dest
+                self.path = []
+        if self.path != []:
+            return self.drive(self.path.pop(0))
+
+        inters = self.graph.get_intersection(self.location)
+        if UNK in inters.get_streets().values():
+            for heading in range(8):
+                if inters.check_connection(heading) == UNK:
+                    inters.set_connection(heading,
+                                          self.world.street(self.location,
+                                                            heading))
+                if (self.world.blockage(self.location, heading) == BLK and
+                    inters.check_blockage(heading) != BLK):
+                    inters.set_blockage(heading, BLK, None)
+            return SCAN_T
+
+        heading = unx_dir(inters)
+        if heading != None:
+            return self.drive(heading)
+
+        dest = self.dest if self.allocator != None else None
+        if dest == None:
+            dest = self.scorer.choose(self.graph, self.location, self.heading)
+        if dest == None or dest == self.location:
+            return None
+        self.dest = dest
+        self.path = TimedDjikstra(self.graph, dest).gen_path(self.location,
+                                                             self.heading)
+        if self.path == []:
+            return None
+        return self.drive(self.path.pop(0))
+
+    def drive(self, heading):
+        """Drives the street leaving the robot's location on heading"""
+        nxt = self.world.follow(self.location, heading)
+        taken = (turn_time(self.heading, heading,
+                           self.graph.get_intersection(self.location)) +
+                 street_time(self.location, heading))
+        self.graph.driven_connection(self.location, nxt, heading)
+        self.location = nxt
+        self.heading = heading
+        self.driven += 1
+        if self.allocator != None:
+            self.allocator.move(self.name, nxt)
+        return taken
+
+
+def starts(world, num):
+    """Returns num start locations spread over the world"""
+    spots = [(0, 0), (world.width - 1, world.height - 1),
+             (0, world.height - 1), (world.width - 1, 0),
+             (world.width // 2, world.height // 2)]
+    return [spots[i % len(spots)] for i in range(num)]
+
+
+def run(world, locations, mode, scorer=None):
+    """Simulates robots starting at each location exploring the world in the
+    given mode, choosing targets with the given frontier scorer. Returns the
+    simulated time until every intersection they could reach was explored in
+    some robot's map (or until they all gave up), the number of streets
+    driven, and the fraction of the intersections they could reach which
+    were explored.
+    """
+    allocator = None
+    graph = MapGraph()
+    if mode == "allocated":
+        allocator = FrontierAllocator()
+        allocator.attach(graph)
+    robots = []
+    for i in range(len(locations)):
+        if mode == "independent":
+            graph = MapGraph()
+        robots.append(SimRobot(i, world, graph, locations[i], allocator,
+                               scorer))
+
+    remaining = world.reachable(locations)
+    reachable = len(remaining)
+    events = [(0.0, i) for i in range(len(robots))]
+    idle = set()
+    now = 0.0
+    while remaining != set() and len(idle) < len(robots):
+        now, i = heappop(events)
+        robot = robots[i]
+        before = robot.location
+        taken = robot.step()
+        if taken == None:
+            idle.add(i)
+            heappush(events, (now + WAIT_T, i))
+            continue
+        idle = set()
+        for location in [before, robot.location]:
+            if robot.graph.get_intersection(location).is_explored():
+                remaining.discard(location)
+        now += taken
+        heappush(events, (now, i))
+    return (now, sum(robot.driven for robot in robots),
+            1 - len(remaining) / reachable)
+
+
+def bench(size=12, robots=4, seeds=5):
+    """Compares the simulated time for 1 to robots robots to map size x size
+    worlds exploring independently, sharing one map, and sharing one map with
+    the frontier allocated, averaged over several random worlds
+    """
+    scorer = InfoGain()
+    start = time.perf_counter()
+    print(f"{size} x {size} worlds, average over {seeds} seeds " +
+          "(simulated seconds to map, streets driven, % mapped)")
+    print("robots " + "".join(f"{mode:>28}" for mode in MODES))
+    single = None
+    for num in range(1, robots + 1):
+        row = f"{num:6d} "
+        for mode in MODES:
+            total = 0
+            driven = 0
+            mapped = 0
+            for seed in range(seeds):
+                world = World(size, size, seed=seed)
+                #Keep find_unexplored from printing every target
+                with redirect_stdout(io.StringIO()):
+                    taken, streets, done = run(world, starts(world, num), mode,
+                                               scorer)
+                total += taken / seeds
+                driven += streets / seeds
+                mapped += 100 * done / seeds
+            if single == None:
+                single = total
+            row += (f"{total:9.0f} s ({single / total:3.1f}x) {driven:5.0f} " +
+                    f"{mapped:3.0f}%")
+        print(row)
+    print(f"Simulated in {time.perf_counter() - start:.1f} s")
+
+
+def bench_frontier(sizes=(8, 16, 24), seeds=5):
+    """Compares the simulated time for one robot to map worlds of each size
+    choosing targets by find_unexplored's first hit and by information gain
+    """
+    scorers = {"first found": FirstFound(), "information gain": InfoGain()}
+    print(f"One robot, average over {seeds} seeds " +
+          "(simulated seconds to map, streets driven, % mapped)")
+    print("size " + "".join(f"{name:>24}" for name in scorers))
+    for size in sizes:
+        row = f"{size:4d} "
+        for scorer in scorers.values():
+            total = 0
+            driven = 0
+            mapped = 0
+            for seed in range(seeds):
+                world = World(size, size, seed=seed)
+                with redirect_stdout(io.StringIO()):
+                    taken, streets, done = run(world, [(0, 0)],
+                                               "independent", scorer)
+                total += taken / seeds
+                driven += streets / seeds
+                mapped += 100 * done / seeds
+            row += f"{total:12.0f} s {driven:5.0f} {mapped:3.0f}%"
+        print(row)
+
+
+if __name__ == "__main__":
+    bench()
@@ -0,0 +1,75 @@
+"""
+This module compares the routes planned over fully mapped simulated worlds by
+counting streets (Djikstra) and by estimating the time to turn and drive them
+(TimedDjikstra), timing both with the planning time model.
+
+Authors: Edward Speer, Garrett Knuf
+Date: 6/19/23
+"""
+
+import time
+from random import Random
+from constants import NNE, BLK
+from mapping.MapGraph import MapGraph, Intersection
+from mapping.planning import Djikstra, TimedDjikstra, path_time
+from sim.world import World
+
+
+def known_map(world):
+    """Returns a MapGraph of the whole world, as if every street were driven"""
+    graph = MapGraph()
+    for x in range(world.width):
+        for y in range(world.height):
+            graph.add_intersection(Intersection((x, y)))
+    for x in range(world.width):
+        for y in range(world.height):
+            for heading in range(8):
+                if world.street((x, y), heading) == NNE:
+                    graph.no_connection((x, y), heading)
+                    continue
+                graph.driven_connection((x, y), world.follow((x, y), heading),
+                                        heading)
+                if world.blockage((x, y), heading) == BLK:
+                    graph.get_intersection((x, y)).set_blockage(heading, BLK,
+                                                                None)
+    return graph
+
+
+def bench(size=12, routes=200, seeds=5, diagonal=.2):
+    """Compares the estimated time of the routes planned between random
+    locations of size x size worlds (with diagonal streets) by street count and
+    by time, starting out on a random heading
+    """
+    planners = {"fewest streets": Djikstra, "fastest": TimedDjikstra}
+    seconds = {name: 0 for name in planners}
+    streets = {name: 0 for name in planners}
+    planning = {name: 0 for name in planners}
+    count = 0
+    for seed in range(seeds):
+        world = World(size, size, seed=seed, diagonal=diagonal)
+        graph = known_map(world)
+        rand = Random(seed)
+        for i in range(routes):
+            start = (rand.randrange(size), rand.randrange(size))
+            goal = (rand.randrange(size), rand.randrange(size))
+            heading = rand.randrange(8)
+            if start == goal or goal not in world.reachable([start]):
+                continue
+            count += 1
+            for name, planner in planners.items():
+                began = time.perf_counter()
+                path = planner(graph, goal).gen_path(start, heading)
+                planning[name] += time.perf_counter() - began
+                seconds[name] += path_time(graph, start, heading, path)
+                streets[name] += len(path)
+    print(f"{count} routes over {size} x {size} worlds, {seeds} seeds")
+    for name in planners:
+        print(f"{name:>15}: {seconds[name] / count:6.1f} s/route " +
+              f"{streets[name] / count:5.1f} streets/route " +
+              f"{1000 * planning[name] / count:6.2f} ms planning/route")
+    print(f"Fastest routes save " +
+          f"{100 * (1 - seconds['fastest'] / seconds['fewest streets']):.1f}%")
+
+
+if __name__ == "__main__":
+    bench()
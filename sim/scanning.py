@@ -0,0 +1,106 @@
+"""
+This module compares the time to scan intersections of simulated worlds
+sweeping them half a turn at a time, always left first (as auto_inters used
+to), against turning as pln.scan_plan plans, counting the turn onto the
+street driven next. Turns are timed with the planning time model.
+
+Authors: Edward Speer, Garrett Knuf
+Date: 6/19/23
+"""
+
+from random import Random
+from constants import UNK, UND, NNE, DRV, TURN_T, TURN_STOP_T
+from mapping.MapGraph import Intersection
+from mapping.planning import spin, depart_time, scan_plan, scan_time
+from sim.world import World
+
+
+def arrival(world, location, heading, mapped, rand):
+    """Returns the Intersection at location as the robot knows it on arriving
+    facing heading: the street driven and the street ahead are known, as are
+    the streets to each neighbor mapped (each with chance mapped), and there
+    are no streets next to a known street
+    """
+    inters = Intersection(location, heading)
+    inters.set_connection(heading, world.street(location, heading))
+    for head in range(8):
+        if rand.random() < mapped and inters.check_connection(head) == UNK:
+            inters.set_connection(head, world.street(location, head))
+    for head in range(8):
+        if inters.check_connection(head) in [UND, DRV]:
+            for side in [1, -1]:
+                if inters.check_connection((head + side) % 8) == UNK:
+                    inters.set_connection((head + side) % 8, NNE)
+    return inters
+
+
+def sweep_time(inters, heading, layout, step_t):
+    """Returns the time to scan an intersection the way auto_inters used to:
+    sweeping half a turn left while any heading from ahead to the left is
+    unknown, otherwise right while any from ahead to the right is, until the
+    rest of the sweep is known; then turning to the heading unx_dir leaves on
+    """
+    streets = set(layout)
+    known = set()
+    for head in range(8):
+        if inters.check_connection(head) in [UND, DRV]:
+            streets.add(head)
+        if inters.check_connection(head) != UNK:
+            known.add(head)
+    seconds = 0
+    while True:
+        if [head for head in range(4) if (heading + head) % 8 not in known]:
+            direction, sign = ("LEFT", 1)
+        elif [head for head in range(4) if (heading - head) % 8 not in known]:
+            direction, sign = ("RIGHT", -1)
+        else:
+            break
+        orig = heading
+        while heading != (orig + 4 * sign) % 8:
+            turned = (sign * (heading - orig)) % 8
+            if {(orig + sign * i) % 8 for i in range(turned + 1, 5)} <= known:
+                break
+            nxt, steps = spin(streets, heading, sign)
+            known |= {(heading + sign * i) % 8 for i in range(1, steps + 1)}
+            seconds += steps * step_t[direction] + TURN_STOP_T
+            heading = nxt
+    undriven = [head for head in streets if inters.check_connection(head) != DRV]
+    return seconds + depart_time(streets, heading, min(undriven, default=None),
+                                 step_t)
+
+
+def bench(size=12, seeds=5, mapped=(0, .3), diagonal=.2):
+    """Compares the time to scan every intersection of size x size worlds
+    (with diagonal streets) arriving on each street into it, when none and
+    when some of the streets to its neighbors are already mapped
+    """
+    step_t = {"LEFT": TURN_T, "RIGHT": TURN_T}
+    print(f"{size} x {size} worlds, average over {seeds} seeds " +
+          "(seconds to scan an intersection and face the next street)")
+    print("mapped  arrivals     sweep   planned   saved")
+    for part in mapped:
+        arrivals = 0
+        sweep = 0
+        planned = 0
+        for seed in range(seeds):
+            rand = Random(seed)
+            world = World(size, size, seed=seed, diagonal=diagonal)
+            for location, back in sorted(world.streets):
+                heading = (back + 4) % 8
+                inters = arrival(world, location, heading, part, rand)
+                layout = [head for head in range(8)
+                          if inters.check_connection(head) == UNK and
+                          world.street(location, head) == UND]
+                if UNK not in inters.get_streets().values():
+                    continue
+                arrivals += 1
+                sweep += sweep_time(inters, heading, layout, step_t)
+                plan = scan_plan(inters, heading)
+                planned += scan_time(inters, heading, plan, layout, None,
+                                     step_t)
+        print(f"{100 * part:5.0f}% {arrivals:9d} {sweep / arrivals:8.2f} s " +
+              f"{planned / arrivals:6.2f} s {100 * (1 - planned / sweep):6.1f}%")
+
+
+if __name__ == "__main__":
+    bench()
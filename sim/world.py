@@ -0,0 +1,165 @@
+"""
+This module generates simulated tape maps for the robot simulator: grids of
+intersections joined by streets on the four straight headings (and
+optionally some diagonal ones), with some streets missing and some blocked,
+which simulated robots explore in place of the tape floor.
+
+Authors: Edward Speer, Garrett Knuf
+Date: 6/18/23
+"""
+
+from random import Random
+from constants import heading_map, UND, NNE, BLK, UNB
+
+
+class World:
+    """ The true layout of a simulated tape map. Every intersection of a
+    width x height grid is reachable from every other over the streets, before
+    blockages are placed.
+
+    Inputs: width, height - the size of the grid of intersections
+            missing - the fraction of the streets of the full grid removed
+            blocked - the fraction of the remaining streets blocked
+            seed - the seed of the random layout
+            diagonal - the chance of a diagonal street where one fits, that 
+                       is where it would neither cross another diagonal nor 
+                       leave next to a street at either end
+    """
+
+    def __init__(self, width, height, missing=.3, blocked=.05, seed=129,
+                 diagonal=0):
+        rand = Random(seed)
+        self.width = width
+        self.height = height
+        self.streets = set()
+        self.blocked = set()
+        locations = [(x, y) for x in range(width) for y in range(height)]
+
+        #Place the diagonal streets first, each square of four intersections
+        #having one with the given chance where it fits
+        for location in locations:
+            if diagonal == 0:
+                break
+            heading = rand.choice([1, 7])
+            if rand.random() < diagonal and self.fits(location, heading):
+                self.add(location, heading)
+                if rand.random() < blocked:
+                    self.block(location, heading)
+
+        #Keep a random spanning tree of the grid so the map stays connected,
+        #then keep each other street unless it is missing. Streets next to a
+        #diagonal street are left out, as the diagonal street connects their
+        #ends instead.
+        streets = []
+        for x, y in locations:
+            for heading in [0, 6]:
+                nxt = (x + heading_map[heading][0], y + heading_map[heading][1])
+                if nxt[0] < width and nxt[1] < height:
+                    streets.append(((x, y), heading, nxt))
+        rand.shuffle(streets)
+        parent = {location: location for location in locations}
+        def find(location):
+            while parent[location] != location:
+                parent[location] = parent[parent[location]]
+                location = parent[location]
+            return location
+        for location, heading in list(self.streets):
+            parent[find(location)] = find(self.follow(location, heading))
+        for location, heading, nxt in streets:
+            if not self.fits(location, heading):
+                continue
+            if find(location) != find(nxt):
+                parent[find(location)] = find(nxt)
+                self.add(location, heading)
+            elif rand.random() >= missing:
+                self.add(location, heading)
+            if rand.random() < blocked and (location, heading) in self.streets:
+                self.block(location, heading)
+        self.connect(streets)
+
+    def connect(self, streets):
+        """Adds the candidate streets needed to connect the map, in order, 
+        removing any diagonal streets which they would leave next to
+        """
+        joined = False
+        while not joined:
+            parent = {}
+            def find(location):
+                while parent.get(location, location) != location:
+                    location = parent[location]
+                return location
+            for location, heading in self.streets:
+                parent[find(location)] = find(self.follow(location, heading))
+            joined = True
+            for location, heading, nxt in streets:
+                if find(location) != find(nxt):
+                    for end, out in [(location, heading), 
+                                     (nxt, (heading + 4) % 8)]:
+                        for side in [1, -1]:
+                            self.remove(end, (out + side) % 8)
+                    self.add(location, heading)
+                    parent[find(location)] = find(nxt)
+                    joined = False
+
+    def add(self, location, heading):
+        """Adds the street leaving location on heading, from both ends"""
+        self.streets.add((location, heading))
+        self.streets.add((self.follow(location, heading), (heading + 4) % 8))
+
+    def remove(self, location, heading):
+        """Removes the street leaving location on heading, if any"""
+        nxt = self.follow(location, heading)
+        for street in [(location, heading), (nxt, (heading + 4) % 8)]:
+            self.streets.discard(street)
+            self.blocked.discard(street)
+
+    def block(self, location, heading):
+        """Blocks the street leaving location on heading, from both ends"""
+        self.blocked.add((location, heading))
+        self.blocked.add((self.follow(location, heading), (heading + 4) % 8))
+
+    def fits(self, location, heading):
+        """Returns whether a street leaving location on heading fits into the 
+        map, neither leaving next to another street at either end nor 
+        crossing another diagonal street
+        """
+        nxt = self.follow(location, heading)
+        if not (0 <= nxt[0] < self.width and 0 <= nxt[1] < self.height):
+            return False
+        for end, out in [(location, heading), (nxt, (heading + 4) % 8)]:
+            for side in [1, -1]:
+                if (end, (out + side) % 8) in self.streets:
+                    return False
+        #The crossing diagonal leaves the neighbor in the same row
+        crossing = ((nxt[0], location[1]), 8 - heading)
+        return heading % 2 == 0 or crossing not in self.streets
+
+    def follow(self, location, heading):
+        """Returns the location reached by driving a street"""
+        return (location[0] + heading_map[heading][0],
+                location[1] + heading_map[heading][1])
+
+    def street(self, location, heading):
+        """Returns the label a robot scanning location would give heading"""
+        return UND if (location, heading) in self.streets else NNE
+
+    def blockage(self, location, heading):
+        """Returns whether the street on heading is seen blocked"""
+        return BLK if (location, heading) in self.blocked else UNB
+
+    def reachable(self, starts):
+        """Returns the set of locations reachable without driving a blocked
+        street from any of the start locations
+        """
+        seen = set(starts)
+        stack = list(starts)
+        while stack != []:
+            location = stack.pop()
+            for heading in range(8):
+                if ((location, heading) in self.streets and
+                    (location, heading) not in self.blocked):
+                    nxt = self.follow(location, heading)
+                    if nxt not in seen:
+                        seen.add(nxt)
+                        stack.append(nxt)
+        return seen
@@ -11,6 +11,19 @@ import sys
 from sensing.proximitysensor import test
 from driving.driveSystem import test_flower
 from sensing.linesensor import test_ls
+from mapping.journal import bench as bench_journal
+from mapping.mapfile import bench as bench_mapfile
+from mapping.tiles import bench as bench_tiles
+from ros import bench as bench_ros
+from sim.multirobot import bench as bench_multirobot, bench_frontier
+from sim.routing import bench as bench_routing
+from mapping.speculation import bench as bench_speculation
+from sim.linefollow import bench as bench_linefollow, bench_stop
+from mapping.streetprior import bench as bench_streetprior
+from sim.scanning import bench as bench_scanning
+from mapping.kernel import bench as bench_kernel
+from mapping.spatial import check as check_spatial
+from driving.turnrate import bench as bench_turnrate
 
 if __name__ == "__main__":
     #Based on the argument passed on the command line, test the hardware
@@ -18,9 +31,39 @@ if __name__ == "__main__":
     print(mode)
     if mode == 'Motors':
         test_flower()
-    if mode == 'IRSensors':
+    elif mode == 'IRSensors':
         test_ls()
-    if mode == 'Ultrasounds':
+    elif mode == 'Ultrasounds':
         test()
+    elif mode == 'Journal':
+        bench_journal()
+    elif mode == 'MapFile':
+        bench_mapfile()
+    elif mode == 'Tiles':
+        bench_tiles()
+    elif mode == 'ROS':
+        bench_ros()
+    elif mode == 'MultiRobot':
+        bench_multirobot()
+    elif mode == 'Frontier':
+        bench_frontier()
+    elif mode == 'Routing':
+        bench_routing()
+    elif mode == 'Speculation':
+        bench_speculation()
+    elif mode == 'LineFollow':
+        bench_linefollow()
+    elif mode == 'Collision':
+        bench_stop()
+    elif mode == 'StreetPrior':
+        bench_streetprior()
+    elif mode == 'Scan':
+        bench_scanning()
+    elif mode == 'Kernel':
+        bench_kernel()
+    elif mode == 'Spatial':
+        check_spatial()
+    elif mode == 'TurnRates':
+        bench_turnrate()
     else:
         print("Invalid hardware specified")
\ No newline at end of file